@@ -10,6 +10,110 @@ let renderer;
 let controls;
 let currentSceneObject = null;
 
+// --- Live link to the Python renderer (python main.py --broadcast) ---
+// Only used when asked for, with ?live or ?live=ws://host:port
+const RENDERER_URL = 'ws://127.0.0.1:8765';
+const RENDERER_SCENES = {
+    'living': 'living',
+    'energy_field': 'energy',
+    'blue_giants': 'blue-giants',
+    'life': 'life',
+    'particles': 'particles',
+    'orbits': 'orbits'
+};
+
+// Latest state received from the renderer
+const rendererState = {
+    connected: false,
+    scene: null,
+    params: {},
+    bands: new Float32Array(16),
+    energy: 0.0,
+    level: 0.0,
+    onset: 0.0,
+    envelope: 0.0,
+    clock: 0.0
+};
+
+function rendererLinkUrl() {
+    const live = new URLSearchParams(window.location.search).get('live');
+    if (live === null) {
+        return null;
+    }
+    return live.startsWith('ws') ? live : RENDERER_URL;
+}
+
+// Each binary packet: 28 byte header, then changed parameters as (uint8 index, float32 value), then bands as uint8
+function applyRendererPacket(buffer, names, scenes) {
+    const view = new DataView(buffer);
+    if (view.getUint8(0) !== 0x4D || view.getUint8(1) !== 0x56) {
+        return; // not 'MV'
+    }
+    rendererState.clock = view.getFloat32(8, true);
+    rendererState.level = view.getFloat32(12, true);
+    rendererState.onset = view.getFloat32(16, true);
+    rendererState.envelope = view.getFloat32(20, true);
+    const sceneIndex = view.getUint8(24);
+    const changes = view.getUint8(25);
+    const bandCount = view.getUint8(26);
+    let offset = 28;
+    for (let i = 0; i < changes; i++, offset += 5) {
+        rendererState.params[names[view.getUint8(offset)]] = view.getFloat32(offset + 1, true);
+    }
+    let energy = 0.0;
+    for (let i = 0; i < bandCount; i++) {
+        rendererState.bands[i] = view.getUint8(offset + i) / 255;
+        energy += rendererState.bands[i];
+    }
+    rendererState.energy = bandCount ? energy / bandCount : 0.0;
+
+    const scene = scenes[sceneIndex];
+    if (scene !== rendererState.scene) {
+        rendererState.scene = scene;
+        const theme = RENDERER_SCENES[scene];
+        if (theme && sectionThemes[theme]) {
+            setScene(sectionThemes[theme]);
+        }
+    }
+}
+
+function connectRenderer(url) {
+    let names = [];
+    let scenes = [];
+    let retry = 1000;
+    const open = () => {
+        const socket = new WebSocket(url);
+        socket.binaryType = 'arraybuffer';
+        socket.onopen = () => {
+            rendererState.connected = true;
+            retry = 1000;
+            console.log('Connected to renderer at', url);
+        };
+        socket.onmessage = (event) => {
+            if (typeof event.data === 'string') {
+                // Sent once on connect: parameter names and scenes, by index
+                const hello = JSON.parse(event.data);
+                names = hello.params;
+                scenes = hello.scenes;
+                rendererState.bands = new Float32Array(hello.bands);
+                rendererState.scene = null;
+                return;
+            }
+            applyRendererPacket(event.data, names, scenes);
+            // Acknowledge it with its frame number; the renderer holds back packets until we do
+            const ack = new DataView(new ArrayBuffer(4));
+            ack.setUint32(0, new DataView(event.data).getUint32(4, true), true);
+            socket.send(ack.buffer);
+        };
+        socket.onclose = () => {
+            rendererState.connected = false;
+            setTimeout(open, retry);
+            retry = Math.min(retry * 2, 10000);
+        };
+    };
+    open();
+}
+
 // Handle loading screen
 document.addEventListener('DOMContentLoaded', () => {
     console.log('DOM Content Loaded - Initializing Macroverse');
@@ -120,6 +224,7 @@ function initializeThreeJS() {
             uniform float u_zoom;
             uniform float u_brightness;
             uniform vec3 u_color;
+            uniform float u_audio;
             
             varying vec2 vUv;
             
@@ -135,7 +240,7 @@ function initializeThreeJS() {
                 energy = pow(energy, 2.0);
                 
                 float pulse = sin(u_time * 4.0) * 0.3 + 0.7;
-                energy *= pulse;
+                energy *= pulse * (1.0 + u_audio);
                 
                 vec3 color = u_color * energy * u_brightness;
                 color += vec3(0.1, 0.3, 0.7) * energy * 0.5;
@@ -152,7 +257,8 @@ function initializeThreeJS() {
                 u_time: { value: 0.0 },
                 u_zoom: { value: 1.0 },
                 u_brightness: { value: 1.2 },
-                u_color: { value: new THREE.Vector3(0.2, 0.6, 1.0) }
+                u_color: { value: new THREE.Vector3(0.2, 0.6, 1.0) },
+                u_audio: { value: 0.0 }
             },
             transparent: true,
             blending: THREE.AdditiveBlending
@@ -232,6 +338,19 @@ function initializeThreeJS() {
             
             // Update shader uniforms
             shaderMaterial.uniforms.u_time.value = performance.now() * 0.001;
+            if (rendererState.connected) {
+                // Follow the Python renderer's colour, brightness and audio
+                const params = rendererState.params;
+                if (params.color_r !== undefined) {
+                    shaderMaterial.uniforms.u_color.value.set(params.color_r, params.color_g, params.color_b);
+                    shaderMaterial.uniforms.u_brightness.value = 1.2 * params.brightness;
+                }
+                shaderMaterial.uniforms.u_audio.value = rendererState.energy;
+                particleMaterial.size = 2 + rendererState.onset * 2;
+            } else {
+                shaderMaterial.uniforms.u_audio.value = 0.0;
+                particleMaterial.size = 2;
+            }
             
             // Update particles (less frequently on mobile)
             frameCount++;
@@ -1312,6 +1431,11 @@ function showStory(sectionId) {
 function initializeApp() {
     // Initial scene
     setScene(sectionThemes['energy']);
+
+    const rendererUrl = rendererLinkUrl();
+    if (rendererUrl && 'WebSocket' in window) {
+        connectRenderer(rendererUrl);
+    }
     
     // Initialize navigation after DOM is loaded
     setTimeout(() => {
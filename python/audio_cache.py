@@ -0,0 +1,226 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from audio_features import N_BANDS, AudioFeatures
+from audio_processing import AudioProcessor, AudioSnapshot, WavFileSource
+
+CACHE_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'audio_cache'))
+# Bump when the analysis changes, so old tables are not used for new results
+ANALYSIS_VERSION = 1
+# The content hash last worked out for each file, by path, size and modification time
+HASH_INDEX = 'hashes.json'
+
+
+def wav_info(path):
+    """(rate, frames) of a WAV file"""
+    source = WavFileSource(path, loop=False)
+    source.close()
+    return source.rate, source.frames
+
+
+def file_key(path):
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+def _load_index(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, HASH_INDEX)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def known_hash(path, cache_dir=CACHE_DIR):
+    """The hash file_hash() remembered for `path`, or None if it has not seen the file as it is now"""
+    return _load_index(cache_dir).get(file_key(path))
+
+
+def file_hash(path, cache_dir=None):
+    """SHA-1 of the file's contents, remembered in `cache_dir` so known_hash() can skip reading it again"""
+    key = file_key(path)
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    digest = digest.hexdigest()
+    if cache_dir:
+        index = _load_index(cache_dir)
+        index[key] = digest
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = os.path.join(cache_dir, f"{HASH_INDEX}.{os.getpid()}.tmp")
+            with open(tmp, 'w') as f:
+                json.dump(index, f, indent=1)
+            os.replace(tmp, os.path.join(cache_dir, HASH_INDEX))
+        except OSError as e:
+            logging.warning(f"Could not remember the hash of {path}: {e}")
+    return digest
+
+
+def settings_hash(rate, chunk_size, hop_size, n_bands=N_BANDS):
+    features = AudioFeatures(chunk_size, rate, n_bands)
+    settings = (ANALYSIS_VERSION, rate, chunk_size, hop_size, n_bands, features.attack, features.release,
+                features.onset_sensitivity, features.onset_decay)
+    return hashlib.sha1(repr(settings).encode('ascii')).hexdigest()
+
+
+def cache_path(path, chunk_size=1024, hop_size=None, cache_dir=CACHE_DIR, digest=None):
+    """Where the feature table of the WAV file at `path` is kept for these analysis settings"""
+    rate = wav_info(path)[0]
+    hop_size = hop_size or chunk_size // 2
+    stem = os.path.splitext(os.path.basename(path))[0]
+    digest = digest or known_hash(path, cache_dir) or file_hash(path, cache_dir)
+    return os.path.join(cache_dir, f"{stem}-{digest[:16]}-{settings_hash(rate, chunk_size, hop_size)[:8]}.npy")
+
+
+def table_dtype(n_features):
+    # The level stays double precision, as AudioProcessor computes it
+    return np.dtype([('level', 'f8'), ('features', 'f4', n_features)])
+
+
+def analyze(path, chunk_size=1024, hop_size=None):
+    """
+    Run the analysis over a whole WAV file, hop by hop as AudioProcessor
+    does offline. Returns a table with one row per hop: the level, and the
+    band energies followed by the scalar features.
+    """
+    processor = AudioProcessor(chunk_size=chunk_size, hop_size=hop_size, source=WavFileSource(path, loop=False))
+    # Carry on past the end until the last samples have left the analysis window
+    hops = -(-(processor.source.frames + chunk_size) // processor.hop_size)
+    table = np.zeros(hops, dtype=table_dtype(len(processor.features.values)))
+    for row in table:
+        snapshot = processor.analyze_next()
+        row['level'] = snapshot.level
+        row['features'] = snapshot.features
+    processor.stop()
+    return table
+
+
+def build(path, chunk_size=1024, hop_size=None, cache_dir=CACHE_DIR, force=False):
+    """Analyze `path` into the cache unless it is already there. Returns the table's path."""
+    table_path = cache_path(path, chunk_size, hop_size, cache_dir)
+    if force or not os.path.exists(table_path):
+        os.makedirs(cache_dir, exist_ok=True)
+        table = analyze(path, chunk_size, hop_size)
+        tmp = table_path + '.tmp.npy'
+        np.save(tmp, table)
+        os.replace(tmp, table_path)
+    return table_path
+
+
+class CachedAnalysis:
+    """
+    Audio features looked up in a pre-analyzed table instead of computed:
+    the snapshot for any time is one row, found by index, so seeking is
+    instant and playback costs no FFTs. Stands in for an AudioProcessor;
+    within the track advance_to() returns exactly what
+    AudioProcessor.advance_to() would, after it the last hop is held.
+    After start(), get_snapshot() follows the wall clock like live analysis,
+    from the beginning of the track and looping if `loop`.
+    """
+
+    def __init__(self, table_path, rate, frames, chunk_size=1024, hop_size=None, loop=False):
+        self.table = np.load(table_path, mmap_mode='r')
+        self.path = table_path
+        self.rate = rate
+        self.frames = frames
+        self.chunk_size = chunk_size
+        self.hop_size = hop_size or chunk_size // 2
+        self.loop = loop
+        self.features = AudioFeatures(chunk_size, rate)
+        self._snapshots = [AudioSnapshot(chunk_size, self.features.n_bands) for _ in range(3)]
+        self._latest = self._snapshots[0]
+        self._started = None
+
+    @property
+    def duration(self):
+        return self.frames / self.rate
+
+    def advance_to(self, seconds):
+        """The snapshot of the last hop that ends by `seconds`"""
+        samples = int(seconds * self.rate)
+        if self.loop and self.frames:
+            samples %= self.frames
+        hops = min(samples // self.hop_size, len(self.table))
+        if hops != self._latest.seq:
+            snapshot = self._snapshots[hops % 3]
+            if hops:
+                row = self.table[hops - 1]
+                snapshot.level = float(row['level'])
+                snapshot.features[:] = row['features']
+            else:
+                snapshot.level = 0.0
+                snapshot.features[:] = 0.0
+            snapshot.sample_index = hops * self.hop_size
+            snapshot.seq = hops
+            self._latest = snapshot
+        return self._latest
+
+    def start(self, seconds=0.0):
+        """Follow the wall clock from `seconds` into the track"""
+        self._started = time.perf_counter() - seconds
+
+    def get_snapshot(self):
+        if self._started is None:
+            return self._latest
+        return self.advance_to(time.perf_counter() - self._started)
+
+    def get_level(self):
+        return self.get_snapshot().level
+
+    def stop(self):
+        self.table = None
+
+
+def open_cached(spec, chunk_size=1024, hop_size=None, loop=False, build_missing=False, cache_dir=CACHE_DIR,
+                read_file=True):
+    """
+    A CachedAnalysis of the WAV file `spec`, building its table first if
+    `build_missing`, or None if there is no table or `spec` is not a file.
+    Without `read_file` it only looks for the table if the file's hash is
+    already known, so it never reads the whole file; else it returns None.
+    """
+    if spec in (None, '', 'synthetic', 'live'):
+        return None
+    try:
+        rate, frames = wav_info(spec)
+        digest = known_hash(spec, cache_dir)
+        if digest is None and not read_file:
+            return None
+        if build_missing:
+            table_path = build(spec, chunk_size, hop_size, cache_dir)
+        else:
+            table_path = cache_path(spec, chunk_size, hop_size, cache_dir, digest)
+            if not os.path.exists(table_path):
+                return None
+        return CachedAnalysis(table_path, rate, frames, chunk_size, hop_size, loop=loop)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Audio feature cache unavailable for {spec}: {e}")
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze audio files once into feature tables for instant playback and seeking")
+    parser.add_argument('files', nargs='+', help="WAV files")
+    parser.add_argument('--chunk-size', type=int, default=1024)
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--force', action='store_true', help="Analyze again even if a table exists")
+    args = parser.parse_args(argv)
+
+    for path in args.files:
+        start = time.perf_counter()
+        table_path = build(path, args.chunk_size, cache_dir=args.cache_dir, force=args.force)
+        elapsed = time.perf_counter() - start
+        table = np.load(table_path, mmap_mode='r')
+        print(f"{path}: {len(table)} hops, {os.path.getsize(table_path) / 1e6:.1f} MB in {elapsed:.2f} s -> {table_path}")
+
+
+if __name__ == '__main__':
+    main()
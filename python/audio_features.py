@@ -0,0 +1,113 @@
+import moderngl
+import numpy as np
+
+N_BANDS = 16
+
+# Scalar features, in the order they follow the bands in AudioFeatures.values
+FEATURE_NAMES = ('rms', 'flux', 'onset', 'envelope')
+FEATURE_UNIFORMS = tuple(f'u_{name}' for name in FEATURE_NAMES)
+
+
+class AudioFeatures:
+    """
+    Band energies, RMS, spectral flux/onset and a smoothed envelope for one
+    analysis hop. Everything is computed with a fixed number of NumPy calls
+    into preallocated arrays, independent of the spectrum size.
+    """
+
+    def __init__(self, chunk_size, rate, n_bands=N_BANDS, fmin=40.0, fmax=16000.0,
+                 attack=0.6, release=0.08, onset_sensitivity=2.0, onset_decay=0.85):
+        self.n_bands = n_bands
+        self.attack = attack
+        self.release = release
+        self.onset_sensitivity = onset_sensitivity
+        self.onset_decay = onset_decay
+
+        # Log-spaced band edges as rfft bin indices; every band gets at least one bin
+        n_bins = chunk_size // 2 + 1
+        fmax = min(fmax, rate / 2)
+        edges = np.geomspace(fmin, fmax, n_bands + 1) * chunk_size / rate
+        starts = np.zeros(n_bands, dtype=np.intp)
+        prev = 0
+        for i in range(n_bands):
+            prev = max(int(edges[i]), prev + 1 if i else 1)
+            starts[i] = prev
+        self._starts = starts
+        self._end = min(max(int(edges[-1]) + 1, starts[-1] + 1), n_bins)
+        self._counts = np.diff(np.append(starts, self._end)).astype(np.float32)
+        # Magnitudes arrive scaled so a full-scale sine peaks near chunk_size / 2
+        self._norm = 2.0 / chunk_size
+
+        self.values = np.zeros(n_bands + len(FEATURE_NAMES), dtype=np.float32)
+        self.bands = self.values[:n_bands]
+        self._power = np.zeros(n_bins, dtype=np.float32)
+        self._prev_bands = np.zeros(n_bands, dtype=np.float32)
+        self._diff = np.zeros(n_bands, dtype=np.float32)
+        self._flux_mean = 0.0
+        self._flux_var = 0.0
+        self._onset = 0.0
+        self._envelope = 0.0
+
+    def update(self, samples, magnitude, out=None):
+        """Compute features for one hop into out (defaults to self.values)"""
+        out = self.values if out is None else out
+        bands = out[:self.n_bands]
+
+        power = self._power
+        np.multiply(magnitude, self._norm, out=power)
+        np.square(power, out=power)
+        np.add.reduceat(power[:self._end], self._starts, out=bands)
+        bands /= self._counts
+        np.sqrt(bands, out=bands)
+        # Compress into roughly 0..1 for the shaders
+        bands *= 20.0
+        np.log1p(bands, out=bands)
+        bands *= 1.0 / np.log1p(20.0)
+
+        rms = float(np.sqrt(np.dot(samples, samples) / len(samples)))
+
+        np.subtract(bands, self._prev_bands, out=self._diff)
+        np.maximum(self._diff, 0.0, out=self._diff)
+        flux = float(self._diff.sum())
+        self._prev_bands[:] = bands
+
+        # Adaptive threshold: running mean/variance of the flux
+        deviation = flux - self._flux_mean
+        self._flux_mean += 0.1 * deviation
+        self._flux_var = 0.9 * (self._flux_var + 0.1 * deviation * deviation)
+        threshold = self._flux_mean + self.onset_sensitivity * self._flux_var ** 0.5
+        if flux > threshold and flux > 0.05:
+            self._onset = 1.0
+        else:
+            self._onset *= self.onset_decay
+
+        coeff = self.attack if rms > self._envelope else self.release
+        self._envelope += (rms - self._envelope) * coeff
+
+        out[self.n_bands:] = (rms, flux, self._onset, self._envelope)
+        return out
+
+
+class AudioTexture:
+    """
+    The band energies as an N x 1 float texture (`u_spectrum` in the shaders).
+    Allocated once; each new analysis hop is written into it in place.
+    """
+
+    def __init__(self, ctx, n_bands=N_BANDS):
+        self.texture = ctx.texture((n_bands, 1), 1, dtype='f4')
+        self.texture.filter = (moderngl.LINEAR, moderngl.LINEAR)
+        self.texture.repeat_x = False
+        self.texture.repeat_y = False
+        self._seq = -1
+
+    def update(self, snapshot):
+        if snapshot.seq != self._seq:
+            self.texture.write(snapshot.bands)
+            self._seq = snapshot.seq
+
+    def use(self, location=0):
+        self.texture.use(location=location)
+
+    def release(self):
+        self.texture.release()
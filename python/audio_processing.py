@@ -1,33 +1,441 @@
-import numpy as np
+import logging
+import struct
+import threading
 import time
 
+import numpy as np
+
+from audio_features import AudioFeatures, FEATURE_NAMES
+
+# Sources deliver float samples in [-1, 1]; the old analyzer ran the FFT on
+# int16 data and divided the mean magnitude by 10000, so keep that scale for u_audio.
+LEVEL_SCALE = 32767 / 10000
+
+_RFFT_HAS_OUT = np.lib.NumpyVersion(np.__version__) >= '2.0.0'
+
+
+class RingBuffer:
+    """Preallocated float32 sample ring. Writes never allocate."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = np.zeros(capacity, dtype=np.float32)
+        self.write_pos = 0  # total samples ever written
+
+    def write(self, samples):
+        n = len(samples)
+        if n > self.capacity:
+            samples = samples[-self.capacity:]
+            self.write_pos += n - self.capacity
+            n = self.capacity
+        start = self.write_pos % self.capacity
+        first = min(n, self.capacity - start)
+        self.data[start:start + first] = samples[:first]
+        self.data[:n - first] = samples[first:]
+        self.write_pos += n
+
+    def latest(self, out):
+        """Copy the newest len(out) samples into out, oldest first"""
+        n = len(out)
+        end = self.write_pos % self.capacity
+        start = end - n
+        if start >= 0:
+            out[:] = self.data[start:end]
+        else:
+            out[:-start] = self.data[start:]
+            out[-start:] = self.data[:end]
+
+
+class SyntheticSource:
+    """
+    The original test signal, computed from the sample index instead of the
+    wall clock so it streams without gaps and can be read at any position.
+    """
+
+    blocking = False
+
+    def __init__(self, rate=44100):
+        self.rate = rate
+        self.position = 0
+        self._index = np.zeros(0)
+        self._t = np.zeros(0)
+        self._phase = np.zeros(0)
+
+    def _scratch(self, n):
+        if len(self._index) < n:
+            self._index = np.arange(n, dtype=np.float64)
+            self._t = np.zeros(n)
+            self._phase = np.zeros(n)
+        return self._t[:n], self._phase[:n]
+
+    def read(self, out):
+        n = self.read_at(self.position, out)
+        self.position += n
+        return n
+
+    def read_at(self, start, out):
+        n = len(out)
+        t, phase = self._scratch(n)
+        np.add(self._index[:n], start, out=t)
+        t /= self.rate
+
+        # frequency = sin(2t) * 5 + 10, scaled by 100 as before; integrate it
+        # so the phase stays continuous across blocks.
+        np.multiply(t, 2.0, out=phase)
+        np.cos(phase, out=phase)
+        phase *= -2.5
+        phase += 10.0 * t
+        phase *= 2 * np.pi * 100
+        np.sin(phase, out=out)
+
+        # amplitude = (sin(3t) + 1) / 2
+        np.multiply(t, 3.0, out=phase)
+        np.sin(phase, out=phase)
+        phase += 1.0
+        phase *= 0.5
+        out *= phase
+        return n
+
+    def close(self):
+        pass
+
+
+def _wav_layout(path):
+    """Return (format_tag, channels, rate, sample_width, data_offset, frames) of a RIFF/WAVE file"""
+    with open(path, 'rb') as f:
+        riff, _, wave_id = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave_id != b'WAVE':
+            raise ValueError(f"{path} is not a WAV file")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                body = f.read(size + (size & 1))
+                tag, channels, rate, _, block_align, bits = struct.unpack('<HHIIHH', body[:16])
+                if tag == 0xFFFE and size >= 26:  # WAVE_FORMAT_EXTENSIBLE
+                    tag = struct.unpack('<H', body[24:26])[0]
+                fmt = (tag, channels, rate, bits // 8)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError(f"{path} has data before fmt chunk")
+                tag, channels, rate, width = fmt
+                return tag, channels, rate, width, f.tell(), size // (channels * width)
+            else:
+                f.seek(size + (size & 1), 1)
+
+
+class WavFileSource:
+    """Streams a WAV file through a read-only memory map, mixing down to mono"""
+
+    blocking = False
+    _DTYPES = {(1, 2): ('<i2', 1 / 32768), (1, 4): ('<i4', 1 / 2147483648), (3, 4): ('<f4', 1.0)}
+
+    def __init__(self, path, loop=True):
+        tag, channels, rate, width, offset, frames = _wav_layout(path)
+        if (tag, width) not in self._DTYPES:
+            raise ValueError(f"Unsupported WAV encoding in {path} (format {tag}, {width * 8} bit)")
+        dtype, self._scale = self._DTYPES[(tag, width)]
+        self.path = path
+        self.rate = rate
+        self.channels = channels
+        self.frames = frames
+        self.loop = loop
+        self.position = 0
+        self._data = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(frames, channels))
+        self._mix = np.zeros(0, dtype=np.float32)
+
+    @property
+    def duration(self):
+        return self.frames / self.rate
+
+    def read(self, out):
+        n = self.read_at(self.position, out)
+        self.position += n
+        return n
+
+    def read_at(self, start, out):
+        n = len(out)
+        filled = 0
+        while filled < n:
+            pos = start + filled
+            if self.loop and self.frames:
+                pos %= self.frames
+            if pos < 0:
+                count = min(n - filled, -pos)
+                out[filled:filled + count] = 0.0
+                filled += count
+                continue
+            if pos >= self.frames:
+                out[filled:] = 0.0
+                break
+            count = min(n - filled, self.frames - pos)
+            self._mix_into(self._data[pos:pos + count], out[filled:filled + count])
+            filled += count
+        return n
+
+    def _mix_into(self, frames, out):
+        if self.channels == 1:
+            np.multiply(frames[:, 0], self._scale, out=out)
+            return
+        if len(self._mix) < len(out):
+            self._mix = np.zeros(len(out), dtype=np.float32)
+        mix = self._mix[:len(out)]
+        np.copyto(out, frames[:, 0], casting='unsafe')
+        for ch in range(1, self.channels):
+            np.copyto(mix, frames[:, ch], casting='unsafe')
+            out += mix
+        out *= self._scale / self.channels
+
+    def close(self):
+        self._data = None
+
+
+class LiveCaptureSource:
+    """Live input through the optional `sounddevice` package (PortAudio)"""
+
+    blocking = True
+
+    def __init__(self, rate=44100, device=None, block_size=512):
+        import sounddevice
+        self.rate = rate
+        self.stream = sounddevice.InputStream(
+            samplerate=rate, device=device, channels=1, dtype='float32', blocksize=block_size
+        )
+        self.stream.start()
+        self.overflows = 0
+
+    def read(self, out):
+        data, overflowed = self.stream.read(len(out))
+        if overflowed:
+            self.overflows += 1
+        out[:] = data[:, 0]
+        return len(out)
+
+    def close(self):
+        self.stream.stop()
+        self.stream.close()
+
+
+class DeferredSource:
+    """
+    Opens a source on its first read, which happens on the analysis thread,
+    so a slow audio device does not hold up the first frame. Falls back to
+    the synthetic signal if it cannot be opened.
+    """
+
+    def __init__(self, opener, rate):
+        self.opener = opener
+        self.rate = rate
+        self.source = None
+        self.blocking = False
+
+    def read(self, out):
+        if self.source is None:
+            try:
+                self.source = self.opener()
+            except Exception as e:
+                logging.warning(f"Could not open live audio input: {e}")
+                self.source = SyntheticSource(self.rate)
+            self.blocking = self.source.blocking
+        return self.source.read(out)
+
+    def close(self):
+        if self.source is not None:
+            self.source.close()
+
+
+def open_source(spec=None, rate=44100, loop=True, defer=False):
+    """
+    Build a source from 'synthetic', 'live' or a path to a WAV file. With
+    `defer`, a live input is only opened once the analysis thread reads it.
+    """
+    if spec in (None, '', 'synthetic'):
+        return SyntheticSource(rate)
+    if spec == 'live' and defer:
+        return DeferredSource(lambda: LiveCaptureSource(rate), rate)
+    if spec == 'live':
+        try:
+            return LiveCaptureSource(rate)
+        except Exception as e:
+            logging.warning(f"Could not open live audio input: {e}")
+            return SyntheticSource(rate)
+    return WavFileSource(spec, loop=loop)
+
+
+class AudioSnapshot:
+    """One finished analysis hop"""
+
+    def __init__(self, chunk_size, n_bands):
+        self.magnitude = np.zeros(chunk_size // 2 + 1, dtype=np.float32)
+        self.features = np.zeros(n_bands + len(FEATURE_NAMES), dtype=np.float32)
+        self.bands = self.features[:n_bands]
+        self.level = 0.0
+        self.sample_index = 0
+        self.seq = 0
+
+    @property
+    def rms(self):
+        return float(self.features[-4])
+
+    @property
+    def flux(self):
+        return float(self.features[-3])
+
+    @property
+    def onset(self):
+        return float(self.features[-2])
+
+    @property
+    def envelope(self):
+        return float(self.features[-1])
+
+
 class AudioProcessor:
-    def __init__(self, chunk_size=1024, rate=44100):
+    """
+    Streams samples from a source into a ring buffer and analyzes them on a
+    background thread. The renderer only ever picks up the latest snapshot.
+    """
+
+    def __init__(self, chunk_size=1024, rate=44100, hop_size=None, source=None):
+        self.source = source or SyntheticSource(rate)
         self.chunk_size = chunk_size
-        self.rate = rate
+        self.rate = getattr(self.source, 'rate', rate)
+        self.hop_size = hop_size or chunk_size // 2
 
-    def get_fft_data(self):
-        # Generate synthetic audio data for testing
-        t = time.time()
-        frequency = np.sin(t * 2) * 5 + 10  # Varying frequency
-        amplitude = (np.sin(t * 3) + 1) / 2  # Varying amplitude
+        self.ring = RingBuffer(chunk_size * 4)
+        self.window = np.hanning(chunk_size).astype(np.float32)
+        self._window_gain = chunk_size / float(self.window.sum())
+        self._frame = np.zeros(chunk_size, dtype=np.float32)
+        self._windowed = np.zeros(chunk_size, dtype=np.float32)
+        self._hop = np.zeros(self.hop_size, dtype=np.float32)
+        self._spectrum = np.zeros(chunk_size // 2 + 1, dtype=np.complex128)
+        self.features = AudioFeatures(chunk_size, self.rate)
+
+        # Triple buffered: the writer always fills a snapshot that is neither
+        # the published one nor the one published just before it. It comes back
+        # round to a published snapshot two hops (~23 ms) later, so readers copy
+        # it out and check the writer has not started on it meanwhile.
+        self._snapshots = [AudioSnapshot(chunk_size, self.features.n_bands) for _ in range(3)]
+        self._latest = self._snapshots[0]
+        self._seq = 0
+        self._read = AudioSnapshot(chunk_size, self.features.n_bands)
+
+        self._running = False
+        self._thread = None
+        self._next_hop_end = self.hop_size
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='audio-analysis', daemon=True)
+        self._thread.start()
 
-        time_array = np.arange(self.chunk_size) / self.rate
-        synthetic_data = (amplitude * np.sin(2 * np.pi * frequency * time_array * 100) * 32767).astype(np.int16)
+    def _run(self):
+        hop_period = self.hop_size / self.rate
+        next_time = time.perf_counter()
+        try:
+            while self._running:
+                count = self.source.read(self._hop)
+                self.ring.write(self._hop[:count])
+                self._analyze()
+                if not self.source.blocking:
+                    next_time += hop_period
+                    delay = next_time - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        next_time = time.perf_counter()
+        except Exception:
+            logging.exception("Audio analysis stopped")
+            self._running = False
 
-        fft_data = np.fft.fft(synthetic_data)
-        return np.abs(fft_data)
+    def _analyze(self):
+        self.ring.latest(self._frame)
+        np.multiply(self._frame, self.window, out=self._windowed)
+        if _RFFT_HAS_OUT:
+            spectrum = np.fft.rfft(self._windowed, out=self._spectrum)
+        else:
+            spectrum = np.fft.rfft(self._windowed)
+
+        self._seq += 1
+        snapshot = self._snapshots[self._seq % 3]
+        np.abs(spectrum, out=snapshot.magnitude)
+        snapshot.magnitude *= self._window_gain
+        snapshot.level = float(snapshot.magnitude.mean()) * LEVEL_SCALE
+        self.features.update(self._frame, snapshot.magnitude, out=snapshot.features)
+        snapshot.sample_index = self.ring.write_pos
+        snapshot.seq = self._seq
+        self._latest = snapshot
+        return snapshot
+
+    def advance_to(self, seconds):
+        """
+        Offline use, instead of start(): analyze every hop of a seekable source
+        from the beginning up to `seconds`, in order, and return the latest
+        snapshot. The result depends only on the source and the time, never on
+        the wall clock or on where a render started.
+        """
+        end = int(seconds * self.rate)
+        while self._next_hop_end <= end:
+            self.analyze_next()
+        return self._latest
+
+    def analyze_next(self):
+        """Offline: analyze the next hop of a seekable source and return its snapshot"""
+        self.source.read_at(self._next_hop_end - self.hop_size, self._hop)
+        self.ring.write(self._hop)
+        self._next_hop_end += self.hop_size
+        return self._analyze()
+
+    def get_snapshot(self):
+        """
+        Latest finished analysis, as a copy that stays intact until the next
+        call however long the frame holds it. Lock-free; call it from the
+        render thread only.
+        """
+        read = self._read
+        while True:
+            latest = self._latest
+            seq = latest.seq
+            if seq == read.seq:
+                return read
+            np.copyto(read.magnitude, latest.magnitude)
+            np.copyto(read.features, latest.features)
+            read.level = latest.level
+            read.sample_index = latest.sample_index
+            # The writer takes this slot again for hop seq + 3; before that the copy is whole
+            if self._seq < seq + 3:
+                read.seq = seq
+                return read
+
+    def get_level(self):
+        return self._latest.level
+
+    def get_fft_data(self):
+        return self.get_snapshot().magnitude
 
     def stop(self):
-        # No-op for synthetic data
-        pass
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        self.source.close()
 
 if __name__ == '__main__':
-    audio_processor = AudioProcessor()
+    import sys
+    audio_processor = AudioProcessor(source=open_source(sys.argv[1] if len(sys.argv) > 1 else None))
+    audio_processor.start()
     try:
         while True:
-            fft_data = audio_processor.get_fft_data()
-            print(fft_data)
+            snapshot = audio_processor.get_snapshot()
+            bands = ' '.join(f"{b:.2f}" for b in snapshot.bands)
+            print(f"#{snapshot.seq} level={snapshot.level:.3f} rms={snapshot.rms:.3f} "
+                  f"onset={snapshot.onset:.2f} env={snapshot.envelope:.3f} | {bands}")
+            time.sleep(0.1)
     except KeyboardInterrupt:
         print("Stopping audio processing...")
         audio_processor.stop()
@@ -0,0 +1,152 @@
+import argparse
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+from parameters import UNIFORM_BLOCK
+from particles import SIMULATION_PARAMS
+from program_pool import create_standalone_context, list_scenes
+from scene_player import OfflineRenderer, parse_size
+
+SIZES = ((640, 360), (1280, 720), (1920, 1080))
+
+# Parameter settings each scene is measured with, besides the defaults. A
+# setting is skipped for scenes that do not read any of its parameters.
+VARIANTS = (
+    ('default', {}),
+    ('particle_count=1000', {'particle_count': 1000.0}),
+    ('particle_count=10000', {'particle_count': 10000.0}),
+    ('particle_count=50000', {'particle_count': 50000.0}),
+    ('zoom=0.1', {'zoom': 0.1}),
+    ('zoom=3.0', {'zoom': 3.0}),
+)
+
+
+def uses_params(renderer, values):
+    program = renderer.scene.program
+    if UNIFORM_BLOCK in program:
+        return True
+    if renderer.particles is not None and set(values) & set(SIMULATION_PARAMS):
+        return True
+    return any(renderer.params.param(name).uniform in program for name in values)
+
+
+def measure(renderer, frames, warmup):
+    """Render frames on the fixed clock, waiting for the GPU after each, and return per-frame ms"""
+    times = np.zeros(frames, dtype=np.float64)
+    for index in range(warmup):
+        renderer.render_frame(index)
+    renderer.ctx.finish()
+    for i in range(frames):
+        start = time.perf_counter()
+        renderer.render_frame(warmup + i)
+        renderer.ctx.finish()
+        times[i] = (time.perf_counter() - start) * 1000
+    return times
+
+
+def summarize(times):
+    p50, p95, p99 = np.percentile(times, (50, 95, 99))
+    mean = float(times.mean())
+    return {'fps': round(1000.0 / mean, 2), 'mean_ms': round(mean, 3), 'p50_ms': round(float(p50), 3),
+            'p95_ms': round(float(p95), 3), 'p99_ms': round(float(p99), 3), 'max_ms': round(float(times.max()), 3),
+            'frames': len(times)}
+
+
+def run_benchmarks(scenes, sizes, frames=60, warmup=5, fps=60.0, variants=VARIANTS):
+    """Benchmark every scene x size x parameter variant. Returns {key: stats}."""
+    ctx = create_standalone_context()
+    results = {}
+    for scene in scenes:
+        for size in sizes:
+            try:
+                renderer = OfflineRenderer(scene, size, fps, ctx=ctx)
+            except Exception as e:
+                print(f"Skipping {scene}: {e}")
+                break
+            try:
+                for label, values in variants:
+                    if values and not uses_params(renderer, values):
+                        continue
+                    renderer.params.reset()
+                    renderer.params.update(values)
+                    renderer.reset_audio()
+                    key = f"{scene}@{size[0]}x{size[1]}/{label}"
+                    results[key] = summarize(measure(renderer, frames, warmup))
+                    print(f"{key:<50} {results[key]['fps']:8.1f} fps  p50 {results[key]['p50_ms']:7.2f} ms"
+                          f"  p95 {results[key]['p95_ms']:7.2f} ms")
+            finally:
+                renderer.release()
+    info = ctx.info
+    meta = {'renderer': info.get('GL_RENDERER'), 'gl_version': info.get('GL_VERSION'),
+            'python': platform.python_version(), 'machine': platform.machine(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'frames': frames, 'warmup': warmup}
+    ctx.release()
+    return {'meta': meta, 'results': results}
+
+
+def compare(results, baseline, threshold=0.10, tail_threshold=0.25):
+    """
+    Regressions of `results` against `baseline`: median frame time more than
+    `threshold` slower, or p95 more than `tail_threshold` slower.
+    """
+    regressions = []
+    current, base = results['results'], baseline['results']
+    if baseline.get('meta', {}).get('renderer') != results['meta'].get('renderer'):
+        print(f"Warning: baseline was recorded on {baseline.get('meta', {}).get('renderer')!r}, "
+              f"this run used {results['meta'].get('renderer')!r}")
+    for key, stats in current.items():
+        if key not in base:
+            continue
+        for metric, limit in (('p50_ms', threshold), ('p95_ms', tail_threshold)):
+            ratio = stats[metric] / base[key][metric] if base[key][metric] > 0 else 1.0
+            if ratio > 1.0 + limit:
+                regressions.append((key, metric, base[key][metric], stats[metric], ratio))
+    scenes = {key.split('@')[0] for key in current}
+    missing = sorted(key for key in set(base) - set(current) if key.split('@')[0] in scenes)
+    return regressions, missing
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every scene headlessly and check for regressions")
+    parser.add_argument('--scenes', nargs='*', help="Scenes to run (default: all in shaders/)")
+    parser.add_argument('--sizes', nargs='*', type=parse_size, default=list(SIZES), help="WIDTHxHEIGHT ...")
+    parser.add_argument('--frames', type=int, default=60, help="Measured frames per run")
+    parser.add_argument('--warmup', type=int, default=5, help="Unmeasured frames before each run")
+    parser.add_argument('--output', help="Write results to this JSON file")
+    parser.add_argument('--baseline', help="Compare against this results file")
+    parser.add_argument('--save-baseline', action='store_true', help="Write the results to --baseline instead")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Allowed median slowdown (0.10 = 10%%)")
+    parser.add_argument('--tail-threshold', type=float, default=0.25, help="Allowed p95 slowdown")
+    args = parser.parse_args(argv)
+
+    scenes = args.scenes or sorted(list_scenes())
+    results = run_benchmarks(scenes, args.sizes, args.frames, args.warmup)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions, missing = compare(results, baseline, args.threshold, args.tail_threshold)
+        for key in missing:
+            print(f"Not measured this run: {key}")
+        for key, metric, before, after, ratio in regressions:
+            print(f"REGRESSION {key} {metric}: {before:.2f} -> {after:.2f} ms ({(ratio - 1) * 100:+.0f}%)")
+        if regressions:
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,200 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+import numpy as np
+
+from audio_features import N_BANDS
+from audio_processing import AudioSnapshot
+from parameters import ParameterStore
+from state_broadcast import ACK, OP_BINARY, StateBroadcaster, connect, decode_packet, encode_frame, read_frame
+
+# Receive window and stream buffer of the slow and stalled stand-ins, so that like a congested
+# connection their backlog reaches the server instead of piling up on their side
+SMALL_RCVBUF = 2048
+SMALL_LIMIT = 1024
+KINDS = ('fast', 'slow', 'stalled')
+# p99 latency the clients that read may not exceed: a slow client handles a packet every 50 ms,
+# so this is a few of its packets, not a backlog
+MAX_LATENCY_MS = 250.0
+
+
+def expected_values(frame, n):
+    """The parameters the publisher sets for `frame`: one of them goes up by one every frame"""
+    return ((frame + n - 1 - np.arange(n)) // n).astype(np.float32)
+
+
+async def _client(host, port, kind, deadline, start, connected):
+    """
+    One browser stand-in. 'fast' reads packets as they arrive, 'slow' takes
+    one every 50 ms over a congested connection, 'stalled' never reads.
+    Rebuilds the parameters from the packets and checks them against what
+    was published for each frame, acknowledging each once handled.
+    """
+    sock = None
+    if kind != 'fast':
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SMALL_RCVBUF)
+        sock.setblocking(False)
+        await asyncio.get_running_loop().sock_connect(sock, (host, port))
+    reader, writer, hello = await connect(host, port, sock, limit=SMALL_LIMIT if sock else 1 << 16)
+    if kind == 'stalled':
+        writer.transport.pause_reading()
+    connected()
+    n = len(hello['params'])
+    values = np.full(n, np.nan, dtype=np.float32)
+    result = {'kind': kind, 'received': 0, 'gaps': 0, 'keyframes': 0, 'wrong': 0, 'latency': []}
+    last = None
+    try:
+        while time.time() < deadline:
+            if kind == 'stalled':
+                await asyncio.sleep(0.1)
+                continue
+            try:
+                opcode, payload = await asyncio.wait_for(read_frame(reader), timeout=max(deadline - time.time(), 0.01))
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                break
+            if opcode != OP_BINARY:
+                continue
+            packet = decode_packet(payload)
+            if last is not None and packet['frame'] != last + 1:
+                result['gaps'] += packet['frame'] - last - 1
+            last = packet['frame']
+            result['keyframes'] += packet['keyframe']
+            values[packet['changes']['index']] = packet['changes']['value']
+            if not np.array_equal(values, expected_values(packet['frame'], n)):
+                result['wrong'] += 1
+            result['received'] += 1
+            result['latency'].append((time.time() - start - packet['clock']) * 1000)
+            if kind == 'slow':
+                await asyncio.sleep(0.05)
+            writer.write(encode_frame(ACK.pack(packet['frame']), mask=os.urandom(4)))
+    finally:
+        writer.close()
+    return result
+
+
+def consume(host, port, counts, seconds, start, ready, results):
+    """Client process: all the stand-ins on one event loop"""
+    async def run():
+        pending = sum(counts.values())
+
+        def connected():
+            nonlocal pending
+            pending -= 1
+            if pending == 0:
+                ready.set()
+
+        deadline = start + seconds
+        tasks = [_client(host, port, kind, deadline, start, connected) for kind in KINDS for _ in range(counts[kind])]
+        return await asyncio.gather(*tasks)
+
+    results.put(asyncio.run(run()))
+
+
+def run(fast=48, slow=8, stalled=4, seconds=10.0, fps=60.0):
+    """Publish at `fps` to local client stand-ins in another process. Returns a summary dict."""
+    store = ParameterStore()
+    broadcaster = StateBroadcaster(store, ['a.glsl', 'b.glsl'], N_BANDS, port=0)
+    if not broadcaster.start():
+        raise OSError("Could not open the broadcast port")
+    n = len(store.values)
+    snapshot = AudioSnapshot(1024, N_BANDS)
+    rng = np.random.default_rng(0)
+
+    counts = {'fast': fast, 'slow': slow, 'stalled': stalled}
+    mp = multiprocessing.get_context('spawn')
+    ready, results = mp.Event(), mp.Queue()
+    start = time.time() + 5.0  # connecting is not part of the measured run
+    reader = mp.Process(target=consume, args=(broadcaster.host, broadcaster.port, counts, seconds, start, ready,
+                                              results), daemon=True)
+    reader.start()
+    ready.wait(timeout=30.0)
+    time.sleep(max(start - time.time(), 0.0))
+
+    frames = int(seconds * fps)
+    publish_ms = np.zeros(frames)
+    buffered = 0
+    late = 0
+    period = 1.0 / fps
+    next_frame = time.perf_counter()
+    for index in range(frames):
+        store.values[:] = expected_values(broadcaster.encoder.frame, n)
+        snapshot.bands[:] = rng.random(N_BANDS)
+        snapshot.level = float(snapshot.bands.mean())
+        begin = time.perf_counter()
+        broadcaster.publish(time.time() - start, index % 2, snapshot)
+        publish_ms[index] = (time.perf_counter() - begin) * 1000
+        if index % int(fps) == 0:
+            buffered = max(buffered, broadcaster.stats()['buffered'])
+        next_frame += period
+        delay = next_frame - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            late += 1
+
+    clients = results.get(timeout=30.0)
+    reader.join(timeout=5.0)
+    stats = broadcaster.stats()
+    broadcaster.stop()
+    summary = {'frames': frames, 'late': late, 'sent': stats['sent'], 'dropped': stats['dropped'],
+               'max_buffered': buffered,
+               'publish_p50_ms': float(np.percentile(publish_ms, 50)),
+               'publish_p99_ms': float(np.percentile(publish_ms, 99)),
+               'publish_max_ms': float(publish_ms.max())}
+    for kind in KINDS:
+        group = [c for c in clients if c['kind'] == kind]
+        latency = [ms for c in group for ms in c['latency']]
+        summary[kind] = {'clients': len(group),
+                         'received': sum(c['received'] for c in group) / max(len(group), 1),
+                         'gaps': sum(c['gaps'] for c in group), 'keyframes': sum(c['keyframes'] for c in group),
+                         'wrong': sum(c['wrong'] for c in group),
+                         'latency_p50_ms': float(np.percentile(latency, 50)) if latency else None,
+                         'latency_p99_ms': float(np.percentile(latency, 99)) if latency else None}
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the WebSocket state broadcast with local browser stand-ins")
+    parser.add_argument('--clients', type=int, default=48, help="Clients that keep up")
+    parser.add_argument('--slow', type=int, default=8, help="Clients that read a packet every 50 ms")
+    parser.add_argument('--stalled', type=int, default=4, help="Clients that never read")
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--fps', type=float, default=60.0)
+    parser.add_argument('--max-latency', type=float, default=MAX_LATENCY_MS,
+                        help="Fail if the fast or slow clients' p99 latency is over this many ms")
+    args = parser.parse_args(argv)
+
+    summary = run(args.clients, args.slow, args.stalled, args.seconds, args.fps)
+    print(f"Published {summary['frames']} frames ({summary['late']} late); publish p50 {summary['publish_p50_ms']:.3f} ms, "
+          f"p99 {summary['publish_p99_ms']:.3f} ms, max {summary['publish_max_ms']:.3f} ms")
+    print(f"Sent {summary['sent']} packets, dropped {summary['dropped']}, "
+          f"largest client backlog {summary['max_buffered']} bytes")
+    for kind in KINDS:
+        group = summary[kind]
+        if not group['clients']:
+            continue
+        latency = (f"latency p50 {group['latency_p50_ms']:.1f} ms, p99 {group['latency_p99_ms']:.1f} ms"
+                   if group['latency_p50_ms'] is not None else "no packets")
+        print(f"  {group['clients']} {kind}: {group['received']:.0f} packets each, {group['gaps']} missed, "
+              f"{group['keyframes']} keyframes, {group['wrong']} wrong; {latency}")
+
+    failed = False
+    for kind in ('fast', 'slow'):
+        group = summary[kind]
+        if group['clients'] and (group['latency_p99_ms'] is None or group['latency_p99_ms'] > args.max_latency):
+            print(f"FAIL {kind} clients: p99 latency over {args.max_latency:.0f} ms")
+            failed = True
+        if group['wrong']:
+            print(f"FAIL {kind} clients: {group['wrong']} packets left them with the wrong parameters")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,32 +1,334 @@
-from pythonosc import dispatcher
-from pythonosc import osc_server
-import mido
+from contextlib import contextmanager
+import json
 import logging
+import os
+import socket
+import threading
+
+_EMPTY = ((), {})
+
+MIDI_PROFILE = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'midi_profile.json'))
+
+
+class CommandQueue:
+    """
+    Control changes from the OSC and MIDI threads, applied by the render
+    thread once per frame with drain(). Parameter writes are coalesced so only
+    the last value per parameter survives until the next drain; other commands
+    (scene switches) keep their order and are bounded by `capacity`. Writes
+    made inside batch() are submitted together, so they land in the same frame.
+    """
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._params = {}
+        self._commands = []
+        self.received = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def set_param(self, name, value):
+        self._submit((('param', name, value),))
+
+    def push(self, command, *args):
+        self._submit(((command,) + args,))
+
+    @contextmanager
+    def batch(self):
+        if getattr(self._local, 'pending', None) is not None:
+            yield
+            return
+        self._local.pending = []
+        try:
+            yield
+        finally:
+            items, self._local.pending = self._local.pending, None
+            if items:
+                self._submit(items)
+
+    def _submit(self, items):
+        pending = getattr(self._local, 'pending', None)
+        if pending is not None:
+            pending.extend(items)
+            return True
+        with self._lock:
+            self.received += len(items)
+            # A batch goes in whole or not at all
+            if sum(1 for item in items if item[0] != 'param') > self.capacity - len(self._commands):
+                self.dropped += len(items)
+                return False
+            for item in items:
+                if item[0] == 'param':
+                    if item[1] in self._params:
+                        self.coalesced += 1
+                    self._params[item[1]] = item[2]
+                else:
+                    self._commands.append(item)
+        return True
+
+    def drain(self):
+        """Everything queued since the last drain: (commands in order, {param: last value})"""
+        if not self._commands and not self._params:
+            return _EMPTY
+        with self._lock:
+            commands, self._commands = self._commands, []
+            params, self._params = self._params, {}
+        return commands, params
+
+    def stats(self):
+        return {'received': self.received, 'coalesced': self.coalesced, 'dropped': self.dropped}
+
+
+class MidiMapper:
+    """
+    Maps MIDI controllers and notes on any channel to shader parameters.
+    Every (channel, CC/note, number) has a slot in a flat lookup table built
+    when mappings change, so an incoming message costs one index and a
+    multiply-add into the parameter's range. CC 0-31 can be paired with
+    CC 32-63 as 14-bit controls. Values go through the command queue, so a
+    burst of CC messages within one frame becomes a single update.
+    """
+
+    CC, NOTE = 0, 1
+    KINDS = ('cc', 'note')
+    # Value divisors for 7-bit, 14-bit MSB and 14-bit LSB slots
+    _RANGE = (127.0, 16383.0, 16383.0)
+
+    def __init__(self, store, commands, path=None):
+        self.store = store
+        self.commands = commands
+        self.path = path
+        self.names = [p.name for p in store.params]
+        self.minimum = [float(v) for v in store.minimum]
+        self.span = [float(hi - lo) for lo, hi in zip(store.minimum, store.maximum)]
+        self.mappings = []
+        self.learning = None
+        self.learn_14bit = False
+        self._build()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    @staticmethod
+    def _slot(channel, kind, number):
+        return (channel << 8) | (kind << 7) | number
+
+    def _build(self):
+        table = [-1] * 4096
+        mode = [0] * 4096
+        for m in self.mappings:
+            kind = self.KINDS.index(m['type'])
+            slot = self._slot(m['channel'], kind, m['number'])
+            table[slot] = self.names.index(m['param'])
+            if m.get('14bit'):
+                mode[slot] = 1
+                lsb = self._slot(m['channel'], kind, m['number'] + 32)
+                table[lsb] = table[slot]
+                mode[lsb] = 2
+        self._msb = [0] * 4096
+        # Swapped in whole so the control thread never sees a half-built table
+        self.table, self.mode = table, mode
+
+    def add(self, channel, kind, number, param, fourteen_bit=False):
+        if param not in self.store:
+            raise ValueError(f"Unknown parameter {param!r}")
+        if kind not in self.KINDS or not 0 <= channel < 16 or not 0 <= number < 128:
+            raise ValueError(f"Invalid MIDI control {kind} {number} on channel {channel}")
+        if fourteen_bit and not (kind == 'cc' and number < 32):
+            raise ValueError("14-bit mappings need a CC number from 0 to 31")
+        taken = {(channel, kind, number)}
+        if fourteen_bit:
+            taken.add((channel, kind, number + 32))
+        self.mappings = [m for m in self.mappings if (m['channel'], m['type'], m['number']) not in taken
+                         and not (m.get('14bit') and (m['channel'], m['type'], m['number'] + 32) in taken)]
+        self.mappings.append({'channel': channel, 'type': kind, 'number': number, 'param': param,
+                              '14bit': fourteen_bit})
+        self._build()
+
+    def remove(self, param):
+        self.mappings = [m for m in self.mappings if m['param'] != param]
+        self._build()
+
+    def learn(self, param, fourteen_bit=False):
+        """Map the next controller or note that moves to `param`"""
+        self.learn_14bit = fourteen_bit
+        self.learning = param
+        print(f"MIDI learn: move a control for {param}{' (14-bit)' if fourteen_bit else ''}")
+
+    def handle(self, msg):
+        """Apply one MIDI message. Returns False if nothing is mapped to it."""
+        kind_name = msg.type
+        if kind_name == 'control_change':
+            kind, number, data = self.CC, msg.control, msg.value
+        elif kind_name == 'note_on':
+            kind, number, data = self.NOTE, msg.note, msg.velocity
+        elif kind_name == 'note_off':
+            kind, number, data = self.NOTE, msg.note, 0
+        else:
+            return False
+        slot = (msg.channel << 8) | (kind << 7) | number
+        if self.learning is not None:
+            self._learn(msg.channel, kind, number)
+
+        index = self.table[slot]
+        if index < 0:
+            return False
+        mode = self.mode[slot]
+        if mode == 1:
+            # MSB: remember it and start the fine part from zero until the LSB arrives
+            self._msb[slot] = data
+            data <<= 7
+        elif mode == 2:
+            data |= self._msb[slot - 32] << 7
+        self.commands.set_param(self.names[index], self.minimum[index] + data / self._RANGE[mode] * self.span[index])
+        return True
+
+    def _learn(self, channel, kind, number):
+        param, self.learning = self.learning, None
+        fourteen_bit = self.learn_14bit and kind == self.CC and number < 32
+        self.add(channel, self.KINDS[kind], number, param, fourteen_bit)
+        print(f"MIDI learn: {self.KINDS[kind].upper()} {number} on channel {channel + 1} -> {param}"
+              f"{' (14-bit)' if fourteen_bit else ''}")
+        if self.path:
+            self.save(self.path)
+
+    def save(self, path):
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'mappings': self.mappings}, f, indent=2)
+        os.replace(tmp, path)
+
+    def load(self, path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not load MIDI profile {path}: {e}")
+            return
+        self.mappings = []
+        for m in data.get('mappings', []):
+            try:
+                self.add(int(m['channel']), m['type'], int(m['number']), m['param'], bool(m.get('14bit')))
+            except (KeyError, ValueError) as e:
+                logging.warning(f"Skipping MIDI mapping {m}: {e}")
+
 
 class Control:
-    def __init__(self, ip="127.0.0.1", port=5005):
-        self.dispatcher = dispatcher.Dispatcher()
-        self.server = osc_server.ThreadingOSCUDPServer((ip, port), self.dispatcher)
+    """
+    OSC and MIDI input on one asyncio event loop in a background thread.
+    Handlers run on that loop; anything that touches shader state should go
+    through `commands`, which the render thread drains once per frame.
+    """
+
+    def __init__(self, ip="127.0.0.1", port=5005, midi=True):
+        self.address = (ip, port)
+        self.commands = CommandQueue()
+        # pythonosc, and asyncio under it, are imported on the control thread once start() is called
+        self.osc_mappings = []
+        self.dispatcher = None
+        self.midi_enabled = midi
+        self.midi_input = None
+        self.midi_handler = None
+        self.loop = None
+        self.transport = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    def map_osc(self, address, handler, needs_reply_address=False):
+        self.osc_mappings.append((address, handler, needs_reply_address))
+        if self.dispatcher is not None:
+            self.dispatcher.map(address, handler, needs_reply_address=needs_reply_address)
+
+    def map_midi(self, handler):
+        """Call handler(msg) on the control loop for every incoming MIDI message"""
+        self.midi_handler = handler
+
+    def reply(self, client_address, address, *args):
+        """Send a message back to the sender of a request, from the server's own port"""
+        from pythonosc.osc_message_builder import OscMessageBuilder
+        builder = OscMessageBuilder(address=address)
+        for arg in args:
+            builder.add_arg(arg)
+        self.transport.sendto(builder.build().dgram, client_address)
+
+    def start(self):
+        """Start the control loop thread; returns once the OSC port is open, or failed to"""
+        self._thread = threading.Thread(target=self._run, name='control', daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout=5.0)
+
+    def _run(self):
+        import asyncio
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._open())
+        except OSError as e:
+            logging.warning(f"Could not open OSC port {self.address}: {e}")
+        finally:
+            self._ready.set()
+        if self.midi_enabled:
+            # Without OSC the loop still serves MIDI. Importing mido and opening a port can take a while,
+            # so it happens on the loop once OSC is being served
+            self.loop.call_soon(self._open_midi)
+        elif self.transport is None:
+            self.loop.close()
+            return
+        try:
+            self.loop.run_forever()
+        finally:
+            if self.transport:
+                self.transport.close()
+            if self.midi_input:
+                self.midi_input.close()
+            self.loop.close()
+
+    async def _open(self):
+        from osc_dispatch import BatchingDispatcher
+        from pythonosc import osc_server
+        dispatcher = BatchingDispatcher(self.commands)
+        for address, handler, needs_reply_address in self.osc_mappings:
+            dispatcher.map(address, handler, needs_reply_address=needs_reply_address)
+        self.dispatcher = dispatcher
+        server = osc_server.AsyncIOOSCUDPServer(self.address, self.dispatcher, self.loop)
+        self.transport, _ = await server.create_serve_endpoint()
+        sock = self.transport.get_extra_info('socket')
+        try:
+            # Room for bursts from controllers while the loop is busy
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        except OSError:
+            pass
+        self.address = sock.getsockname()[:2]
+        print(f"Serving on {self.address}")
+
+    def _open_midi(self):
+        loop = self.loop
+
+        def on_message(msg):
+            # Called on the MIDI backend's thread; hand over to the control loop
+            loop.call_soon_threadsafe(self._dispatch_midi, msg)
+
         try:
-            self.midi_input = mido.open_input()
+            import mido
+            self.midi_input = mido.open_input(callback=on_message)
         except Exception as e:
             logging.warning(f"Could not open MIDI input: {e}")
             self.midi_input = None
+            if self.transport is None:
+                loop.stop()  # neither input is open
 
-    def map_osc(self, address, handler):
-        self.dispatcher.map(address, handler)
+    def _dispatch_midi(self, msg):
+        if self.midi_handler:
+            self.midi_handler(msg)
 
-    def start_osc_server(self):
-        print(f"Serving on {self.server.server_address}")
-        self.server.serve_forever()
+    def stop(self):
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
 
-    def stop_osc_server(self):
-        self.server.shutdown()
-
-    def get_midi_messages(self):
-        if self.midi_input:
-            return self.midi_input.iter_pending()
-        return []
 
 if __name__ == '__main__':
     def handle_test(address, *args):
@@ -34,16 +336,11 @@ if __name__ == '__main__':
 
     control = Control()
     control.map_osc("/test", handle_test)
-
-    import threading
-    server_thread = threading.Thread(target=control.start_osc_server)
-    server_thread.start()
+    control.map_midi(lambda msg: print(f"Received MIDI message: {msg}"))
+    control.start()
 
     try:
-        while True:
-            for msg in control.get_midi_messages():
-                print(f"Received MIDI message: {msg}")
+        threading.Event().wait()
     except KeyboardInterrupt:
-        control.stop_osc_server()
-        server_thread.join()
+        control.stop()
         print("Servers stopped.")
@@ -0,0 +1,156 @@
+import argparse
+import random
+import socket
+import threading
+import time
+
+import numpy as np
+from pythonosc.osc_message_builder import OscMessageBuilder
+
+from control import Control
+from parameters import BindingPlan, ParameterStore
+
+# Probes write distinct values of this parameter so the frame loop can tell which one arrived
+PROBE_PARAM = 'particle_speed'
+LOAD_PARAMS = ('zoom', 'brightness', 'color_r', 'color_g', 'color_b', 'ripple_speed')
+
+
+def message(address, *args):
+    builder = OscMessageBuilder(address=address)
+    for arg in args:
+        builder.add_arg(arg)
+    return builder.build().dgram
+
+
+class LoadGenerator:
+    """
+    Sends /param traffic at a fixed rate from a local UDP socket, standing in
+    for a controller. Every `probe_interval` seconds one message carries a
+    unique value of PROBE_PARAM whose send time is remembered.
+    """
+
+    def __init__(self, address, rate, seconds, probe_interval=0.005):
+        self.address = address
+        self.rate = rate
+        self.seconds = seconds
+        self.probe_interval = probe_interval
+        self.sent = 0
+        self.probes = {}
+        self._probe_value = 0
+        # Pre-encoded load so the sender's own cost stays out of the way
+        rng = random.Random(1)
+        self._load = [message('/param', name, rng.uniform(0.2, 0.9)) for name in LOAD_PARAMS for _ in range(32)]
+
+    def next_probe(self):
+        self._probe_value = self._probe_value % 9000 + 1
+        value = round(0.05 + self._probe_value * 0.0001, 4)
+        return value, message('/param', PROBE_PARAM, value)
+
+    def run(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        start = time.perf_counter()
+        next_probe = start
+        load = self._load
+        while True:
+            now = time.perf_counter()
+            elapsed = now - start
+            if elapsed >= self.seconds:
+                break
+            if now >= next_probe:
+                value, data = self.next_probe()
+                self.probes[value] = time.perf_counter()
+                sock.sendto(data, self.address)
+                self.sent += 1
+                next_probe += self.probe_interval
+            due = int(elapsed * self.rate) - self.sent
+            for _ in range(min(due, 64)):
+                sock.sendto(load[self.sent % len(load)], self.address)
+                self.sent += 1
+            if due <= 0:
+                time.sleep(0.0002)
+        sock.close()
+
+
+def open_uniform_target(store):
+    """A real program whose uniforms receive the parameters, if a GL context is available"""
+    try:
+        from program_pool import ProgramPool, create_standalone_context
+        ctx = create_standalone_context()
+    except Exception as e:
+        print(f"No GL context, measuring up to the parameter store only: {e}")
+        return None
+    pool = ProgramPool(ctx, capacity=1)
+    pool.load_sources(['particles.glsl'])
+    scene = pool.get('particles.glsl')
+    return BindingPlan(scene.program, store)
+
+
+def run(rate=5000, seconds=5.0, fps=60.0, port=0):
+    """
+    Drive a Control with generated OSC load while a stand-in render loop
+    drains and applies the queue every frame. Returns a summary dict.
+    """
+    store = ParameterStore()
+    plan = open_uniform_target(store)
+    control = Control(port=port, midi=False)
+
+    def handle_param(address, *args):
+        if len(args) >= 2 and str(args[0]) in store:
+            control.commands.set_param(str(args[0]), float(args[1]))
+
+    control.map_osc('/param', handle_param)
+    control.start()
+
+    generator = LoadGenerator(control.address, rate, seconds)
+    sender = threading.Thread(target=generator.run, name='osc-load', daemon=True)
+    latencies = []
+    frame = 1.0 / fps
+    start = time.perf_counter()
+    sender.start()
+    next_frame = start
+    while sender.is_alive() or time.perf_counter() - start < seconds + 0.1:
+        next_frame += frame
+        delay = next_frame - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        commands, params = control.commands.drain()
+        for name, value in params.items():
+            store.set(name, value)
+        if plan:
+            plan.upload()
+        if PROBE_PARAM in params:
+            sent_at = generator.probes.pop(round(store[PROBE_PARAM], 4), None)
+            if sent_at is not None:
+                latencies.append((time.perf_counter() - sent_at) * 1000)
+    elapsed = time.perf_counter() - start
+    sender.join()
+    control.stop()
+
+    stats = control.commands.stats()
+    summary = dict(stats, sent=generator.sent, lost=generator.sent - stats['received'],
+                   rate=round(stats['received'] / elapsed, 1), probes=len(latencies))
+    if latencies:
+        p50, p95, p99 = np.percentile(latencies, (50, 95, 99))
+        summary.update(latency_p50_ms=round(float(p50), 3), latency_p95_ms=round(float(p95), 3),
+                       latency_p99_ms=round(float(p99), 3), latency_max_ms=round(max(latencies), 3))
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure OSC control throughput and control-to-uniform latency")
+    parser.add_argument('--rate', type=float, default=5000, help="Messages per second to send")
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--fps', type=float, default=60.0, help="Frame rate of the stand-in render loop")
+    args = parser.parse_args(argv)
+
+    summary = run(args.rate, args.seconds, args.fps)
+    print(f"Sent {summary['sent']}, received {summary['received']} ({summary['rate']:.0f}/s), "
+          f"lost {summary['lost']}, coalesced {summary['coalesced']}, dropped {summary['dropped']}")
+    if summary['probes']:
+        print(f"Control-to-uniform latency over {summary['probes']} probes: p50 {summary['latency_p50_ms']:.2f} ms, "
+              f"p95 {summary['latency_p95_ms']:.2f} ms, p99 {summary['latency_p99_ms']:.2f} ms, "
+              f"max {summary['latency_max_ms']:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
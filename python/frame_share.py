@@ -0,0 +1,343 @@
+import argparse
+import logging
+import os
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from param_bus import untrack
+from video_output import AsyncReadback, flip_rows
+
+FRAME_RING_NAME = 'macroverse_frames'
+MAGIC = 0x4D564652  # 'MVFR'
+VERSION = 1
+SLOTS = 4
+PAGE = 4096
+
+# Ring header, then one header per slot, then the page-aligned pixel slots
+RING = np.dtype([
+    ('magic', 'u4'), ('version', 'u4'), ('slots', 'u4'), ('components', 'u4'),
+    ('max_width', 'u4'), ('max_height', 'u4'), ('slot_bytes', 'u8'),
+    ('fps', 'f8'),  # of the frame indices; 0 for live output
+    ('writer_pid', 'u4'), ('pad', 'u4'),
+    ('published', 'u8'),  # frames committed so far; frame n lives in slot n % slots
+    ('reserved', 'u1', 8),
+])
+SLOT = np.dtype([
+    ('seq', 'u8'),  # odd while the slot is being written
+    ('number', 'u8'),  # publish count of the frame in the slot
+    ('index', 'u8'),  # frame index as rendered
+    ('timestamp', 'f8'),  # wall clock time the frame was rendered, or else published
+    ('width', 'u4'), ('height', 'u4'),
+    ('reserved', 'u1', 24),
+])
+
+
+def _align(n, to=PAGE):
+    return (n + to - 1) // to * to
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+class Frame:
+    """
+    A published frame. `image` is a top-down (height, width, components) view
+    straight into shared memory, valid until the writer comes round to its
+    slot again, `slots - 1` frames later; check ring.intact(frame) after using it.
+    """
+
+    def __init__(self, number, slot, seq, index, timestamp, image):
+        self.number = number
+        self.slot = slot
+        self.seq = seq
+        self.index = index
+        self.timestamp = timestamp
+        self.image = image
+
+
+class FrameRing:
+    """
+    Rendered frames shared with other local processes through one shared
+    memory block of `slots` frame buffers. The renderer writes slots in turn
+    (acquire/submit, the same calls as EncoderThread) and never waits for
+    readers; readers map the newest slots as NumPy arrays without copying.
+    A per-slot sequence counter that is odd during a write (a seqlock, as in
+    param_bus) tells readers whether a frame changed under them.
+    Frames may be smaller than the size the ring was created for; each slot
+    records its frame's size.
+    """
+
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.owner = owner
+        buf = shm.buf
+        self.header = np.ndarray((), dtype=RING, buffer=buf)
+        self.slots = int(self.header['slots'])
+        self.components = int(self.header['components'])
+        self.max_size = (int(self.header['max_width']), int(self.header['max_height']))
+        self.slot_bytes = int(self.header['slot_bytes'])
+        self.fps = float(self.header['fps'])
+        self.slot_headers = np.ndarray(self.slots, dtype=SLOT, buffer=buf, offset=RING.itemsize)
+        offset = _align(RING.itemsize + SLOT.itemsize * self.slots)
+        self.pixels = [np.ndarray(self.slot_bytes, dtype=np.uint8, buffer=buf, offset=offset + i * self.slot_bytes)
+                       for i in range(self.slots)]
+        self._writing = None
+
+    @staticmethod
+    def size(max_size, slots=SLOTS, components=3):
+        slot_bytes = _align(max_size[0] * max_size[1] * components)
+        return _align(RING.itemsize + SLOT.itemsize * slots) + slot_bytes * slots, slot_bytes
+
+    @classmethod
+    def create(cls, name=FRAME_RING_NAME, max_size=(1920, 1080), slots=SLOTS, components=3, fps=0.0):
+        """
+        Create the ring for writing. A ring left behind by a writer that is
+        no longer running is replaced; one whose writer is alive is not.
+        """
+        total, slot_bytes = cls.size(max_size, slots, components)
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=total)
+        except FileExistsError:
+            stale = cls.attach(name)
+            pid = int(stale.header['writer_pid'])
+            stale.close()
+            if pid and pid != os.getpid() and _pid_alive(pid):
+                raise FileExistsError(f"Frame ring {name!r} is being written by process {pid}")
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=total)
+        untrack(shm)
+        header = np.ndarray((), dtype=RING, buffer=shm.buf)
+        header['slots'], header['components'] = slots, components
+        header['max_width'], header['max_height'] = max_size
+        header['slot_bytes'] = slot_bytes
+        header['fps'] = fps
+        header['writer_pid'] = os.getpid()
+        header['version'] = VERSION
+        header['magic'] = MAGIC
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name=FRAME_RING_NAME):
+        """Open an existing ring for reading"""
+        shm = shared_memory.SharedMemory(name=name)
+        untrack(shm)
+        header = np.ndarray((), dtype=RING, buffer=shm.buf)
+        if shm.size < RING.itemsize or header['magic'] != MAGIC or header['version'] != VERSION:
+            del header
+            shm.close()
+            raise ValueError(f"Shared memory {name!r} is not a frame ring")
+        del header
+        return cls(shm)
+
+    @property
+    def published(self):
+        return int(self.header['published'])
+
+    # Writer side
+
+    def acquire(self, size=None):
+        """Start writing the next slot; returns its flat pixel buffer for a frame of `size`"""
+        w, h = size or self.max_size
+        if w > self.max_size[0] or h > self.max_size[1]:
+            raise ValueError(f"{w}x{h} frame does not fit a {self.max_size[0]}x{self.max_size[1]} ring")
+        slot = self.published % self.slots
+        self.slot_headers['seq'][slot] += 1  # odd: write in progress
+        self._writing = (slot, w, h)
+        return self.pixels[slot][:w * h * self.components]
+
+    def submit(self, index, data=None, timestamp=None):
+        """Publish the slot acquire() returned as frame `index`"""
+        slot, w, h = self._writing
+        header = self.slot_headers[slot:slot + 1]
+        header['number'] = self.published
+        header['index'] = index
+        header['timestamp'] = timestamp if timestamp is not None else time.time()
+        header['width'] = w
+        header['height'] = h
+        self.slot_headers['seq'][slot] += 1
+        self.header['published'] += 1
+        self._writing = None
+
+    def release(self, data=None):
+        """Give back an acquired slot without publishing it"""
+        if self._writing is not None:
+            self.slot_headers['seq'][self._writing[0]] += 1
+            self._writing = None
+
+    # Reader side
+
+    def _read(self, number):
+        slot = number % self.slots
+        headers = self.slot_headers
+        seq = int(headers['seq'][slot])
+        if seq & 1 or int(headers['number'][slot]) != number:
+            return None
+        index = int(headers['index'][slot])
+        timestamp = float(headers['timestamp'][slot])
+        w, h = int(headers['width'][slot]), int(headers['height'][slot])
+        if int(headers['seq'][slot]) != seq:
+            return None
+        image = flip_rows(self.pixels[slot][:w * h * self.components], (w, h), self.components)
+        return Frame(number, slot, seq, index, timestamp, image)
+
+    def latest(self):
+        """The newest published frame, or None if there is none yet"""
+        published = self.published
+        return self._read(published - 1) if published else None
+
+    def next(self, after=-1, timeout=1.0, poll=0.0005):
+        """
+        The first frame published after frame number `after` that is still in
+        the ring, waiting up to `timeout` seconds for one. Frames a slow
+        reader fell behind on are skipped; the gap in `number` says how many.
+        """
+        deadline = time.perf_counter() + timeout
+        while True:
+            published = self.published
+            # The oldest slot may be the one being rewritten; start after it
+            number = max(after + 1, published - self.slots + 1, 0)
+            if number < published:
+                frame = self._read(number)
+                if frame is not None:
+                    return frame
+                after = number  # overwritten while we looked; try the next one
+                continue
+            if time.perf_counter() >= deadline:
+                return None
+            time.sleep(poll)
+
+    def intact(self, frame):
+        """True if the frame's pixels have not been overwritten since it was read"""
+        return int(self.slot_headers['seq'][frame.slot]) == frame.seq
+
+    def close(self):
+        # The numpy views must go before the mapping can be closed
+        self.header = self.slot_headers = self.pixels = None
+        self.shm.close()
+        if self.owner:
+            try:
+                resource_tracker.register(self.shm._name, 'shared_memory')
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def open_frame_ring(name=FRAME_RING_NAME, max_size=(1920, 1080), fps=0.0):
+    """A ring to publish frames into, or None if shared memory is unavailable"""
+    try:
+        ring = FrameRing.create(name, max_size, fps=fps)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Shared frame output unavailable: {e}")
+        return None
+    print(f"Publishing frames to shared memory {name!r} (up to {max_size[0]}x{max_size[1]}, {ring.slots} slots)")
+    return ring
+
+
+class FramePublisher:
+    """
+    Publishes the rendered frame into a FrameRing. Each frame is read back
+    into a pixel buffer on the GPU and copied into its slot one frame later,
+    by which time the transfer has finished, so the render loop never waits
+    for it.
+    """
+
+    def __init__(self, ctx, ring):
+        self.ctx = ctx
+        self.ring = ring
+        self.readback = None
+        self.index = 0
+        self._warned = None
+
+    def publish(self, fbo, size):
+        size = tuple(size)
+        if size[0] > self.ring.max_size[0] or size[1] > self.ring.max_size[1]:
+            if self._warned != size:
+                logging.warning(f"{size[0]}x{size[1]} frames are larger than the shared frame ring; not publishing")
+                self._warned = size
+            return
+        if self.readback is None or self.readback.size != size:
+            # The frame in flight at the old size is dropped
+            if self.readback is not None:
+                self.readback.release()
+            self.readback = AsyncReadback(self.ctx, size, self.ring.components)
+        out = self.ring.acquire(size)
+        done = self.readback.read(fbo, (self.index, time.time()), out)
+        if done is None:
+            self.ring.release()
+        else:
+            index, timestamp = done
+            self.ring.submit(index, timestamp=timestamp)
+        self.index += 1
+
+    def close(self):
+        if self.readback is not None:
+            self.readback.release()
+            self.readback = None
+        self.ring.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reference consumer: read frames Macroverse publishes to shared memory")
+    parser.add_argument('name', nargs='?', default=FRAME_RING_NAME)
+    parser.add_argument('--seconds', type=float, default=0.0, help="Stop after this long (0 = until interrupted)")
+    parser.add_argument('--save', help="Save the first frame received to this image file")
+    args = parser.parse_args(argv)
+
+    ring = None
+    while ring is None:
+        try:
+            ring = FrameRing.attach(args.name)
+        except FileNotFoundError:
+            print(f"Waiting for {args.name!r} to be published...", end='\r')
+            time.sleep(0.5)
+    print(f"Reading {args.name!r}: up to {ring.max_size[0]}x{ring.max_size[1]}, {ring.slots} slots")
+    start = report = time.perf_counter()
+    last = ring.published - 1
+    received = dropped = torn = 0
+    latency = []
+    frame = None
+    try:
+        while not args.seconds or time.perf_counter() - start < args.seconds:
+            frame = ring.next(last)
+            if frame is None:
+                continue
+            dropped += max(frame.number - last - 1, 0) if last >= 0 else 0
+            last = frame.number
+            # A consumer would hand frame.image to its compositor or encoder here
+            mean = float(frame.image[::16, ::16].mean())
+            if args.save:
+                from PIL import Image
+                Image.fromarray(np.ascontiguousarray(frame.image)).save(args.save)
+                args.save = None
+            if not ring.intact(frame):
+                torn += 1
+                continue
+            received += 1
+            latency.append((time.time() - frame.timestamp) * 1000)
+            now = time.perf_counter()
+            if now - report >= 1.0:
+                h, w = frame.image.shape[:2]
+                print(f"frame {frame.index} {w}x{h}: {received / (now - report):.1f} fps, "
+                      f"latency {np.median(latency):.1f} ms, dropped {dropped}, torn {torn}, mean {mean:.0f}")
+                report, received, dropped, torn, latency = now, 0, 0, 0, []
+    except KeyboardInterrupt:
+        pass
+    finally:
+        frame = None  # its view has to go before the ring can be closed
+        ring.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+
+from frame_share import FramePublisher, FrameRing
+from program_pool import create_standalone_context
+from scene_player import parse_size
+
+BENCH_RING = 'macroverse_frames_bench'
+
+
+def consume(name, seconds, ready, results):
+    """Reader process: copy every frame out like a recorder would and check it is the frame it claims to be"""
+    ring = FrameRing.attach(name)
+    ready.set()
+    received = dropped = torn = wrong = 0
+    latency = []
+    last = -1
+    frame = None
+    scratch = None
+    deadline = time.perf_counter() + seconds + 1.0
+    while time.perf_counter() < deadline:
+        frame = ring.next(last, timeout=0.1)
+        if frame is None:
+            continue
+        if last >= 0:
+            dropped += frame.number - last - 1
+        last = frame.number
+        if scratch is None or scratch.shape != frame.image.shape:
+            scratch = np.empty(frame.image.shape, dtype=np.uint8)
+        np.copyto(scratch, frame.image)
+        if not ring.intact(frame):
+            torn += 1
+            continue
+        received += 1
+        latency.append((time.time() - frame.timestamp) * 1000)
+        # The writer clears each frame to a red level of index % 256
+        if scratch[0, 0, 0] != frame.index % 256 or scratch[-1, -1, 0] != frame.index % 256:
+            wrong += 1
+    frame = None
+    ring.close()
+    results.put({'received': received, 'dropped': dropped, 'torn': torn, 'wrong': wrong,
+                 'latency_p50_ms': float(np.percentile(latency, 50)) if latency else None,
+                 'latency_p99_ms': float(np.percentile(latency, 99)) if latency else None})
+
+
+def run(size, seconds, fps):
+    """Render cleared frames at `fps` and publish them while a reader process consumes. Returns a summary dict."""
+    ring = FrameRing.create(BENCH_RING, size, fps=fps)
+    # Spawned, not forked, so the reader never inherits the GL context
+    mp = multiprocessing.get_context('spawn')
+    ready, results = mp.Event(), mp.Queue()
+    reader = mp.Process(target=consume, args=(BENCH_RING, seconds, ready, results), daemon=True)
+    reader.start()
+    ready.wait(timeout=10.0)
+
+    ctx = create_standalone_context()
+    color = ctx.renderbuffer(size)
+    fbo = ctx.framebuffer(color_attachments=[color])
+    publisher = FramePublisher(ctx, ring)
+    frames = int(seconds * fps)
+    publish_ms = np.zeros(frames)
+    late = 0
+    period = 1.0 / fps
+    start = next_frame = time.perf_counter()
+    for index in range(frames):
+        fbo.use()
+        ctx.clear((index % 256) / 255.0, 0.5, 0.25)
+        begin = time.perf_counter()
+        publisher.publish(fbo, size)
+        publish_ms[index] = (time.perf_counter() - begin) * 1000
+        next_frame += period
+        delay = next_frame - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            late += 1
+    elapsed = time.perf_counter() - start
+
+    reader_summary = results.get(timeout=seconds + 10.0)
+    reader.join(timeout=5.0)
+    publisher.close()
+    fbo.release()
+    color.release()
+    summary = dict(reader_summary, frames=frames, fps=frames / elapsed, late=late,
+                   publish_p50_ms=float(np.percentile(publish_ms, 50)),
+                   publish_p99_ms=float(np.percentile(publish_ms, 99)),
+                   publish_max_ms=float(publish_ms.max()))
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure shared-memory frame output throughput and render loop cost")
+    parser.add_argument('--size', type=parse_size, default=(1920, 1080), help="WIDTHxHEIGHT")
+    parser.add_argument('--fps', type=float, default=60.0)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    summary = run(args.size, args.seconds, args.fps)
+    print(f"Published {summary['frames']} {args.size[0]}x{args.size[1]} frames at {summary['fps']:.1f} fps "
+          f"({summary['late']} late); publish p50 {summary['publish_p50_ms']:.2f} ms, "
+          f"p99 {summary['publish_p99_ms']:.2f} ms, max {summary['publish_max_ms']:.2f} ms")
+    latency = (f"latency p50 {summary['latency_p50_ms']:.1f} ms, p99 {summary['latency_p99_ms']:.1f} ms"
+               if summary['received'] else "no frames")
+    print(f"Reader received {summary['received']}, dropped {summary['dropped']}, torn {summary['torn']}, "
+          f"wrong {summary['wrong']}; {latency}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+import json
+from contextlib import contextmanager
+import threading
+import time
+
+import numpy as np
+
+# CPU stages timed every frame, then GPU draw time and the whole frame interval
+STAGES = ('audio', 'control', 'particles', 'upload', 'draw', 'gpu', 'frame')
+PERCENTILES = (50, 95, 99)
+
+
+class FrameStats:
+    """
+    Per-stage frame times in a fixed-size ring, so recording a frame never
+    allocates. The render thread calls lap() after each stage and end_frame()
+    once per frame; summary() can be called from any thread.
+    """
+
+    def __init__(self, capacity=600, target_fps=60.0):
+        self.samples = np.zeros((capacity, len(STAGES)), dtype=np.float32)
+        self.index = {name: i for i, name in enumerate(STAGES)}
+        self.budget = 1000.0 / target_fps if target_fps > 0 else None
+        self.frames = 0
+        self.dropped = 0
+        self._row = np.zeros(len(STAGES), dtype=np.float32)
+        self._lap = time.perf_counter()
+        self._frame_start = None
+
+    def begin_frame(self):
+        now = time.perf_counter()
+        if self._frame_start is not None:
+            self._row[self.index['frame']] = (now - self._frame_start) * 1000
+        self._frame_start = now
+        self._lap = now
+
+    def lap(self, stage):
+        """Add the time since the previous lap (or frame start) to `stage`"""
+        now = time.perf_counter()
+        self._row[self.index[stage]] += (now - self._lap) * 1000
+        self._lap = now
+
+    def skip(self):
+        """Leave the time since the previous lap out of every stage"""
+        self._lap = time.perf_counter()
+
+    def spare_ms(self, gpu_ms=None):
+        """
+        Budget this frame leaves unused: the target frame time less what its
+        stages took on the CPU, or on the GPU if that was longer. None without a target.
+        """
+        if not self.budget:
+            return None
+        work = float(self._row.sum() - self._row[self.index['gpu']] - self._row[self.index['frame']])
+        return self.budget - max(work, gpu_ms or 0.0)
+
+    def end_frame(self, gpu_ms=None):
+        row = self._row
+        if gpu_ms is not None:
+            row[self.index['gpu']] = gpu_ms
+        # The frame interval is the previous frame's, so it needs one frame of history
+        if self.frames > 0:
+            self.samples[(self.frames - 1) % len(self.samples)] = row
+            if self.budget and row[self.index['frame']] > self.budget * 1.5:
+                self.dropped += 1
+        self.frames += 1
+        row[:] = 0.0
+
+    def summary(self):
+        """Percentiles of every stage over the ring, in milliseconds"""
+        count = min(self.frames - 1, len(self.samples))
+        result = {'frames': self.frames, 'dropped': self.dropped, 'window': max(count, 0)}
+        if count <= 0:
+            return result
+        window = self.samples[:count].copy()
+        table = np.percentile(window, PERCENTILES, axis=0)
+        for i, stage in enumerate(STAGES):
+            result[stage] = {f'p{p}': round(float(table[j, i]), 3) for j, p in enumerate(PERCENTILES)}
+        frame_ms = float(window[:, self.index['frame']].mean())
+        result['fps'] = round(1000.0 / frame_ms, 1) if frame_ms > 0 else 0.0
+        return result
+
+
+def format_summary(summary):
+    if 'fps' not in summary:
+        return "Frame stats: collecting"
+    stages = ' '.join(f"{stage}:{summary[stage]['p50']:.2f}/{summary[stage]['p99']:.2f}"
+                      for stage in STAGES if stage != 'frame')
+    frame = summary['frame']
+    return (f"{summary['fps']:.1f} fps, frame p50/p95/p99 {frame['p50']:.1f}/{frame['p95']:.1f}/"
+            f"{frame['p99']:.1f} ms, dropped {summary['dropped']} | ms p50/p99 {stages}")
+
+
+class StatsReporter:
+    """
+    Prints status and frame statistics and appends them to a JSON-lines log
+    from a background thread, once per `interval`, so the render loop only
+    pays for recording samples.
+    """
+
+    def __init__(self, stats, interval=1.0, log_path=None, status=None):
+        self.stats = stats
+        self.interval = interval
+        self.log_path = log_path
+        self.status = status  # callable returning extra console lines
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='stats-reporter', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def _run(self):
+        log = open(self.log_path, 'a') if self.log_path else None
+        try:
+            while not self._stop.wait(self.interval):
+                summary = self.stats.summary()
+                if self.status:
+                    for line in self.status():
+                        print(line)
+                print(f"  {format_summary(summary)}")
+                if log:
+                    log.write(json.dumps(dict(summary, time=round(time.time(), 3))) + '\n')
+                    log.flush()
+        finally:
+            if log:
+                log.close()
+
+
+class StartupTrace:
+    """
+    Wall-clock time of each startup phase, from the first line of main.py to
+    the first frame. mark() closes the current phase; work deferred until
+    after the first frame is added with record(), from any thread.
+    """
+
+    def __init__(self, start=None):
+        self.start = start if start is not None else time.perf_counter()
+        self.phases = []
+        self.background = []
+        self._last = self.start
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, (now - self._last) * 1000))
+        self._last = now
+
+    def record(self, phase, ms):
+        self.background.append((phase, ms))
+
+    @contextmanager
+    def timed(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, (time.perf_counter() - start) * 1000)
+
+    def total_ms(self):
+        return (self._last - self.start) * 1000
+
+    def format(self):
+        phases = ', '.join(f"{phase} {ms:.0f}" for phase, ms in self.phases)
+        text = f"Startup {self.total_ms():.0f} ms to first frame: {phases}"
+        if self.background:
+            text += " | after: " + ', '.join(f"{phase} {ms:.0f}" for phase, ms in self.background)
+        return text
+
+    def as_dict(self):
+        return {'total_ms': round(self.total_ms(), 1),
+                'phases': {phase: round(ms, 1) for phase, ms in self.phases},
+                'background': {phase: round(ms, 1) for phase, ms in self.background}}
@@ -1,9 +1,43 @@
+# Startup is traced from here; this has to come before the other imports
+from time import perf_counter
+STARTED = perf_counter()
+
 import moderngl_window as mglw
-from audio_processing import AudioProcessor
-from control import Control
-import os
+from audio_cache import open_cached
+from audio_features import AudioTexture
+from audio_processing import AudioProcessor, WavFileSource, open_source
+from control import MIDI_PROFILE, Control, MidiMapper
+from frame_share import FRAME_RING_NAME, FramePublisher, open_frame_ring
+from frame_stats import STAGES, FrameStats, StartupTrace, StatsReporter, format_summary
+from param_bus import open_bus
+from param_engine import SHAPES, SMOOTHING, ParameterEngine
+from parameters import PRESETS, BindingPlan, ParameterStore, ParamUniformBuffer
+from program_pool import QUALITY_TIERS, ProgramPool, VERTEX_SHADER, list_scenes
+from quality import QualityProfile, QualitySelector, machine_id
+from particles import PARTICLE_SCENE, ParticleRenderer, ParticleSystem
+from render_graph import Pass, PostShader, RenderGraph, previous
+from render_scale import GpuTimer, ResolutionController, ScaledTarget
+from session_log import BUS, COMMANDS, KEY, MIDI, SessionRecorder, SessionReplay, session_path
+from shader_watcher import ShaderWatcher
+import logging
+import moderngl
 import threading
-import queue
+import time
+
+STARTUP = StartupTrace(STARTED)
+STARTUP.mark('imports')
+
+# Post-processing effects and their default amounts (0 = off)
+POST_EFFECTS = {'trails': 0.0, 'bloom': 0.0}
+
+# Settings that change what is drawn; a session log keeps them so replays match
+RECORDED_ARGS = ('smoothing', 'smooth_time', 'quality', 'transition', 'trails', 'bloom')
+
+# Longest an edited scene waits for a frame with spare budget before it is compiled anyway
+RELOAD_WAIT = 0.5
+
+# How the less obvious key names are shown in the help text
+KEY_LABELS = {'SEMICOLON': ';', 'BRACKET_LEFT': '[', 'BRACKET_RIGHT': ']'}
 
 class Macroverse(mglw.WindowConfig):
     gl_version = (3, 3)
@@ -15,86 +49,546 @@ class Macroverse(mglw.WindowConfig):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.audio_processor = AudioProcessor()
+        # Only what the first frame needs is set up here; see finish_startup()
+        self.startup_trace = STARTUP
+        self.startup_trace.mark('window')
+        self.startup_thread = None
+        self.pending_audio = None
+        audio_spec = self.argv.audio if self.argv else None
+        # A recorded session drives every input, audio included, instead of the live sources
+        self.replay = None
+        if self.argv and self.argv.replay:
+            self.replay = SessionReplay(self.argv.replay, realtime=self.argv.replay_speed == 'realtime')
+            self.replay_started = perf_counter()
+            self.audio_processor = self.replay.audio
+            for name, value in self.replay.header.get('args', {}).items():
+                if name in RECORDED_ARGS:
+                    setattr(self.argv, name, value)
+            print(f"Replaying {self.argv.replay} at {self.argv.replay_speed} speed")
+        else:
+            # A pre-analyzed audio file (python audio_cache.py FILE) plays back without any analysis. Hashing
+            # the whole file to find its table would hold up the first frame: a file not hashed before is
+            # analyzed live until start_services() has, see switch_audio()
+            self.audio_processor = open_cached(audio_spec, loop=True, read_file=False)
+            if self.audio_processor:
+                print(f"Audio features from {self.audio_processor.path}")
+            else:
+                self.audio_processor = AudioProcessor(source=open_source(audio_spec, defer=True))
+        self.audio_processor.start()
+        self.audio_texture = AudioTexture(self.ctx, self.audio_processor.features.n_bands)
         self.control = Control()
+        self.param_bus = None
+        self.frame_publisher = None
+        self.broadcaster = None
 
-        # Shader control parameters
-        self.shader_params = {
-            'time_scale': 1.0,
-            'audio_sensitivity': 1.0,
-            'color_r': 0.1,
-            'color_g': 0.2,
-            'color_b': 0.8,
-            'ripple_frequency': 20.0,
-            'ripple_speed': 2.0,
-            'particle_count': 100.0,
-            'particle_speed': 0.1,
-            'zoom': 1.0,
-            'brightness': 1.0
-        }
+        # Shader control parameters: one packed store shared by keys, OSC and GUI
+        self.params = ParameterStore()
+        self.param_ubo = ParamUniformBuffer(self.ctx, self.params)
+        # Inputs set targets; the engine glides the values there once per frame
+        self.engine = ParameterEngine(self.params,
+                                      smoothing=self.argv.smoothing if self.argv else 'exp',
+                                      smooth_time=self.argv.smooth_time if self.argv else 0.1)
+        self.key_bindings = {}
+        for param in self.params.params:
+            for key_name, direction in zip(param.keys or (), (1, -1)):
+                # Not every window backend defines every key (headless has no brackets)
+                key = getattr(self.wnd.keys, key_name, None)
+                if key is not None:
+                    self.key_bindings[key] = (param.name, direction)
 
+        # Scene switches pick an already compiled program out of the pool
+        self.programs = ProgramPool(self.ctx)
         self.scenes = self.load_scenes()
+        self.programs.load_sources(self.scenes)
+        self.startup_trace.mark('sources')
         self.current_scene_index = 0
+        self.scene = None
         self.prog = None
-        self.quad_fs = None
+        # During a scene change the outgoing scene keeps rendering and is blended out
+        self.outgoing_scene = None
+        self.transition_time = self.argv.transition if self.argv else 1.0
+        self.transition_start = 0.0
+        self.clock = 0.0
+        self.snapshot = None
+        # Scenes with quality variants are shown at the best tier this machine can hold
+        target_fps = self.argv.target_fps if self.argv else 60.0
+        self.quality = self.argv.quality if self.argv else 'auto'
+        self.quality_profile = QualityProfile(machine_id(self.ctx))
+        self.quality_selector = QualitySelector(self.ctx, self.programs, 1000.0 / (target_fps or 60.0))
+        # Scenes without a remembered tier start at the lowest and are measured a draw per idle frame
+        self.pending_quality = []
+        # Warm-up compiles the tier each scene will be shown at
+        for name in self.scenes:
+            self.set_start_tier(name)
         if self.scenes:
             self.load_scene(self.scenes[self.current_scene_index])
+        self.startup_trace.mark('first scene')
+
+        # The particles scene's particles are simulated on the CPU and drawn as instanced sprites
+        self.particles = ParticleSystem()
+        self.particle_renderer = ParticleRenderer(self.ctx, self.programs, self.params, self.param_ubo)
+
+        # Scenes render at a reduced internal resolution when they cannot hold the target frame rate
+        self.render_target = ScaledTarget(self.ctx, self.programs)
+        self.gpu_timer = GpuTimer(self.ctx)
+        self.resolution_controller = ResolutionController(target_fps) if target_fps > 0 else None
+        self.render_scale = min(max(self.argv.render_scale if self.argv else 1.0, 0.1), 1.0)
+        if self.resolution_controller:
+            self.resolution_controller.scale = self.render_scale
+
+        # Edits in shaders/ are picked up live; the shown scene is recompiled in a frame with spare budget
+        self.shader_watcher = ShaderWatcher(self.programs.shader_dir)
+        self.shader_watcher.start()
+        self.pending_reload = None
+        self.reload_requested = 0.0
+
+        # Scenes, transitions and post effects are passes of a render graph over pooled textures
+        self.post = {name: getattr(self.argv, name) if self.argv else amount for name, amount in POST_EFFECTS.items()}
+        self.render_graph = self.create_render_graph()
+        self.startup_trace.mark('render graph')
 
         self.control.map_osc("/scene", self.handle_scene_change)
         self.control.map_osc("/param", self.handle_param_change)
+        self.control.map_osc("/stats", self.handle_stats_request, needs_reply_address=True)
+        for address in ("/preset", "/lfo", "/envelope", "/smooth"):
+            self.control.map_osc(address, self.handle_engine_command)
+        for address in ("/post", "/transition"):
+            self.control.map_osc(address, self.handle_engine_command)
+
+        # Frame timing is recorded every frame; printing and logging happen on a reporter thread
+        self.frame_stats = FrameStats(target_fps=target_fps)
+        self.stats_reporter = StatsReporter(
+            self.frame_stats,
+            interval=self.argv.stats_interval if self.argv else 1.0,
+            log_path=self.argv.stats_log if self.argv else None,
+            status=self.status_lines,
+        )
+
+        self.control.map_osc("/midi/learn", self.handle_midi_learn)
+        self.control.map_midi(self.handle_midi)
+
+        # MIDI controllers drive parameters directly; mappings persist in a profile
+        self.midi_mapper = MidiMapper(self.params, self.control.commands,
+                                      self.argv.midi_profile if self.argv else MIDI_PROFILE)
+        self.last_param = None
 
-        # Start OSC server in background thread
-        self._osc_thread = threading.Thread(target=self.control.start_osc_server, daemon=True)
-        self._osc_thread.start()
-        
-        # Queue for parameter updates
-        self.param_queue = queue.Queue()
-        
         print("=== MACROVERSE SHADER CONTROLS ===")
         print("Available Shaders:")
         for i, scene in enumerate(self.scenes):
             print(f"  {i+1}. {scene}")
         print("\nKeyboard Controls:")
         print("  1-6: Switch shaders")
-        print("  Q/A: Time scale (±0.1)")
-        print("  W/S: Audio sensitivity (±0.1)")
-        print("  E/D: Zoom (±0.1)")
-        print("  R/F: Brightness (±0.1)")
-        print("  T/G: Ripple frequency (±2.0)")
-        print("  Y/H: Ripple speed (±0.2)")
-        print("  U/J: Red color (±0.05)")
-        print("  I/K: Green color (±0.05)")
-        print("  O/L: Blue color (±0.05)")
-        print("  P/;: Particle count (±10)")
-        print("  [/]: Particle speed (±0.01)")
+        for param in self.params.params:
+            if param.keys:
+                up, down = (KEY_LABELS.get(k, k) for k in param.keys)
+                print(f"  {up}/{down}: {param.label} (±{param.step})")
+        print("  M: MIDI learn for the last adjusted parameter (Shift+M: 14-bit)")
         print("  ESC: Quit")
         print("===============================\n")
+        # Every input the frames apply is logged, for replay with `scene_player.py replay`
+        self.recorder = None
+        if self.argv and self.argv.record is not None:
+            path = self.argv.record or session_path()
+            self.recorder = SessionRecorder(path, self.session_header())
+            print(f"Recording session to {path}")
+        self.stats_reporter.start()
+        self.startup_trace.mark('setup')
+
+    @classmethod
+    def add_arguments(cls, parser):
+        parser.add_argument('--audio', default='synthetic',
+                            help="Audio source: 'synthetic', 'live' or a path to a WAV file")
+        parser.add_argument('--target-fps', type=float, default=60.0,
+                            help="Lower the internal resolution to hold this frame rate (0 = fixed scale)")
+        parser.add_argument('--render-scale', type=float, default=1.0,
+                            help="Internal resolution as a fraction of the window (starting value when adaptive)")
+        parser.add_argument('--stats-log', help="Append frame timing statistics to this JSON-lines file")
+        parser.add_argument('--stats-interval', type=float, default=1.0,
+                            help="Seconds between status and frame statistics reports")
+        parser.add_argument('--midi-profile', default=MIDI_PROFILE, help="JSON file of MIDI mappings")
+        parser.add_argument('--smoothing', choices=SMOOTHING, default='exp',
+                            help="How parameters glide to new values")
+        parser.add_argument('--smooth-time', type=float, default=0.1, help="Smoothing time constant in seconds")
+        parser.add_argument('--quality', choices=('auto',) + QUALITY_TIERS, default='auto',
+                            help="Shader quality tier; 'auto' measures each scene once per machine")
+        parser.add_argument('--transition', type=float, default=1.0,
+                            help="Seconds to crossfade between scenes (0 = cut)")
+        parser.add_argument('--trails', type=float, default=0.0, help="Motion trail persistence, 0-0.99 (0 = off)")
+        parser.add_argument('--bloom', type=float, default=0.0, help="Glow strength around bright areas (0 = off)")
+        parser.add_argument('--no-bus', action='store_true',
+                            help="Do not share parameters with control processes through shared memory")
+        parser.add_argument('--record', nargs='?', const='', metavar='PATH',
+                            help="Log every input to a session file (default: sessions/session-<time>.mvlog)")
+        parser.add_argument('--replay', metavar='PATH', help="Drive the visualizer from a recorded session log")
+        parser.add_argument('--replay-speed', choices=('realtime', 'max'), default='realtime',
+                            help="Replay at the recorded frame times or as fast as possible")
+        parser.add_argument('--broadcast', nargs='?', type=int, const=0, metavar='PORT',
+                            help="Send parameters, scene and audio bands to browsers over a WebSocket (default port 8765)")
+        parser.add_argument('--share-frames', nargs='?', const=FRAME_RING_NAME, metavar='NAME',
+                            help="Publish rendered frames to shared memory for other local processes")
+
+    def session_header(self):
+        audio = self.audio_processor
+        return {
+            'started': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'scenes': self.scenes,
+            'size': list(self.wnd.buffer_size),
+            'audio': {'source': self.argv.audio if self.argv else None,
+                      'chunk_size': audio.chunk_size, 'rate': audio.rate},
+            'args': {name: getattr(self.argv, name) for name in RECORDED_ARGS} if self.argv else {},
+        }
 
     def load_scenes(self):
-        shader_dir = os.path.join('..', 'shaders')
-        return [f for f in os.listdir(shader_dir) if f.endswith('.glsl')]
+        return list_scenes(self.programs.shader_dir)
+
+    def set_start_tier(self, name):
+        """
+        Set the tier `name` is shown at: fixed by --quality, remembered for
+        this machine, or low until measured. Returns True if it needs measuring.
+        """
+        source = self.programs.sources.get(name)
+        if source is None or not source.has_tiers:
+            return False
+        tier = self.quality if self.quality != 'auto' else self.quality_profile.get(name, source.digest)
+        self.programs.set_quality(name, tier or QUALITY_TIERS[0])
+        return tier is None
+
+    def choose_quality(self, name):
+        """Set the tier of a scene about to be shown, queueing a measurement if it has none yet"""
+        if self.set_start_tier(name) and name not in self.pending_quality:
+            self.pending_quality.append(name)
+
+    def prepare_scene(self, scene, size):
+        self.binding_plan(scene).bind_frame(self.clock, size, self.audio_processor.get_snapshot(), self.audio_texture)
 
     def load_scene(self, shader_name):
-        self.prog = self.load_program(
-            vertex_shader=os.path.join('..', 'shaders', 'default.vert'),
-            fragment_shader=os.path.join('..', 'shaders', shader_name)
-        )
-        self.quad_fs = mglw.geometry.quad_fs()
+        outgoing = self.scene
+        try:
+            self.choose_quality(shader_name)
+            self.scene = self.programs.get(shader_name)
+        except moderngl.Error as e:
+            logging.warning(f"Could not load {shader_name}: {e}")
+            return
+        self.prog = self.scene.program
+        if outgoing is not None and outgoing is not self.scene and self.transition_time > 0:
+            self.outgoing_scene = outgoing
+            self.transition_start = self.clock
+        self.pin_scenes()
+
+    def pin_scenes(self):
+        """Keep the programs being drawn from being evicted by later compiles"""
+        self.programs.pin(scene.key for scene in (self.scene, self.outgoing_scene) if scene is not None)
+
+    def finish_startup(self):
+        """
+        Called after each of the first frames until startup is complete:
+        services start in the background once the first frame is drawn, and
+        the trace is printed when everything is up.
+        """
+        trace = self.startup_trace
+        if self.startup_thread is None:
+            trace.mark('first frame')
+            self.startup_thread = threading.Thread(target=self.start_services, name='startup', daemon=True)
+            self.startup_thread.start()
+        elif not self.startup_thread.is_alive():
+            print(trace.format())
+            self.startup_trace = None
+
+    def start_services(self):
+        # OSC and MIDI are received on the control thread's event loop; a replay takes no live input
+        if not self.replay:
+            with self.startup_trace.timed('osc'):
+                self.control.start()
+        # Other processes (the control panel) write parameters and scene changes into shared memory
+        if not (self.argv and self.argv.no_bus) and not self.replay:
+            with self.startup_trace.timed('param bus'):
+                self.param_bus = open_bus(owner=True)
+        # Finished frames go to shared memory for compositors and recorders on this machine
+        if self.argv and self.argv.share_frames:
+            with self.startup_trace.timed('frame ring'):
+                width, height = self.wnd.buffer_size
+                ring = open_frame_ring(self.argv.share_frames, (max(width, 1920), max(height, 1080)))
+                if ring:
+                    self.frame_publisher = FramePublisher(self.ctx, ring)
+        # Parameters, scene and audio bands go to the browser visualizer (js/main.js)
+        if self.argv and self.argv.broadcast is not None:
+            with self.startup_trace.timed('broadcast'):
+                # Imported here: its asyncio server is not needed for the first frame
+                from state_broadcast import BROADCAST_PORT, StateBroadcaster
+                broadcaster = StateBroadcaster(self.params, self.scenes, self.audio_processor.features.n_bands,
+                                               port=self.argv.broadcast or BROADCAST_PORT)
+                if broadcaster.start():
+                    self.broadcaster = broadcaster
+        # Last, as it may read the whole audio file: a file analyzed live for want of its hash may have a table
+        if isinstance(getattr(self.audio_processor, 'source', None), WavFileSource):
+            with self.startup_trace.timed('audio cache'):
+                self.pending_audio = open_cached(self.argv.audio, loop=True)
+
+    def switch_audio(self):
+        """Hand over from live analysis of the audio file to its table, at the same point in the track"""
+        cached, self.pending_audio = self.pending_audio, None
+        live = self.audio_processor
+        cached.start(live.get_snapshot().sample_index / live.rate)
+        self.audio_processor = cached
+        # Joining the analysis thread can take a hop; not on the render thread
+        threading.Thread(target=live.stop, name='audio-stop', daemon=True).start()
+        print(f"Audio features from {cached.path}")
+
+    def measure_quality(self):
+        """One draw towards the pending quality measurements; switches the scene's tier once one is done"""
+        selector = self.quality_selector
+        if selector.name is None:
+            selector.start(self.pending_quality[0])
+        name = selector.name
+        size = self.wnd.buffer_size
+        try:
+            result = selector.step(size, self.prepare_scene)
+        except moderngl.Error as e:
+            logging.warning(f"Could not measure quality of {name}: {e}")
+            self.pending_quality.remove(name)
+            selector.cancel()
+            return
+        if result is None:
+            return
+        tier, timings = result
+        self.pending_quality.remove(name)
+        self.quality_profile.set(name, self.programs.sources[name].digest, tier, timings, size)
+        print(f"Quality for {name}: {tier} (" + ', '.join(f"{t} {ms:.1f} ms" for t, ms in timings.items()) + ")")
+        self.programs.set_quality(name, tier)
+        if self.scene is not None and self.scene.key[0] == name:
+            # Swap in the chosen tier without a transition
+            self.scene = self.programs.get(name)
+            self.prog = self.scene.program
+            self.pin_scenes()
+
+    def create_render_graph(self):
+        graph = RenderGraph(self.ctx, self.programs)
+        graph.add(Pass('scene', lambda textures, size: self.draw_scene(self.scene, size)))
+        graph.add(Pass('outgoing', lambda textures, size: self.draw_scene(self.outgoing_scene, size)))
+        graph.add(Pass('transition', PostShader(self.ctx, self.programs, 'crossfade.glsl',
+                                                lambda: {'u_mix': self.transition_progress()}),
+                       inputs={'u_from': 'outgoing', 'u_to': 'scene'}, bypass='u_to'))
+        # Half floats so slow fades do not stall on 8-bit rounding
+        graph.add(Pass('trails', PostShader(self.ctx, self.programs, 'trails.glsl',
+                                            lambda: {'u_decay': min(self.post['trails'], 0.99)}),
+                       inputs={'u_frame': 'transition', 'u_previous': previous('trails')},
+                       dtype='f2', feedback=True, bypass='u_frame'))
+        graph.add(Pass('bright', PostShader(self.ctx, self.programs, 'bloom_extract.glsl',
+                                            lambda: {'u_threshold': 0.6}),
+                       inputs={'u_frame': 'trails'}, scale=0.5))
+        graph.add(Pass('bloom', PostShader(self.ctx, self.programs, 'bloom.glsl',
+                                           lambda: {'u_strength': self.post['bloom']}),
+                       inputs={'u_frame': 'trails', 'u_bright': 'bright'}, bypass='u_frame'))
+        return graph
+
+    def transition_progress(self):
+        if self.outgoing_scene is None:
+            return 1.0
+        return min((self.clock - self.transition_start) / self.transition_time, 1.0)
+
+    def update_render_graph(self):
+        """Switch passes on and off for this frame; the graph culls whatever is not needed"""
+        if self.outgoing_scene is not None and self.transition_progress() >= 1.0:
+            self.outgoing_scene = None
+            self.pin_scenes()
+        passes = self.render_graph.passes
+        passes['scene'].enabled = self.scene is not None
+        passes['outgoing'].enabled = self.outgoing_scene is not None
+        passes['transition'].enabled = self.outgoing_scene is not None
+        passes['trails'].enabled = self.post['trails'] > 0
+        passes['bloom'].enabled = self.post['bloom'] > 0
+
+    def draw_scene(self, scene, size):
+        self.ctx.clear(0.0, 0.0, 0.0)
+        # Uniform lookups are resolved once per program; only changed parameters are uploaded
+        plan = self.binding_plan(scene)
+        plan.bind_frame(self.clock, size, self.snapshot, self.audio_texture)
+        self.frame_stats.lap('upload')
+        scene.render()
+        if scene.key[0] == PARTICLE_SCENE:
+            self.particle_renderer.draw(self.particles, self.clock, size, self.snapshot, self.audio_texture)
+
+    def binding_plan(self, scene):
+        if scene.binding is None:
+            scene.binding = BindingPlan(scene.program, self.params, self.param_ubo)
+        return scene.binding
+
+    def apply_shader_changes(self):
+        """Install edited and new shaders. Called at the frame boundary, before drawing."""
+        changes = self.shader_watcher.poll()
+        if not changes:
+            return
+        # Stale programs are released below; do not keep drawing one that is fading out
+        self.outgoing_scene = None
+        self.pin_scenes()
+        current = self.scenes[self.current_scene_index] if self.scenes else None
+        reload_current = False
+        for source in changes:
+            if source.error:
+                continue
+            is_new = self.programs.update_source(source)
+            # An edited scene's tier is measured again; until then it is shown and warmed at its start tier
+            if source.name == current:
+                self.choose_quality(source.name)
+            else:
+                self.set_start_tier(source.name)
+            if is_new:
+                self.scenes.append(source.name)
+                print(f"New shader {len(self.scenes)}: {source.name}")
+            elif source.name in (current, VERTEX_SHADER):
+                reload_current = True
+            else:
+                print(f"Updated shader: {source.name}")
+
+        if reload_current and current:
+            # The last program keeps drawing until the new one is compiled
+            self.pending_reload = current
+            self.reload_requested = perf_counter()
+        self.programs.discard_stale(keep=self.scene.key if self.scene else None)
+
+    def reload_scene(self):
+        """Compile the edited scene being shown and swap it in"""
+        name, self.pending_reload = self.pending_reload, None
+        if not self.scenes or self.scenes[self.current_scene_index] != name:
+            return  # switched away meanwhile; it is compiled when shown again
+        try:
+            scene = self.programs.get(name)
+        except moderngl.Error as e:
+            self.programs.sources[name].error = str(e)
+            logging.error(f"Reload of {name} failed, keeping the last good program:\n{e}")
+            return
+        self.scene = scene
+        self.prog = scene.program
+        self.pin_scenes()
+        self.programs.discard_stale(keep=scene.key)
+        print(f"Reloaded {name} ({scene.compile_time * 1000:.1f} ms)")
 
     def handle_scene_change(self, address, *args):
+        # OSC handlers run on server threads: queue the change for the render thread
         if args and isinstance(args[0], int):
-            self.current_scene_index = args[0] % len(self.scenes)
-            self.load_scene(self.scenes[self.current_scene_index])
-            print(f"Switched to scene: {self.scenes[self.current_scene_index]}")
+            self.control.commands.push('scene', args[0])
 
     def handle_param_change(self, address, *args):
         """Handle OSC parameter changes"""
-        if len(args) >= 2:
-            param_name = str(args[0])
-            param_value = float(args[1])
-            if param_name in self.shader_params:
-                self.shader_params[param_name] = param_value
-                print(f"Parameter updated: {param_name} = {param_value}")
+        if len(args) >= 2 and str(args[0]) in self.params:
+            try:
+                self.control.commands.set_param(str(args[0]), float(args[1]))
+            except (TypeError, ValueError):
+                pass
+
+    def handle_midi(self, msg):
+        if self.recorder:
+            self.recorder.record(MIDI, bytes(msg.bytes()))
+        if not self.midi_mapper.handle(msg):
+            self.control.commands.push('midi', msg)
+
+    def handle_midi_learn(self, address, *args):
+        """/midi/learn <param> [14bit]: map the next MIDI control that moves"""
+        if args and str(args[0]) in self.params:
+            self.midi_mapper.learn(str(args[0]), len(args) > 1 and bool(args[1]))
+
+    def handle_engine_command(self, address, *args):
+        self.control.commands.push(address.strip('/'), *args)
+
+    def apply_engine_command(self, command, args):
+        """
+        /preset <name> [seconds]
+        /lfo <param> <depth> <rate Hz> [sine|triangle|square]
+        /envelope <param> <depth> [attack] [decay]
+        /smooth <param> <none|exp|critical> [time] [max rate per second]
+        """
+        if command == 'preset':
+            self.engine.morph(PRESETS[args[0]], float(args[1]) if len(args) > 1 else 2.0)
+        elif command == 'lfo':
+            shape = args[3] if len(args) > 3 else 'sine'
+            if shape not in SHAPES:
+                raise ValueError(f"unknown LFO shape {shape!r}")
+            self.engine.lfo(args[0], float(args[1]), float(args[2]), shape)
+        elif command == 'envelope':
+            self.engine.trigger(args[0], float(args[1]), *(float(a) for a in args[2:4]))
+        elif command == 'smooth':
+            if args[1] not in SMOOTHING:
+                raise ValueError(f"unknown smoothing {args[1]!r}")
+            self.engine.configure(args[0], args[1], *(float(a) for a in args[2:4]))
+
+    def apply_post_command(self, command, args):
+        """
+        /post <trails|bloom> <amount>
+        /transition <seconds>
+        """
+        if command == 'post':
+            if args[0] not in self.post:
+                raise ValueError(f"unknown effect {args[0]!r}")
+            self.post[args[0]] = max(float(args[1]), 0.0)
+        else:
+            self.transition_time = max(float(args[0]), 0.0)
+
+    def apply_commands(self):
+        """Apply queued control changes. Called once per frame on the render thread."""
+        commands, params = self.control.commands.drain()
+        if commands or params:
+            self.apply_command_batch(commands, params)
+
+    def apply_command_batch(self, commands, params):
+        if self.recorder:
+            # Unmapped MIDI is only printed; the raw messages are logged as they arrive
+            self.recorder.record_json(COMMANDS, {'commands': [c for c in commands if c[0] != 'midi'],
+                                                 'params': params})
+        for command in commands:
+            if command[0] == 'scene' and self.scenes:
+                self.current_scene_index = command[1] % len(self.scenes)
+                self.load_scene(self.scenes[self.current_scene_index])
+                print(f"Switched to scene: {self.scenes[self.current_scene_index]}")
+            elif command[0] == 'midi':
+                print(f"MIDI: {command[1]}")
+            else:
+                apply = self.apply_post_command if command[0] in ('post', 'transition') else self.apply_engine_command
+                try:
+                    apply(command[0], command[1:])
+                except (IndexError, KeyError, TypeError, ValueError) as e:
+                    logging.warning(f"Ignoring /{command[0]} {command[1:]}: {e}")
+        for name, value in params.items():
+            self.engine.set(name, value)
+
+    def apply_bus(self):
+        """Pick up parameters and scene changes written by other processes"""
+        changed, scene = self.param_bus.poll()
+        if changed or scene:
+            self.apply_bus_changes(changed, scene)
+
+    def apply_bus_changes(self, changed, scene):
+        if self.recorder:
+            self.recorder.record_json(BUS, {'params': changed, 'scene': scene})
+        for name, value in changed.items():
+            self.engine.set(name, value)
+        if scene:
+            name = scene if scene.endswith('.glsl') else scene + '.glsl'
+            if name in self.scenes:
+                self.current_scene_index = self.scenes.index(name)
+                self.load_scene(name)
+                print(f"Switched to scene: {name}")
+            else:
+                logging.warning(f"Unknown scene from control panel: {scene}")
+
+    def handle_stats_request(self, client_address, address, *args):
+        """Reply to /stats with /stats/frames (count, dropped, fps) and /stats/<stage> (p50, p95, p99 ms)"""
+        summary = self.frame_stats.summary()
+        self.control.reply(client_address, "/stats/frames", summary['frames'], summary['dropped'],
+                           float(summary.get('fps', 0.0)))
+        self.control.reply(client_address, "/stats/control", *self.control.commands.stats().values())
+        for stage in STAGES:
+            if stage in summary:
+                self.control.reply(client_address, f"/stats/{stage}", *(float(v) for v in summary[stage].values()))
+
+    def status_lines(self):
+        current_shader = self.scenes[self.current_scene_index] if self.scenes else "None"
+        p = self.params
+        return [
+            f"[{current_shader}] Time:{p['time_scale']:.1f} Audio:{p['audio_sensitivity']:.1f} Zoom:{p['zoom']:.1f} Brightness:{p['brightness']:.1f} Scale:{self.render_scale:.2f}",
+            f"  RGB:({p['color_r']:.2f},{p['color_g']:.2f},{p['color_b']:.2f}) Ripple:{p['ripple_frequency']:.0f}@{p['ripple_speed']:.1f} Particles:{self.particles.count}/{p['particle_count']:.0f}@{p['particle_speed']:.3f}",
+            "  Control: {received} messages, {coalesced} coalesced, {dropped} dropped".format(**self.control.commands.stats()),
+            f"  Render graph: {self.render_graph.describe()}",
+        ]
 
     def key_event(self, key, action, modifiers):
         """Handle keyboard input for real-time shader control"""
@@ -103,144 +597,144 @@ class Macroverse(mglw.WindowConfig):
             if key >= self.wnd.keys.NUMBER_1 and key <= self.wnd.keys.NUMBER_6:
                 shader_index = key - self.wnd.keys.NUMBER_1
                 if shader_index < len(self.scenes):
-                    self.current_scene_index = shader_index
-                    self.load_scene(self.scenes[self.current_scene_index])
-                    print(f"Switched to shader: {self.scenes[self.current_scene_index]}")
-            
+                    self.apply_key_action(['scene', shader_index])
+
             # Parameter controls
-            elif key == self.wnd.keys.Q:
-                self.shader_params['time_scale'] = min(5.0, self.shader_params['time_scale'] + 0.1)
-                print(f"Time scale: {self.shader_params['time_scale']:.2f}")
-            elif key == self.wnd.keys.A:
-                self.shader_params['time_scale'] = max(0.0, self.shader_params['time_scale'] - 0.1)
-                print(f"Time scale: {self.shader_params['time_scale']:.2f}")
-            
-            elif key == self.wnd.keys.W:
-                self.shader_params['audio_sensitivity'] = min(5.0, self.shader_params['audio_sensitivity'] + 0.1)
-                print(f"Audio sensitivity: {self.shader_params['audio_sensitivity']:.2f}")
-            elif key == self.wnd.keys.S:
-                self.shader_params['audio_sensitivity'] = max(0.0, self.shader_params['audio_sensitivity'] - 0.1)
-                print(f"Audio sensitivity: {self.shader_params['audio_sensitivity']:.2f}")
-                
-            elif key == self.wnd.keys.E:
-                self.shader_params['zoom'] = min(3.0, self.shader_params['zoom'] + 0.1)
-                print(f"Zoom: {self.shader_params['zoom']:.2f}")
-            elif key == self.wnd.keys.D:
-                self.shader_params['zoom'] = max(0.1, self.shader_params['zoom'] - 0.1)
-                print(f"Zoom: {self.shader_params['zoom']:.2f}")
-                
-            elif key == self.wnd.keys.R:
-                self.shader_params['brightness'] = min(3.0, self.shader_params['brightness'] + 0.1)
-                print(f"Brightness: {self.shader_params['brightness']:.2f}")
-            elif key == self.wnd.keys.F:
-                self.shader_params['brightness'] = max(0.1, self.shader_params['brightness'] - 0.1)
-                print(f"Brightness: {self.shader_params['brightness']:.2f}")
-                
-            elif key == self.wnd.keys.T:
-                self.shader_params['ripple_frequency'] = min(50.0, self.shader_params['ripple_frequency'] + 2.0)
-                print(f"Ripple frequency: {self.shader_params['ripple_frequency']:.1f}")
-            elif key == self.wnd.keys.G:
-                self.shader_params['ripple_frequency'] = max(1.0, self.shader_params['ripple_frequency'] - 2.0)
-                print(f"Ripple frequency: {self.shader_params['ripple_frequency']:.1f}")
-                
-            elif key == self.wnd.keys.Y:
-                self.shader_params['ripple_speed'] = min(10.0, self.shader_params['ripple_speed'] + 0.2)
-                print(f"Ripple speed: {self.shader_params['ripple_speed']:.2f}")
-            elif key == self.wnd.keys.H:
-                self.shader_params['ripple_speed'] = max(0.1, self.shader_params['ripple_speed'] - 0.2)
-                print(f"Ripple speed: {self.shader_params['ripple_speed']:.2f}")
-                
-            # Color controls
-            elif key == self.wnd.keys.U:
-                self.shader_params['color_r'] = min(1.0, self.shader_params['color_r'] + 0.05)
-                print(f"Red: {self.shader_params['color_r']:.2f}")
-            elif key == self.wnd.keys.J:
-                self.shader_params['color_r'] = max(0.0, self.shader_params['color_r'] - 0.05)
-                print(f"Red: {self.shader_params['color_r']:.2f}")
-                
-            elif key == self.wnd.keys.I:
-                self.shader_params['color_g'] = min(1.0, self.shader_params['color_g'] + 0.05)
-                print(f"Green: {self.shader_params['color_g']:.2f}")
-            elif key == self.wnd.keys.K:
-                self.shader_params['color_g'] = max(0.0, self.shader_params['color_g'] - 0.05)
-                print(f"Green: {self.shader_params['color_g']:.2f}")
-                
-            elif key == self.wnd.keys.O:
-                self.shader_params['color_b'] = min(1.0, self.shader_params['color_b'] + 0.05)
-                print(f"Blue: {self.shader_params['color_b']:.2f}")
-            elif key == self.wnd.keys.L:
-                self.shader_params['color_b'] = max(0.0, self.shader_params['color_b'] - 0.05)
-                print(f"Blue: {self.shader_params['color_b']:.2f}")
-                
-            # Particle controls
-            elif key == self.wnd.keys.P:
-                self.shader_params['particle_count'] = min(500.0, self.shader_params['particle_count'] + 10.0)
-                print(f"Particle count: {self.shader_params['particle_count']:.0f}")
-            elif key == self.wnd.keys.SEMICOLON:
-                self.shader_params['particle_count'] = max(10.0, self.shader_params['particle_count'] - 10.0)
-                print(f"Particle count: {self.shader_params['particle_count']:.0f}")
-                
-            elif key == self.wnd.keys.BRACKET_LEFT:
-                self.shader_params['particle_speed'] = min(1.0, self.shader_params['particle_speed'] + 0.01)
-                print(f"Particle speed: {self.shader_params['particle_speed']:.3f}")
-            elif key == self.wnd.keys.BRACKET_RIGHT:
-                self.shader_params['particle_speed'] = max(0.01, self.shader_params['particle_speed'] - 0.01)
-                print(f"Particle speed: {self.shader_params['particle_speed']:.3f}")
-                
+            elif key in self.key_bindings:
+                self.apply_key_action(['nudge', *self.key_bindings[key]])
+
+            elif key == self.wnd.keys.M:
+                if self.last_param:
+                    self.midi_mapper.learn(self.last_param, fourteen_bit=modifiers.shift)
+                else:
+                    print("MIDI learn: adjust a parameter with its keys first")
+
             elif key == self.wnd.keys.ESCAPE:
                 print("Exiting Macroverse...")
                 self.wnd.close()
 
+    def apply_key_action(self, action):
+        """What a key press does, as ['scene', index] or ['nudge', param, direction]"""
+        if self.recorder:
+            self.recorder.record_json(KEY, action)
+        if action[0] == 'scene':
+            self.current_scene_index = action[1]
+            self.load_scene(self.scenes[self.current_scene_index])
+            print(f"Switched to shader: {self.scenes[self.current_scene_index]}")
+        else:
+            name, direction = action[1:]
+            value = self.engine.nudge(name, direction)
+            self.last_param = name
+            param = self.params.param(name)
+            print(f"{param.label}: {value:{param.fmt}}")
+
     def on_render(self, time: float, frametime: float):
-        self.ctx.clear(0.0, 0.0, 0.0)  # Black background
-
-        fft_data = self.audio_processor.get_fft_data()
-        audio_level = (sum(fft_data) / len(fft_data) / 10000) * self.shader_params['audio_sensitivity']
-
-        if self.prog and self.quad_fs:
-            # Pass all shader parameters as uniforms
-            self.prog['u_time'] = time * self.shader_params['time_scale']
-            self.prog['u_resolution'] = self.window_size
-            self.prog['u_audio'] = audio_level
-            
-            # Additional parameters for enhanced control
-            if 'u_zoom' in self.prog:
-                self.prog['u_zoom'] = self.shader_params['zoom']
-            if 'u_brightness' in self.prog:
-                self.prog['u_brightness'] = self.shader_params['brightness']
-            if 'u_color_r' in self.prog:
-                self.prog['u_color_r'] = self.shader_params['color_r']
-            if 'u_color_g' in self.prog:
-                self.prog['u_color_g'] = self.shader_params['color_g']
-            if 'u_color_b' in self.prog:
-                self.prog['u_color_b'] = self.shader_params['color_b']
-            if 'u_ripple_frequency' in self.prog:
-                self.prog['u_ripple_frequency'] = self.shader_params['ripple_frequency']
-            if 'u_ripple_speed' in self.prog:
-                self.prog['u_ripple_speed'] = self.shader_params['ripple_speed']
-            if 'u_particle_count' in self.prog:
-                self.prog['u_particle_count'] = self.shader_params['particle_count']
-            if 'u_particle_speed' in self.prog:
-                self.prog['u_particle_speed'] = self.shader_params['particle_speed']
-
-            self.quad_fs.render(self.prog)
-
-        # Handle any pending MIDI messages
-        for msg in self.control.get_midi_messages():
-            print(f"MIDI: {msg}")
-            
-        # Display current parameters in terminal (every 60 frames)
-        if hasattr(self, 'frame_count'):
-            self.frame_count += 1
+        if self.replay:
+            frame = self.replay.next_frame()
+            if frame is None:
+                self.finish_replay()
+                return
+        stats = self.frame_stats
+        stats.begin_frame()
+        self.apply_shader_changes()
+        if self.replay:
+            # Recorded inputs in the order they were applied, then the recorded clock
+            inputs, time, frametime = frame
+            for kind, value in inputs:
+                if kind == KEY:
+                    self.apply_key_action(value)
+                elif kind == COMMANDS:
+                    self.apply_command_batch(value['commands'], value['params'])
+                elif kind == BUS:
+                    self.apply_bus_changes(value['params'], value['scene'])
+        else:
+            self.apply_commands()
+            if self.param_bus:
+                self.apply_bus()
+        self.engine.step(frametime)
+        stats.lap('control')
+
+        self.clock = time
+        self.update_render_graph()
+        window_size = self.wnd.buffer_size
+        resolution = self.render_target.begin(self.wnd.fbo, window_size, self.render_scale)
+        stats.lap('draw')
+
+        # Analysis runs on its own thread; this only picks up the latest snapshot
+        if self.pending_audio:
+            self.switch_audio()
+        self.snapshot = self.audio_processor.get_snapshot()
+        self.audio_texture.update(self.snapshot)
+        if self.broadcaster:
+            self.broadcaster.publish(time, self.current_scene_index, self.snapshot)
+        if self.recorder:
+            self.recorder.record_frame(time, frametime, self.snapshot)
+        stats.lap('audio')
+
+        if any(scene is not None and scene.key[0] == PARTICLE_SCENE for scene in (self.scene, self.outgoing_scene)):
+            self.particles.step(frametime, self.params, self.snapshot)
+            stats.lap('particles')
+
+        with self.gpu_timer:
+            self.render_graph.execute('bloom', self.render_target.target, resolution)
+        self.render_target.end(self.wnd.fbo, window_size)
+        if self.frame_publisher:
+            self.frame_publisher.publish(self.wnd.fbo, window_size)
+        stats.lap('draw')
+
+        gpu_ms = self.gpu_timer.elapsed_ms()
+        if self.resolution_controller and gpu_ms is not None:
+            if self.resolution_controller.update(gpu_ms, frametime * 1000):
+                self.render_scale = self.resolution_controller.scale
+                w, h = self.render_target.resolution(window_size, self.render_scale)
+                print(f"Render scale {self.render_scale:.2f} ({w}x{h}, frame {frametime * 1000:.1f} ms)")
+
+        # Frames that finished inside the budget recompile an edited scene, measure quality tiers,
+        # then compile the scenes not shown yet
+        if self.startup_trace is not None:
+            self.finish_startup()
         else:
-            self.frame_count = 0
-            
-        if self.frame_count % 60 == 0:  # Update display every second (at 60fps)
-            current_shader = self.scenes[self.current_scene_index] if self.scenes else "None"
-            r, g, b = self.shader_params['color_r'], self.shader_params['color_g'], self.shader_params['color_b']
-            particles = self.shader_params['particle_count']
-            print(f"[{current_shader}] Time:{self.shader_params['time_scale']:.1f} Audio:{self.shader_params['audio_sensitivity']:.1f} Zoom:{self.shader_params['zoom']:.1f} Brightness:{self.shader_params['brightness']:.1f}")
-            print(f"  RGB:({r:.2f},{g:.2f},{b:.2f}) Ripple:{self.shader_params['ripple_frequency']:.0f}@{self.shader_params['ripple_speed']:.1f} Particles:{particles:.0f}@{self.shader_params['particle_speed']:.3f}")
+            spare = stats.spare_ms(gpu_ms)
+            idle = spare is None or spare > 0
+            if self.pending_reload and (idle or perf_counter() - self.reload_requested > RELOAD_WAIT):
+                self.reload_scene()
+            elif idle and self.pending_quality:
+                self.measure_quality()
+            elif idle:
+                self.programs.warm_up()
+            stats.skip()
+        stats.end_frame(gpu_ms)
+
+    def finish_replay(self):
+        elapsed = perf_counter() - self.replay_started
+        frames = self.replay.frames
+        print(f"Replayed {frames} frames in {elapsed:.1f} s ({frames / max(elapsed, 1e-6):.1f} fps)")
+        print(format_summary(self.frame_stats.summary()))
+        self.replay = None
+        self.wnd.close()
+
+    def on_resize(self, width: int, height: int):
+        self.render_target.resize()
+
+    def on_close(self):
+        if self.startup_thread is not None:
+            self.startup_thread.join(timeout=5.0)
+        self.control.stop()
+        self.stats_reporter.stop()
+        self.shader_watcher.stop()
+        self.audio_processor.stop()
+        self.render_graph.release()
+        self.particle_renderer.release()
+        self.quality_selector.release()
+        if self.param_bus:
+            self.param_bus.close()
+        if self.frame_publisher:
+            self.frame_publisher.close()
+        if self.broadcaster:
+            self.broadcaster.stop()
+        if self.recorder:
+            self.recorder.close()
+            print(f"Recorded {self.recorder.records} records ({self.recorder.bytes / 1e6:.2f} MB) to {self.recorder.path}")
 
     @classmethod
     def run(cls):
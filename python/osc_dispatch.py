@@ -0,0 +1,38 @@
+from pythonosc import dispatcher
+
+_PATTERN_CHARS = frozenset('*?[]{}')
+
+
+class BatchingDispatcher(dispatcher.Dispatcher):
+    """
+    Queues all messages of one OSC packet, bundles included, as a single
+    batch. Literal addresses are looked up in a table resolved ahead of time
+    instead of being matched as patterns against every mapping per message.
+    """
+
+    def __init__(self, commands, table_size=1024):
+        super().__init__()
+        self.commands = commands
+        self.table_size = table_size
+        self._table = {}
+
+    def map(self, address, handler, *args, needs_reply_address=False):
+        handler = super().map(address, handler, *args, needs_reply_address=needs_reply_address)
+        self._table.clear()
+        for mapped in self._map:
+            if not _PATTERN_CHARS.intersection(mapped):
+                self._table[mapped] = list(super().handlers_for_address(mapped))
+        return handler
+
+    def handlers_for_address(self, address_pattern):
+        handlers = self._table.get(address_pattern)
+        if handlers is not None:
+            return handlers
+        handlers = list(super().handlers_for_address(address_pattern))
+        if len(self._table) < self.table_size and not _PATTERN_CHARS.intersection(address_pattern):
+            self._table[address_pattern] = handlers
+        return handlers
+
+    def call_handlers_for_packet(self, data, client_address):
+        with self.commands.batch():
+            return super().call_handlers_for_packet(data, client_address)
@@ -0,0 +1,199 @@
+import logging
+import os
+import tempfile
+import zlib
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from parameters import PARAMS
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are not serialized, use one control process
+    fcntl = None
+
+BUS_NAME = 'macroverse_params'
+MAGIC = 0x4D565042  # 'MVPB'
+SCENE_NAME_BYTES = 64
+
+# Fixed layout: header, then the float32 values and a change counter per parameter
+_SEQ = 8
+_SCENE_SEQ = 16
+_SCENE_NAME = 24
+_VALUES = _SCENE_NAME + SCENE_NAME_BYTES
+
+
+def untrack(shm):
+    # The resource tracker would destroy the block for every process as soon
+    # as the one that opened it exits; the bus owner removes it explicitly
+    try:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:
+        pass
+
+
+def layout_id(params=PARAMS):
+    """Identifies the parameter layout so mismatched versions refuse to attach"""
+    return zlib.crc32(','.join(p.name for p in params).encode('ascii'))
+
+
+class ParamBus:
+    """
+    Parameter values shared between processes through one shared memory
+    block. Control processes write with set()/update()/set_scene(); the
+    renderer calls poll() every frame, which only reads memory. A sequence
+    counter that is odd while a write is in progress (a seqlock) lets the
+    reader detect and retry torn reads without any locking on its side.
+    Per-parameter change counters tell the reader which values were written
+    so it does not overwrite changes made through other inputs.
+    """
+
+    def __init__(self, shm, params=PARAMS, owner=False):
+        self.shm = shm
+        self.params = params
+        self.owner = owner
+        self.index = {p.name: i for i, p in enumerate(params)}
+        n = len(params)
+        buf = shm.buf
+        self.header = np.ndarray(2, dtype=np.uint32, buffer=buf, offset=0)
+        self.seq = np.ndarray(1, dtype=np.uint64, buffer=buf, offset=_SEQ)
+        self.scene_seq = np.ndarray(1, dtype=np.uint32, buffer=buf, offset=_SCENE_SEQ)
+        self.scene_name = np.ndarray(SCENE_NAME_BYTES, dtype=np.uint8, buffer=buf, offset=_SCENE_NAME)
+        self.values = np.ndarray(n, dtype=np.float32, buffer=buf, offset=_VALUES)
+        self.counters = np.ndarray(n, dtype=np.uint32, buffer=buf, offset=_VALUES + 4 * n)
+        self._seen = self.counters.copy()
+        self._scene_seen = int(self.scene_seq[0])
+        self._snapshot = np.zeros(n, dtype=np.float32)
+        self._counts = np.zeros(n, dtype=np.uint32)
+        self._lock_path = os.path.join(tempfile.gettempdir(), f'{shm.name.lstrip("/")}.lock')
+
+    @staticmethod
+    def size(params=PARAMS):
+        return _VALUES + 8 * len(params)
+
+    @classmethod
+    def create(cls, name=BUS_NAME, params=PARAMS):
+        shm = shared_memory.SharedMemory(name=name, create=True, size=cls.size(params))
+        untrack(shm)
+        bus = cls(shm, params, owner=True)
+        bus.values[:] = [p.default for p in params]
+        bus.header[:] = (MAGIC, layout_id(params))
+        return bus
+
+    @classmethod
+    def attach(cls, name=BUS_NAME, params=PARAMS):
+        shm = shared_memory.SharedMemory(name=name)
+        untrack(shm)
+        header = np.ndarray(2, dtype=np.uint32, buffer=shm.buf, offset=0)
+        if shm.size < cls.size(params) or tuple(header) != (MAGIC, layout_id(params)):
+            del header
+            shm.close()
+            raise ValueError(f"Shared memory {name!r} has a different parameter layout")
+        del header
+        return cls(shm, params)
+
+    @classmethod
+    def open(cls, name=BUS_NAME, params=PARAMS, owner=False):
+        """
+        Attach to the bus, creating it if no other process has yet. Only the
+        owner (the renderer) removes it on close, so control processes can
+        come and go without taking the bus away.
+        """
+        try:
+            bus = cls.attach(name, params)
+        except FileNotFoundError:
+            try:
+                bus = cls.create(name, params)
+            except FileExistsError:
+                bus = cls.attach(name, params)
+        bus.owner = owner
+        return bus
+
+    # Writer side
+
+    @contextmanager
+    def _write(self):
+        lock = open(self._lock_path, 'a') if fcntl else None
+        try:
+            if lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            self.seq[0] += 1  # odd: write in progress
+            try:
+                yield
+            finally:
+                self.seq[0] += 1
+        finally:
+            if lock:
+                lock.close()
+
+    def update(self, values):
+        """Write several parameters as one change"""
+        with self._write():
+            for name, value in values.items():
+                i = self.index.get(name)
+                if i is not None:
+                    self.values[i] = value
+                    self.counters[i] += 1
+
+    def set(self, name, value):
+        self.update({name: value})
+
+    def set_scene(self, name):
+        data = name.encode('utf-8')[:SCENE_NAME_BYTES]
+        with self._write():
+            self.scene_name[:] = 0
+            self.scene_name[:len(data)] = np.frombuffer(data, dtype=np.uint8)
+            self.scene_seq[0] += 1
+
+    # Reader side
+
+    def poll(self, retries=100):
+        """
+        Parameters written since the last poll as {name: value}, and the
+        requested scene name if it changed (else None). Never blocks.
+        """
+        for _ in range(retries):
+            start = int(self.seq[0])
+            if start & 1:
+                continue
+            self._snapshot[:] = self.values
+            self._counts[:] = self.counters
+            scene_seq = int(self.scene_seq[0])
+            scene = bytes(self.scene_name) if scene_seq != self._scene_seen else None
+            if int(self.seq[0]) == start:
+                break
+        else:
+            return {}, None  # a writer is mid-update; try again next frame
+
+        changed = {}
+        moved = np.flatnonzero(self._counts != self._seen)
+        if len(moved):
+            self._seen[:] = self._counts
+            changed = {self.params[i].name: float(self._snapshot[i]) for i in moved}
+        if scene is not None:
+            self._scene_seen = scene_seq
+            scene = scene.rstrip(b'\0').decode('utf-8', 'replace')
+        return changed, scene
+
+    def close(self):
+        # The numpy views must go before the mapping can be closed
+        self.header = self.seq = self.scene_seq = self.scene_name = self.values = self.counters = None
+        self.shm.close()
+        if self.owner:
+            try:
+                # unlink() unregisters, so pair it with a registration
+                resource_tracker.register(self.shm._name, 'shared_memory')
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def open_bus(name=BUS_NAME, owner=False):
+    """The shared parameter bus, or None if shared memory is unavailable"""
+    try:
+        return ParamBus.open(name, owner=owner)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Shared parameter bus unavailable: {e}")
+        return None
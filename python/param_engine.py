@@ -0,0 +1,181 @@
+import numpy as np
+
+# Smoothing modes, per parameter
+INSTANT, EXPONENTIAL, CRITICAL = 0, 1, 2
+SMOOTHING = {'none': INSTANT, 'exp': EXPONENTIAL, 'critical': CRITICAL}
+
+# LFO shapes
+SINE, TRIANGLE, SQUARE = 0, 1, 2
+SHAPES = {'sine': SINE, 'triangle': TRIANGLE, 'square': SQUARE}
+
+
+class ParameterEngine:
+    """
+    Moves the values in a ParameterStore towards targets set by keys, OSC,
+    MIDI and presets, once per frame. Every parameter has a smoothing mode
+    (instant, exponential or critically damped spring), an optional slew
+    limit, an LFO and a one-shot attack/decay envelope on top. step()
+    advances all of them with a handful of array operations, so the cost does
+    not depend on how many parameters are moving.
+    """
+
+    def __init__(self, store, smoothing='exp', smooth_time=0.1):
+        self.store = store
+        n = len(store.params)
+        self.minimum = store.minimum.astype(np.float64)
+        self.maximum = store.maximum.astype(np.float64)
+        self.span = self.maximum - self.minimum
+        self.steps = np.array([p.step for p in store.params], dtype=np.float64)
+
+        self.base = store.values.astype(np.float64)  # smoothed value before modulation
+        self.target = self.base.copy()
+        self.velocity = np.zeros(n)
+        self.mode = np.full(n, SMOOTHING[smoothing], dtype=np.int8)
+        self.smooth_time = np.full(n, smooth_time)
+        self.max_rate = np.full(n, np.inf)  # units per second
+
+        self.lfo_depth = np.zeros(n)  # fraction of the parameter's range
+        self.lfo_rate = np.zeros(n)  # Hz
+        self.lfo_phase = np.zeros(n)
+        self.lfo_shape = np.zeros(n, dtype=np.int8)
+
+        self.env_depth = np.zeros(n)
+        self.env_start = np.full(n, -np.inf)
+        self.env_attack = np.full(n, 1e-3)
+        self.env_decay = np.full(n, 1e-3)
+
+        self.morph_from = np.zeros(n)
+        self.morph_to = np.zeros(n)
+        self.morph_start = np.zeros(n)
+        self.morph_duration = np.ones(n)
+        self.morphing = np.zeros(n, dtype=bool)
+
+        self.time = 0.0
+        self._output = store.values.copy()
+        self._version = store.version
+
+    def _index(self, name):
+        return self.store.index[name]
+
+    def set(self, name, value):
+        """Set where a parameter should go. Returns the clamped target."""
+        i = self._index(name)
+        self.morphing[i] = False
+        self.target[i] = min(max(float(value), self.minimum[i]), self.maximum[i])
+        return float(self.target[i])
+
+    def nudge(self, name, direction):
+        i = self._index(name)
+        return self.set(name, self.target[i] + direction * self.steps[i])
+
+    def update(self, values):
+        for name, value in values.items():
+            if name in self.store:
+                self.set(name, value)
+
+    def reset(self):
+        self.morphing[:] = False
+        self.target[:] = self.store.defaults
+
+    def jump(self):
+        """Snap every parameter to its target now"""
+        self.base[:] = self.target
+        self.velocity[:] = 0.0
+
+    def configure(self, name, smoothing=None, smooth_time=None, max_rate=None):
+        i = self._index(name)
+        if smoothing is not None:
+            self.mode[i] = SMOOTHING[smoothing]
+        if smooth_time is not None:
+            self.smooth_time[i] = max(float(smooth_time), 1e-3)
+        if max_rate is not None:
+            self.max_rate[i] = float(max_rate) if max_rate > 0 else np.inf
+
+    def lfo(self, name, depth, rate, shape='sine', phase=0.0):
+        """Modulate around the target by `depth` (fraction of range) at `rate` Hz; depth 0 turns it off"""
+        i = self._index(name)
+        self.lfo_depth[i] = depth
+        self.lfo_rate[i] = rate
+        self.lfo_shape[i] = SHAPES[shape]
+        self.lfo_phase[i] = phase
+
+    def trigger(self, name, depth, attack=0.01, decay=0.3):
+        """Fire a one-shot envelope adding up to `depth` (fraction of range)"""
+        i = self._index(name)
+        self.env_depth[i] = depth
+        self.env_attack[i] = max(attack, 1e-3)
+        self.env_decay[i] = max(decay, 1e-3)
+        self.env_start[i] = self.time
+
+    def morph(self, values, seconds):
+        """Glide the given parameters to new values over `seconds`, e.g. a preset"""
+        for name, value in values.items():
+            if name not in self.store:
+                continue
+            i = self._index(name)
+            self.morph_from[i] = self.target[i]
+            self.morph_to[i] = min(max(float(value), self.minimum[i]), self.maximum[i])
+            self.morph_start[i] = self.time
+            self.morph_duration[i] = max(float(seconds), 1e-3)
+            self.morphing[i] = True
+
+    def _sync_external_writes(self):
+        # Someone wrote the store directly (e.g. store.reset()); take those values as targets
+        if self.store.version != self._version:
+            changed = self.store.values != self._output
+            self.target[changed] = self.store.values[changed]
+            self.base[changed] = self.store.values[changed]
+
+    def step(self, dt, now=None):
+        """Advance every parameter by dt seconds and write the results into the store"""
+        dt = min(max(dt, 0.0), 0.1)  # a stall must not fling the springs
+        self.time = now if now is not None else self.time + dt
+        t = self.time
+        self._sync_external_writes()
+
+        # Preset morphs drive the targets along a smoothstep curve
+        if self.morphing.any():
+            progress = np.clip((t - self.morph_start) / self.morph_duration, 0.0, 1.0)
+            curve = progress * progress * (3.0 - 2.0 * progress)
+            glide = self.morph_from + (self.morph_to - self.morph_from) * curve
+            self.target = np.where(self.morphing, glide, self.target)
+            self.morphing &= progress < 1.0
+
+        # Exponential: move a fixed fraction of the remaining distance
+        offset = self.base - self.target
+        alpha = np.exp(-dt / self.smooth_time)
+        exponential = self.target + offset * alpha
+        # Critically damped spring, stepped with its exact solution so any dt is stable
+        omega = 2.0 / self.smooth_time
+        decay = np.exp(-omega * dt)
+        drive = (self.velocity + omega * offset) * dt
+        spring = self.target + (offset + drive) * decay
+        spring_velocity = (self.velocity - omega * drive) * decay
+
+        smoothed = np.where(self.mode == CRITICAL, spring, np.where(self.mode == EXPONENTIAL, exponential,
+                                                                     self.target))
+        # Slew limit
+        limit = self.max_rate * dt if dt > 0 else np.zeros_like(self.max_rate)
+        moved = np.clip(smoothed - self.base, -limit, limit)
+        new_base = self.base + moved
+        self.velocity = np.where(self.mode == CRITICAL, np.clip(spring_velocity, -self.max_rate, self.max_rate),
+                                 moved / dt if dt > 0 else 0.0)
+        self.base = new_base
+
+        # Modulation on top: LFO plus envelope, in units of each parameter's range
+        cycle = self.lfo_rate * t + self.lfo_phase
+        frac = cycle - np.floor(cycle)
+        wave = np.where(self.lfo_shape == SINE, np.sin(2.0 * np.pi * cycle),
+                        np.where(self.lfo_shape == TRIANGLE, 1.0 - 4.0 * np.abs(frac - 0.5), np.where(frac < 0.5, 1.0, -1.0)))
+        age = t - self.env_start
+        envelope = np.where(age < self.env_attack, age / self.env_attack,
+                            np.exp(-(age - self.env_attack) / self.env_decay))
+        envelope = np.where(age >= 0.0, envelope, 0.0)
+        modulation = (wave * self.lfo_depth + envelope * self.env_depth) * self.span
+
+        output = np.clip(self.base + modulation, self.minimum, self.maximum).astype(np.float32)
+        if not np.array_equal(output, self.store.values):
+            self.store.values[:] = output
+            self.store.version += 1
+        self._output = output
+        self._version = self.store.version
@@ -0,0 +1,195 @@
+import moderngl
+import numpy as np
+
+from audio_features import FEATURE_UNIFORMS
+
+
+class Param:
+    """One shader control: its range, keyboard step, default and uniform name"""
+
+    def __init__(self, name, minimum, maximum, step, default, label, keys=None, uniform=None, fmt='.2f'):
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.step = step
+        self.default = default
+        self.label = label
+        self.keys = keys  # (increase, decrease) key names from wnd.keys
+        self.uniform = uniform
+        self.fmt = fmt
+
+
+# The single list of shader parameters. The order is also the layout of the
+# packed value array and of the std140 `MacroverseParams` uniform block.
+PARAMS = (
+    Param('time_scale', 0.0, 5.0, 0.1, 1.0, 'Time scale', ('Q', 'A')),
+    Param('audio_sensitivity', 0.0, 5.0, 0.1, 1.0, 'Audio sensitivity', ('W', 'S')),
+    Param('color_r', 0.0, 1.0, 0.05, 0.1, 'Red', ('U', 'J'), 'u_color_r'),
+    Param('color_g', 0.0, 1.0, 0.05, 0.2, 'Green', ('I', 'K'), 'u_color_g'),
+    Param('color_b', 0.0, 1.0, 0.05, 0.8, 'Blue', ('O', 'L'), 'u_color_b'),
+    Param('ripple_frequency', 1.0, 50.0, 2.0, 20.0, 'Ripple frequency', ('T', 'G'), 'u_ripple_frequency', '.1f'),
+    Param('ripple_speed', 0.1, 10.0, 0.2, 2.0, 'Ripple speed', ('Y', 'H'), 'u_ripple_speed'),
+    Param('particle_count', 100.0, 50000.0, 1000.0, 10000.0, 'Particle count', ('P', 'SEMICOLON'), 'u_particle_count', '.0f'),
+    Param('particle_speed', 0.01, 1.0, 0.01, 0.1, 'Particle speed', ('BRACKET_LEFT', 'BRACKET_RIGHT'),
+          'u_particle_speed', '.3f'),
+    Param('zoom', 0.1, 3.0, 0.1, 1.0, 'Zoom', ('E', 'D'), 'u_zoom'),
+    Param('brightness', 0.1, 3.0, 0.1, 1.0, 'Brightness', ('R', 'F'), 'u_brightness'),
+)
+
+PRESETS = {
+    'Energy Field': {'ripple_frequency': 20.0, 'ripple_speed': 2.0, 'color_r': 0.1, 'color_g': 0.2, 'color_b': 0.8},
+    'Particles': {'particle_count': 10000.0, 'particle_speed': 0.1, 'color_r': 1.0, 'color_g': 0.8, 'color_b': 0.2},
+    'Blue Giants': {'brightness': 1.5, 'color_r': 0.2, 'color_g': 0.4, 'color_b': 1.0, 'zoom': 0.8},
+    'Life Forms': {'time_scale': 0.5, 'color_r': 0.2, 'color_g': 1.0, 'color_b': 0.3, 'ripple_frequency': 15.0},
+}
+
+UNIFORM_BLOCK = 'MacroverseParams'
+UNIFORM_BLOCK_BINDING = 0
+
+
+class ParameterStore:
+    """
+    Current parameter values packed in one float32 array. Keyboard, OSC and
+    the control panel all write through set(); `version` changes on every
+    write so consumers can skip work when nothing moved.
+    """
+
+    def __init__(self, params=PARAMS):
+        self.params = params
+        self.index = {p.name: i for i, p in enumerate(params)}
+        self.defaults = np.array([p.default for p in params], dtype=np.float32)
+        self.minimum = np.array([p.minimum for p in params], dtype=np.float32)
+        self.maximum = np.array([p.maximum for p in params], dtype=np.float32)
+        self.values = self.defaults.copy()
+        self.version = 0
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __getitem__(self, name):
+        return float(self.values[self.index[name]])
+
+    def param(self, name):
+        return self.params[self.index[name]]
+
+    def set(self, name, value):
+        """Clamp and store a value. Returns the stored value."""
+        i = self.index[name]
+        value = min(max(float(value), self.params[i].minimum), self.params[i].maximum)
+        if self.values[i] != value:
+            self.values[i] = value
+            self.version += 1
+        return float(self.values[i])
+
+    def nudge(self, name, direction):
+        return self.set(name, self[name] + direction * self.param(name).step)
+
+    def update(self, values):
+        for name, value in values.items():
+            if name in self.index:
+                self.set(name, value)
+
+    def reset(self):
+        self.values[:] = self.defaults
+        self.version += 1
+
+    def as_dict(self):
+        return {p.name: float(v) for p, v in zip(self.params, self.values)}
+
+    def format(self, name):
+        p = self.param(name)
+        return f"{p.label}: {self[name]:{p.fmt}}"
+
+
+class BindingPlan:
+    """
+    How one program receives parameters, resolved once by introspecting the
+    uniforms it actually declares. Programs with a `MacroverseParams` block
+    get the packed array through a shared uniform buffer; the rest get only
+    the loose uniforms they use, and only when a value changed.
+    """
+
+    def __init__(self, program, store, ubo=None):
+        self.store = store
+        members = set(program)
+        self._uniforms = {name: program[name] for name in members if isinstance(program[name], moderngl.Uniform)}
+        self._version = -1
+
+        self.block = None
+        if UNIFORM_BLOCK in members and ubo is not None:
+            self.block = program[UNIFORM_BLOCK]
+            self.block.binding = UNIFORM_BLOCK_BINDING
+            self.ubo = ubo
+            self.slots = np.zeros(0, dtype=np.intp)
+            self.targets = []
+        else:
+            used = [(i, p.uniform) for i, p in enumerate(store.params) if p.uniform in self._uniforms]
+            self.slots = np.array([i for i, _ in used], dtype=np.intp)
+            self.targets = [self._uniforms[u] for _, u in used]
+        self._uploaded = np.full(len(self.slots), np.nan, dtype=np.float32)
+
+    def has(self, name):
+        return name in self._uniforms
+
+    def set(self, name, value):
+        """Write a per-frame uniform (time, resolution, audio) if the program uses it"""
+        uniform = self._uniforms.get(name)
+        if uniform is not None:
+            uniform.value = value
+
+    def bind_frame(self, time, resolution, snapshot, audio_texture, texture_unit=0, tile=None):
+        """
+        Set everything a scene needs for one frame: clock, resolution, audio and
+        parameters. `tile` is the (x, y, width, height) part of the image to
+        draw, as fractions of `resolution`; the whole image if None.
+        """
+        self.set('u_time', time * self.store['time_scale'])
+        self.set('u_resolution', resolution)
+        if tile is not None:
+            self.set('u_tile', tile)
+        self.set('u_audio', snapshot.level * self.store['audio_sensitivity'])
+        if 'u_spectrum' in self._uniforms:
+            audio_texture.use(location=texture_unit)
+            self.set('u_spectrum', texture_unit)
+        for uniform, value in zip(FEATURE_UNIFORMS, snapshot.features[-len(FEATURE_UNIFORMS):]):
+            self.set(uniform, float(value))
+        self.upload()
+
+    def upload(self):
+        if self.block is not None:
+            self.ubo.upload()
+            return
+        if self._version == self.store.version:
+            return
+        self._version = self.store.version
+        current = self.store.values[self.slots]
+        for i in np.flatnonzero(current != self._uploaded):
+            self.targets[i].value = float(current[i])
+        self._uploaded[:] = current
+
+
+class ParamUniformBuffer:
+    """The packed parameter array mirrored into a uniform buffer shared by all programs"""
+
+    def __init__(self, ctx, store):
+        self.store = store
+        self.buffer = ctx.buffer(reserve=store.values.nbytes)
+        self.buffer.bind_to_uniform_block(UNIFORM_BLOCK_BINDING)
+        self._version = -1
+
+    def upload(self):
+        if self._version != self.store.version:
+            self.buffer.write(self.store.values)
+            self._version = self.store.version
+
+    def release(self):
+        self.buffer.release()
+
+
+if __name__ == '__main__':
+    # Prints the parameter table used in SHADER_GUIDE.md
+    print("| Parameter | Uniform | Range | Step | Default | Keys |")
+    print("|---|---|---|---|---|---|")
+    for p in PARAMS:
+        keys = '/'.join(p.keys) if p.keys else ''
+        print(f"| `{p.name}` | `{p.uniform or '-'}` | {p.minimum}-{p.maximum} | {p.step} | {p.default} | {keys} |")
@@ -0,0 +1,149 @@
+import os
+
+import moderngl
+import numpy as np
+
+from parameters import BindingPlan
+from program_pool import read_source
+
+# The scene whose particles are simulated here and drawn on top of its background pass
+PARTICLE_SCENE = 'particles.glsl'
+SPRITE_DIR = 'sprites'
+CAPACITY = 65536
+# Parameters the simulation reads on the CPU rather than as uniforms
+SIMULATION_PARAMS = ('particle_count', 'particle_speed', 'audio_sensitivity')
+
+# One particle; the instance buffer is a straight copy of the live rows
+PARTICLE = np.dtype([
+    ('position', 'f4', 2),  # x across the width, y up the height, both 0-1
+    ('velocity', 'f4', 2),
+    ('age', 'f4'),
+    ('life', 'f4'),
+    ('size', 'f4'),  # radius as a fraction of the height
+    ('seed', 'f4'),  # per-particle colour variation
+])
+INSTANCE_FORMAT = '2f 8x f f f f/i'
+INSTANCE_ATTRIBUTES = ('in_center', 'in_age', 'in_life', 'in_size', 'in_seed')
+
+
+class ParticleSystem:
+    """
+    Particle state in one structured array, live particles packed at the
+    front. step() ages, moves and emits with whole-array operations, so the
+    cost follows the particle count and is independent of resolution.
+    The population is refilled towards `particle_count`, faster when the
+    audio envelope is high, and every onset bursts out of a random point.
+    """
+
+    def __init__(self, capacity=CAPACITY, seed=0):
+        self.state = np.zeros(capacity, dtype=PARTICLE)
+        self.seed = seed
+        self.version = 0
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.version += 1
+        self.rng = np.random.default_rng(self.seed)
+        self._onset = 0.0
+        self._carry = 0.0  # fractional particles still owed by the emission rate
+
+    def emit(self, n, origin=None, speed=1.0):
+        n = min(int(n), len(self.state) - self.count)
+        if n <= 0:
+            return 0
+        new = self.state[self.count:self.count + n]
+        rng = self.rng
+        new['position'] = rng.random((n, 2)) if origin is None else origin
+        angle = rng.uniform(0.0, 2.0 * np.pi, n)
+        magnitude = rng.uniform(0.5, 1.5, n) * speed
+        new['velocity'][:, 0] = np.cos(angle) * magnitude
+        new['velocity'][:, 1] = np.sin(angle) * magnitude
+        new['age'] = 0.0
+        new['life'] = rng.uniform(1.5, 4.0, n)
+        new['size'] = rng.uniform(0.002, 0.006, n)
+        new['seed'] = rng.uniform(0.0, 2.0 * np.pi, n)
+        self.count += n
+        return n
+
+    def step(self, dt, store, snapshot):
+        """Advance by dt seconds with the current parameters and audio analysis"""
+        dt = min(max(dt, 0.0), 0.1)
+        live = self.state[:self.count]
+        live['age'] += dt
+        alive = live['age'] < live['life']
+        if not alive.all():
+            # Fill the holes below the new count with survivors from above it
+            count = int(alive.sum())
+            holes = np.flatnonzero(~alive[:count])
+            survivors = np.flatnonzero(alive[count:]) + count
+            live[holes] = live[survivors]
+            self.count = count
+            live = self.state[:count]
+
+        # Per-component views: a (n, 2) field inside the records is much slower to work on
+        px, py = live['position'][:, 0], live['position'][:, 1]
+        vx, vy = live['velocity'][:, 0], live['velocity'][:, 1]
+        # Velocities turn slowly, faster on spectral change, and speed up with the envelope
+        turn = dt * (0.5 + snapshot.flux * 4.0)
+        c, s = np.cos(turn), np.sin(turn)
+        x = vx.copy()
+        vx *= c
+        vx -= vy * s
+        vy *= c
+        vy += x * s
+        distance = dt * store['particle_speed'] * (1.0 + snapshot.envelope * store['audio_sensitivity'])
+        for position, velocity in ((px, vx), (py, vy)):
+            position += velocity * distance
+            position -= np.floor(position)
+
+        target = store['particle_count']
+        refill = target / 2.75 * dt * (1.0 + 2.0 * snapshot.envelope)
+        owed = min(refill, target - self.count) + self._carry
+        self._carry = owed - self.emit(owed) if owed > 0 else 0.0
+        onset = snapshot.onset
+        if onset > 0.5 and self._onset <= 0.5:
+            self.emit(target * 0.05 * onset, origin=self.rng.random(2), speed=3.0)
+        self._onset = onset
+        self.version += 1
+
+
+class ParticleRenderer:
+    """Draws a ParticleSystem as one instanced quad per particle, blended additively"""
+
+    def __init__(self, ctx, programs, store, ubo=None, capacity=CAPACITY):
+        self.ctx = ctx
+        vertex = read_source(programs.shader_dir, os.path.join(SPRITE_DIR, 'particle.vert'))
+        fragment = read_source(programs.shader_dir, os.path.join(SPRITE_DIR, 'particle.frag'))
+        self.program = ctx.program(vertex_shader=vertex.source, fragment_shader=fragment.source)
+        # Parameters, time and audio reach the sprites the same way they reach scenes
+        self.plan = BindingPlan(self.program, store, ubo)
+        corners = np.array([-1.0, -1.0, 1.0, -1.0, -1.0, 1.0, 1.0, 1.0], dtype='f4')
+        self.corners = ctx.buffer(corners.tobytes())
+        self.instances = ctx.buffer(reserve=capacity * PARTICLE.itemsize, dynamic=True)
+        self.vao = ctx.vertex_array(self.program, [
+            (self.corners, '2f', 'in_corner'),
+            (self.instances, INSTANCE_FORMAT, *INSTANCE_ATTRIBUTES),
+        ])
+        self._version = None
+
+    def draw(self, system, time, resolution, snapshot, audio_texture, tile=None):
+        if system.count == 0:
+            return
+        if self._version != system.version:
+            # Orphan first so the write never waits for last frame's draw
+            self.instances.orphan()
+            self.instances.write(system.state[:system.count])
+            self._version = system.version
+        self.plan.bind_frame(time, resolution, snapshot, audio_texture, tile=tile)
+        self.ctx.enable(moderngl.BLEND)
+        self.ctx.blend_func = moderngl.ONE, moderngl.ONE
+        self.vao.render(moderngl.TRIANGLE_STRIP, vertices=4, instances=system.count)
+        self.ctx.blend_func = moderngl.DEFAULT_BLENDING
+        self.ctx.disable(moderngl.BLEND)
+
+    def release(self):
+        self.vao.release()
+        self.instances.release()
+        self.corners.release()
+        self.program.release()
@@ -0,0 +1,230 @@
+import hashlib
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import moderngl
+import numpy as np
+
+SHADER_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shaders'))
+VERTEX_SHADER = 'default.vert'
+
+# Shaders that test QUALITY are compiled once per tier, with `#define QUALITY <level>`
+QUALITY_TIERS = ('low', 'medium', 'high')
+DEFAULT_QUALITY = 'high'
+
+
+def create_standalone_context(backend=None):
+    """A windowless GL 3.3 context; falls back to EGL on Linux machines without a display"""
+    backends = [backend] if backend else [None]
+    if backend is None and sys.platform.startswith('linux'):
+        backends.append('egl')
+    for i, name in enumerate(backends):
+        try:
+            return moderngl.create_standalone_context(require=330, **({'backend': name} if name else {}))
+        except Exception:
+            if i == len(backends) - 1:
+                raise
+
+
+class ShaderSource:
+    """A preprocessed shader file and the hash used to key its compiled program"""
+
+    def __init__(self, name, path, source):
+        self.name = name
+        self.path = path
+        self.source = source
+        self.digest = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        self.error = None
+        self.has_tiers = 'QUALITY' in source
+
+
+def preprocess(source):
+    """Normalize a GLSL source before compiling and hashing it"""
+    return source.lstrip('\ufeff').replace('\r\n', '\n')
+
+
+def with_defines(source, defines):
+    """Insert #defines after the #version line, keeping the line numbers of the rest"""
+    lines = source.split('\n', 1)
+    if not lines[0].startswith('#version') or len(lines) < 2:
+        return ''.join(f'#define {k} {v}\n' for k, v in defines.items()) + source
+    header = ''.join(f'#define {k} {v}\n' for k, v in defines.items())
+    return f"{lines[0]}\n{header}#line 2\n{lines[1]}"
+
+
+def read_source(shader_dir, name):
+    path = os.path.join(shader_dir, name)
+    with open(path, 'r', encoding='utf-8') as f:
+        return ShaderSource(name, path, preprocess(f.read()))
+
+
+def list_scenes(shader_dir=SHADER_DIR):
+    return [f for f in os.listdir(shader_dir) if f.endswith('.glsl')]
+
+
+class CompiledScene:
+    """A linked program plus its vertex array over the shared fullscreen quad"""
+
+    def __init__(self, key, program, vao, compile_time):
+        self.key = key
+        self.program = program
+        self.vao = vao
+        self.compile_time = compile_time
+        self.binding = None  # uniform binding plan, resolved on first use
+
+    def render(self):
+        self.vao.render(moderngl.TRIANGLE_STRIP)
+
+    def release(self):
+        self.vao.release()
+        self.program.release()
+
+
+class ProgramPool:
+    """
+    Compiled scene programs keyed by (shader name, vertex hash, fragment hash,
+    quality tier). The tier is None for shaders without quality variants.
+
+    Sources are read and preprocessed in parallel up front, programs are
+    compiled either on first use or ahead of time by warm_up(), and the least
+    recently used programs are released once more than `capacity` are held,
+    except the pinned ones the caller is still drawing.
+    """
+
+    def __init__(self, ctx, shader_dir=SHADER_DIR, capacity=8, vertex_shader=VERTEX_SHADER):
+        self.ctx = ctx
+        self.shader_dir = shader_dir
+        self.capacity = capacity
+        self.vertex_name = vertex_shader
+        self.sources = {}
+        self.vertex = None
+        self.programs = OrderedDict()
+        self.quality = {}  # scene name -> tier it is shown at
+        self.pinned = set()  # keys that are never evicted
+        self._pending = []
+
+        # One fullscreen quad shared by every program
+        quad = np.array([-1.0, -1.0, 0.0, 1.0, -1.0, 0.0, -1.0, 1.0, 0.0, 1.0, 1.0, 0.0], dtype='f4')
+        self.quad = ctx.buffer(quad.tobytes())
+
+    def load_sources(self, names, workers=None):
+        """Read and preprocess the vertex shader and all given scenes in parallel"""
+        paths = [self.vertex_name] + list(names)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            sources = list(pool.map(lambda name: read_source(self.shader_dir, name), paths))
+        self.vertex = sources[0]
+        for source in sources[1:]:
+            self.sources[source.name] = source
+        self._pending = [name for name in names if self.key(name) not in self.programs]
+        return sources[1:]
+
+    def update_source(self, source):
+        """Install an edited or new source. Returns True if it is a scene the pool did not know."""
+        if source.name == self.vertex_name:
+            self.vertex = source
+            self._pending = list(self.sources)
+            return False
+        is_new = source.name not in self.sources
+        self.sources[source.name] = source
+        self._pending.append(source.name)
+        return is_new
+
+    def discard_stale(self, keep=None):
+        """Release programs built from sources that have since changed, except `keep` and pinned ones"""
+        for key in list(self.programs):
+            if key != keep and key not in self.pinned and key[1:3] != self.key(key[0])[1:3]:
+                self.programs.pop(key).release()
+
+    def key(self, name, quality=None):
+        if self.vertex is None:
+            self.vertex = read_source(self.shader_dir, self.vertex_name)
+        if name not in self.sources:
+            self.sources[name] = read_source(self.shader_dir, name)
+        source = self.sources[name]
+        tier = (quality or self.quality.get(name, DEFAULT_QUALITY)) if source.has_tiers else None
+        return (name, self.vertex.digest, source.digest, tier)
+
+    def set_quality(self, name, quality):
+        """Show `name` at this tier from now on; get() then returns that variant"""
+        if quality not in QUALITY_TIERS:
+            raise ValueError(f"Unknown quality {quality!r}, expected one of {', '.join(QUALITY_TIERS)}")
+        self.quality[name] = quality
+
+    def pin(self, keys):
+        """Keep exactly these programs from being evicted, however long ago they were used"""
+        self.pinned = set(keys)
+
+    def peek(self, name, quality=None):
+        """The compiled scene if the pool holds it, without compiling it or counting it as used"""
+        return self.programs.get(self.key(name, quality))
+
+    def compile(self, name, quality=None):
+        """Compile a scene outside the pool; the caller releases it"""
+        return self._compile(self.key(name, quality))
+
+    def get(self, name, quality=None):
+        """Return the compiled scene, at its current tier unless `quality` is given, compiling it if needed"""
+        key = self.key(name, quality)
+        scene = self.programs.get(key)
+        if scene is not None:
+            self.programs.move_to_end(key)
+            return scene
+        scene = self._compile(key)
+        self.programs[key] = scene
+        self._evict()
+        return scene
+
+    def _compile(self, key):
+        name, tier = key[0], key[3]
+        fragment = self.sources[name].source
+        if tier is not None:
+            fragment = with_defines(fragment, {'QUALITY': QUALITY_TIERS.index(tier)})
+        start = time.perf_counter()
+        program = self.ctx.program(
+            vertex_shader=self.vertex.source,
+            fragment_shader=fragment
+        )
+        vao = self.ctx.vertex_array(program, [(self.quad, '3f', 'in_position')])
+        return CompiledScene(key, program, vao, time.perf_counter() - start)
+
+    def _evict(self):
+        for key in list(self.programs):
+            if len(self.programs) <= self.capacity:
+                break
+            if key not in self.pinned:
+                self.programs.pop(key).release()
+
+    def warm_up(self):
+        """
+        Compile one pending program, for use in otherwise idle frames.
+        Warmed programs go in at the cold end so they never push out the active one.
+        Returns True while there is more to compile.
+        """
+        while self._pending:
+            name = self._pending.pop(0)
+            key = self.key(name)
+            if key in self.programs or self.sources[name].error:
+                continue
+            if len(self.programs) >= self.capacity:
+                self._pending.clear()
+                break
+            try:
+                scene = self._compile(key)
+            except moderngl.Error as e:
+                self.sources[name].error = str(e)
+                logging.warning(f"Could not precompile {name}: {e}")
+                continue
+            self.programs[key] = scene
+            self.programs.move_to_end(key, last=False)
+            break
+        return bool(self._pending)
+
+    def release(self):
+        for scene in self.programs.values():
+            scene.release()
+        self.programs.clear()
+        self.quad.release()
@@ -0,0 +1,212 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import time
+
+import numpy as np
+
+from program_pool import QUALITY_TIERS, SHADER_DIR
+
+QUALITY_PROFILE = os.path.join(os.path.dirname(SHADER_DIR), 'quality_profile.json')
+
+
+def machine_id(ctx):
+    """Host and GPU, so one checkout can hold the choices of several machines"""
+    return f"{platform.node()} / {ctx.info.get('GL_RENDERER', 'unknown')}"
+
+
+class QualityProfile:
+    """
+    Quality tiers chosen per machine and scene, in one JSON file:
+    {machine: {scene: {tier, digest, size, ms}}}. An entry is used until the
+    scene's source changes, then the scene is measured again.
+    """
+
+    def __init__(self, machine, path=QUALITY_PROFILE):
+        self.machine = machine
+        self.path = path
+        self.data = {}
+        self.load()
+
+    def get(self, scene, digest):
+        entry = self.data.get(self.machine, {}).get(scene)
+        if entry and entry.get('digest') == digest and entry.get('tier') in QUALITY_TIERS:
+            return entry['tier']
+        return None
+
+    def set(self, scene, digest, tier, timings, size):
+        self.data.setdefault(self.machine, {})[scene] = {
+            'tier': tier, 'digest': digest, 'size': list(size), 'ms': timings,
+        }
+        self.save()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                self.data = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not load quality profile {self.path}: {e}")
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(self.data, f, indent=2)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logging.warning(f"Could not save quality profile {self.path}: {e}")
+
+
+class QualitySelector:
+    """
+    Picks the highest quality tier of a scene that fits the frame budget on
+    this machine. Tiers are drawn offscreen from the lowest up, waiting for
+    the GPU after every draw, and the last whose median stays under
+    `headroom` x budget wins; the rest of the budget is left for post passes
+    and everything else in the frame. start() and step() spread this over
+    many calls, one draw each, so the visualizer can measure in idle frames.
+    Tiers the pool does not hold are compiled outside it and released once
+    measured, so measuring never evicts the programs being drawn.
+    """
+
+    def __init__(self, ctx, programs, budget_ms, frames=8, headroom=0.8):
+        self.ctx = ctx
+        self.programs = programs
+        self.budget_ms = budget_ms
+        self.frames = frames
+        self.headroom = headroom
+        self.fbo = None
+        self.name = None
+        self.timings = {}
+        self._tiers = []
+        self._times = None
+        self._scene = None  # tier compiled for the measurement, owned by the selector
+
+    def _target(self, size):
+        if self.fbo is None or self.fbo.size != tuple(size):
+            if self.fbo is not None:
+                self.fbo.color_attachments[0].release()
+                self.fbo.release()
+            self.fbo = self.ctx.framebuffer(color_attachments=[self.ctx.renderbuffer(tuple(size))])
+        return self.fbo
+
+    def start(self, name):
+        """Begin measuring `name`; each step() then draws it once"""
+        self.cancel()
+        self.name = name
+        self.timings = {}
+        self._tiers = list(QUALITY_TIERS)
+
+    def cancel(self):
+        """Drop the measurement in progress"""
+        if self._scene is not None:
+            self._scene.release()
+            self._scene = None
+        self.name = None
+        self._times = None
+
+    def step(self, size, prepare):
+        """
+        One draw of the scene being measured; `prepare(scene, size)` sets its
+        uniforms. Returns (tier, timings in ms) once the tier is decided, else None.
+        """
+        tier = self._tiers[0]
+        scene = self.programs.peek(self.name, tier)
+        if scene is None:
+            if self._scene is None:
+                self._scene = self.programs.compile(self.name, tier)
+            scene = self._scene
+        fbo = self._target(size)
+        fbo.use()
+        self.ctx.finish()  # leave out whatever the GPU was still doing
+        start = time.perf_counter()
+        prepare(scene, size)
+        scene.render()
+        self.ctx.finish()
+        ms = (time.perf_counter() - start) * 1000
+        if self._times is None:
+            # The first draw of a program includes the driver's own compile work
+            self._times = []
+            return None
+        self._times.append(ms)
+        if len(self._times) < self.frames and ms <= self.budget_ms * 2:
+            return None
+        self.timings[tier] = round(float(np.median(self._times)), 3)
+        self._times = None
+        if self._scene is not None:
+            self._scene.release()
+            self._scene = None
+        self._tiers.pop(0)
+        fits = self.timings[tier] <= self.budget_ms * self.headroom
+        if not fits or not self._tiers:
+            # Higher tiers only cost more, so the search stops at the first that does not fit
+            chosen = tier if fits else QUALITY_TIERS[max(QUALITY_TIERS.index(tier) - 1, 0)]
+            self.name = None
+            return chosen, self.timings
+        return None
+
+    def select(self, name, size, prepare):
+        """The tier to show `name` at and the measured ms of each tier tried, all at once"""
+        self.start(name)
+        while True:
+            result = self.step(size, prepare)
+            if result is not None:
+                return result
+
+    def release(self):
+        self.cancel()
+        if self.fbo is not None:
+            self.fbo.color_attachments[0].release()
+            self.fbo.release()
+            self.fbo = None
+
+
+def main(argv=None):
+    from audio_features import AudioTexture
+    from audio_processing import AudioProcessor, open_source
+    from parameters import BindingPlan, ParameterStore, ParamUniformBuffer
+    from program_pool import ProgramPool, create_standalone_context, list_scenes
+    from scene_player import parse_size
+
+    parser = argparse.ArgumentParser(description="Choose each scene's quality tier for this machine ahead of a show")
+    parser.add_argument('--scenes', nargs='*', help="Scenes to measure (default: all in shaders/)")
+    parser.add_argument('--size', type=parse_size, default=(1920, 1080), help="Output size, WIDTHxHEIGHT")
+    parser.add_argument('--target-fps', type=float, default=60.0)
+    parser.add_argument('--profile', default=QUALITY_PROFILE)
+    args = parser.parse_args(argv)
+
+    ctx = create_standalone_context()
+    programs = ProgramPool(ctx)
+    scenes = args.scenes or sorted(list_scenes())
+    programs.load_sources(scenes)
+    store = ParameterStore()
+    ubo = ParamUniformBuffer(ctx, store)
+    audio = AudioProcessor(source=open_source('synthetic', loop=False))
+    snapshot = audio.advance_to(1.0)
+    audio_texture = AudioTexture(ctx, audio.features.n_bands)
+    audio_texture.update(snapshot)
+
+    def prepare(scene, size):
+        if scene.binding is None:
+            scene.binding = BindingPlan(scene.program, store, ubo)
+        scene.binding.bind_frame(1.0, size, snapshot, audio_texture)
+
+    profile = QualityProfile(machine_id(ctx), args.profile)
+    selector = QualitySelector(ctx, programs, 1000.0 / args.target_fps)
+    print(f"{profile.machine}, {args.size[0]}x{args.size[1]} at {args.target_fps:g} fps")
+    for name in scenes:
+        source = programs.sources[name]
+        if not source.has_tiers:
+            continue
+        tier, timings = selector.select(name, args.size, prepare)
+        profile.set(name, source.digest, tier, timings, args.size)
+        print(f"  {name:<20} {tier:<7} " + '  '.join(f"{t} {ms:.2f} ms" for t, ms in timings.items()))
+    print(f"Saved to {profile.path}")
+
+
+if __name__ == '__main__':
+    main()
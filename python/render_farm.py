@@ -0,0 +1,194 @@
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from video_output import PngSequenceWriter, RawVideoWriter, Y4mWriter, y4m_header
+
+# Per-process state, set up once by _init_worker
+_worker = {}
+
+
+class RenderJob:
+    """Everything a worker needs to render any frame of an export"""
+
+    def __init__(self, scene, size, fps, first, last, fmt, output, params=None, audio='synthetic', quality=None,
+                 audio_cache=True):
+        self.scene = scene
+        self.size = tuple(size)
+        self.fps = fps
+        self.first = first
+        self.last = last
+        self.format = fmt
+        self.output = output
+        self.params = params
+        self.audio = audio
+        self.quality = quality
+        self.audio_cache = audio_cache  # same output either way, so not part of the signature
+
+    def signature(self):
+        """What must match for a previous partial run to be resumed"""
+        return {'scene': self.scene, 'size': list(self.size), 'fps': self.fps, 'first': self.first,
+                'last': self.last, 'format': self.format, 'params': self.params, 'audio': self.audio,
+                'quality': self.quality}
+
+    @property
+    def work_dir(self):
+        if self.format == 'png':
+            return self.output
+        return self.output + '.parts'
+
+    def shards(self, chunk):
+        return [(i, a, min(a + chunk, self.last)) for i, a in enumerate(range(self.first, self.last, chunk))]
+
+    def shard_path(self, shard_id):
+        return os.path.join(self.work_dir, f'shard_{shard_id:05d}.part')
+
+
+class Manifest:
+    """Completed shards of a job, rewritten atomically after each one so a run can resume"""
+
+    def __init__(self, job):
+        self.path = os.path.join(job.work_dir, 'manifest.json')
+        self.job = job
+        self.done = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get('job') == job.signature():
+                self.done = {int(k): v for k, v in data.get('done', {}).items()}
+
+    def is_done(self, shard_id, first, last):
+        entry = self.done.get(shard_id)
+        if not entry or entry['frames'] != [first, last]:
+            return False
+        if self.job.format == 'png':
+            writer = PngSequenceWriter(self.job.output)
+            return all(os.path.exists(writer.path(i)) for i in range(first, last))
+        path = self.job.shard_path(shard_id)
+        return os.path.exists(path) and os.path.getsize(path) == entry['bytes']
+
+    def mark(self, shard_id, first, last, size):
+        self.done[shard_id] = {'frames': [first, last], 'bytes': size}
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'job': self.job.signature(), 'done': self.done}, f)
+        os.replace(tmp, self.path)
+
+
+def _init_worker(job, progress_queue, threads):
+    # Split the software rasterizer's threads between the workers
+    if threads:
+        os.environ.setdefault('LP_NUM_THREADS', str(threads))
+    from scene_player import OfflineRenderer, ParamTrack
+    track = ParamTrack.load(job.params) if job.params else None
+    _worker['job'] = job
+    _worker['queue'] = progress_queue
+    _worker['renderer'] = OfflineRenderer(job.scene, job.size, job.fps, track, job.audio, quality=job.quality,
+                                          audio_cache=job.audio_cache)
+
+
+def _render_shard(shard_id, first, last):
+    job = _worker['job']
+    renderer = _worker['renderer']
+    if first / job.fps < renderer.audio_time:
+        # Audio analysis only runs forward; start over for an earlier shard
+        renderer.reset_audio()
+
+    if job.format == 'png':
+        writer = PngSequenceWriter(job.output)
+    elif job.format == 'y4m':
+        writer = Y4mWriter(job.shard_path(shard_id), job.size, job.fps, header=False)
+    else:
+        writer = RawVideoWriter(job.shard_path(shard_id))
+
+    report_every = max(1, int(job.fps // 4))
+
+    def progress(index):
+        done = index - first + 1
+        if done % report_every == 0 or index == last - 1:
+            _worker['queue'].put((shard_id, done, os.getpid()))
+
+    fps = renderer.render(first, last, writer, progress)
+    size = 0 if job.format == 'png' else os.path.getsize(job.shard_path(shard_id))
+    return shard_id, first, last, fps, size
+
+
+def merge(job, shards):
+    """Concatenate shard files in frame order into the final video"""
+    if job.format == 'png':
+        os.remove(os.path.join(job.work_dir, 'manifest.json'))
+        return
+    with open(job.output, 'wb') as out:
+        if job.format == 'y4m':
+            out.write(y4m_header(job.size, job.fps))
+        for shard_id, _, _ in shards:
+            with open(job.shard_path(shard_id), 'rb') as part:
+                shutil.copyfileobj(part, out, 16 * 1024 * 1024)
+    shutil.rmtree(job.work_dir)
+
+
+def render_sharded(job, workers=None, chunk=None):
+    """
+    Render a job across a pool of processes, each with its own headless GL
+    context. Finished shards are recorded so an interrupted export can be
+    restarted with the same arguments and only renders what is missing.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunk = chunk or max(1, int(job.fps * 2))
+    os.makedirs(job.work_dir, exist_ok=True)
+    shards = job.shards(chunk)
+    manifest = Manifest(job)
+    todo = [s for s in shards if not manifest.is_done(*s)]
+    total = sum(b - a for _, a, b in todo)
+    if len(todo) < len(shards):
+        print(f"Resuming: {len(shards) - len(todo)} of {len(shards)} shards already rendered")
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    ctx = multiprocessing.get_context('spawn')  # GL contexts do not survive fork
+    progress_queue = ctx.Queue()
+    progress = {}
+    shard_size = {shard_id: b - a for shard_id, a, b in shards}
+    start = time.perf_counter()
+
+    def report(final=False):
+        frames = sum(progress.values())
+        elapsed = time.perf_counter() - start
+        rate = frames / elapsed if elapsed > 0 else 0.0
+        active = sum(1 for shard_id, _, _ in todo if 0 < progress.get(shard_id, 0) < shard_size[shard_id])
+        end = '\n' if final else ''
+        print(f"\r{frames}/{total} frames, {rate:.1f} fps, {active} shards in progress", end=end, flush=True)
+
+    if not todo:
+        merge(job, shards)
+        return 0.0
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                             initargs=(job, progress_queue, threads)) as pool:
+        futures = [pool.submit(_render_shard, *s) for s in todo]
+        pending = set(futures)
+        last_report = 0.0
+        while pending:
+            finished = {f for f in pending if f.done()}
+            for future in finished:
+                shard_id, first, last, fps, size = future.result()
+                manifest.mark(shard_id, first, last, size)
+                progress[shard_id] = last - first
+                print(f"\rshard {shard_id + 1}/{len(shards)} frames {first}-{last - 1} done at {fps:.1f} fps")
+            pending -= finished
+            try:
+                shard_id, done, _ = progress_queue.get(timeout=0.1)
+                progress[shard_id] = max(progress.get(shard_id, 0), done)
+            except queue.Empty:
+                pass
+            if time.perf_counter() - last_report > 0.5:
+                report()
+                last_report = time.perf_counter()
+    report(final=True)
+
+    merge(job, shards)
+    elapsed = time.perf_counter() - start
+    return total / elapsed if elapsed > 0 else 0.0
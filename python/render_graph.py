@@ -0,0 +1,281 @@
+import os
+from collections import Counter
+
+import moderngl
+
+from program_pool import read_source
+
+POST_DIR = 'post'
+COPY_SHADER = 'upscale.frag'
+PREVIOUS = '.previous'
+
+
+def previous(name):
+    """Input name for the output a feedback pass produced on the previous frame"""
+    return name + PREVIOUS
+
+
+class RenderTarget:
+    """A color texture and the framebuffer that draws into it"""
+
+    def __init__(self, ctx, key):
+        size, components, dtype = key
+        self.key = key
+        self.size = size
+        self.texture = ctx.texture(size, components, dtype=dtype)
+        self.texture.filter = (moderngl.LINEAR, moderngl.LINEAR)
+        self.texture.repeat_x = False
+        self.texture.repeat_y = False
+        self.fbo = ctx.framebuffer(color_attachments=[self.texture])
+        self.last_used = 0
+
+    def release(self):
+        self.fbo.release()
+        self.texture.release()
+
+
+class TargetPool:
+    """
+    Offscreen targets keyed by (size, components, dtype). A pass takes one
+    for its output and the graph gives it back once every reader is done, so
+    frames reuse the same few textures indefinitely. Targets nobody has asked
+    for in `keep_frames` frames, such as those at a size from before a
+    resize, are released.
+    """
+
+    def __init__(self, ctx, keep_frames=120):
+        self.ctx = ctx
+        self.keep_frames = keep_frames
+        self.free = {}
+        self.in_use = 0
+        self.allocations = 0
+        self.frame = 0
+
+    def acquire(self, size, components=4, dtype='f1'):
+        free = self.free.get((tuple(size), components, dtype))
+        if free:
+            target = free.pop()
+        else:
+            target = RenderTarget(self.ctx, (tuple(size), components, dtype))
+            self.allocations += 1
+        self.in_use += 1
+        return target
+
+    def release(self, target):
+        target.last_used = self.frame
+        self.free.setdefault(target.key, []).append(target)
+        self.in_use -= 1
+
+    def end_frame(self):
+        self.frame += 1
+        for key, targets in list(self.free.items()):
+            stale = [t for t in targets if self.frame - t.last_used > self.keep_frames]
+            for target in stale:
+                targets.remove(target)
+                target.release()
+            if not targets:
+                del self.free[key]
+
+    def __len__(self):
+        return self.in_use + sum(len(targets) for targets in self.free.values())
+
+    def clear(self):
+        """Release every target not currently handed out"""
+        for targets in self.free.values():
+            for target in targets:
+                target.release()
+        self.free.clear()
+
+
+class Pass:
+    """
+    One step of a frame. `draw(textures, size)` renders into the bound target
+    with `textures` mapping sampler names to the textures of `inputs`
+    ({sampler: pass name, or previous(name) for last frame's output}).
+    A disabled pass is skipped and its `bypass` input is passed through in
+    its place; a disabled pass without one cuts off everything that reads it.
+    """
+
+    def __init__(self, name, draw, inputs=None, scale=1.0, components=4, dtype='f1',
+                 feedback=False, bypass=None, enabled=True):
+        self.name = name
+        self.draw = draw
+        self.inputs = dict(inputs or {})
+        self.scale = scale
+        self.components = components
+        self.dtype = dtype
+        self.feedback = feedback  # keep the output for the next frame
+        self.bypass = bypass
+        self.enabled = enabled
+
+    def size(self, size):
+        if self.scale == 1.0:
+            return tuple(size)
+        return max(1, round(size[0] * self.scale)), max(1, round(size[1] * self.scale))
+
+
+class PostShader:
+    """A fullscreen fragment shader from shaders/post/, usable as a pass's draw function"""
+
+    def __init__(self, ctx, programs, filename, uniforms=None, directory=POST_DIR):
+        source = read_source(programs.shader_dir, os.path.join(directory, filename))
+        self.program = ctx.program(vertex_shader=programs.vertex.source, fragment_shader=source.source)
+        self.vao = ctx.vertex_array(self.program, [(programs.quad, '3f', 'in_position')])
+        self.uniforms = uniforms  # callable returning this frame's {uniform: value}
+
+    def __call__(self, textures, size):
+        program = self.program
+        for unit, (sampler, texture) in enumerate(textures.items()):
+            texture.use(location=unit)
+            if sampler in program:
+                program[sampler] = unit
+        if 'u_resolution' in program:
+            program['u_resolution'] = size
+        if self.uniforms:
+            for name, value in self.uniforms().items():
+                if name in program:
+                    program[name] = value
+        self.vao.render(moderngl.TRIANGLE_STRIP)
+
+    def release(self):
+        self.vao.release()
+        self.program.release()
+
+
+class RenderGraph:
+    """
+    Passes declared once, in dependency order, and run every frame. Only the
+    passes the output actually depends on run; the last one draws straight
+    into the frame's target unless its result has to be kept, every other
+    output lives in a pooled texture for as long as it has readers. Feedback
+    passes swap between two pooled targets, one being written while the
+    previous frame's is read.
+    """
+
+    def __init__(self, ctx, programs, pool=None):
+        self.ctx = ctx
+        self.pool = pool or TargetPool(ctx)
+        self.passes = {}
+        self.history = {}  # feedback pass name -> its target from the previous frame
+        self.copy = PostShader(ctx, programs, COPY_SHADER, directory='')
+        self.schedule = []
+        self.targets = 0  # held by the pool after the last frame
+        self._compiled = None
+
+    def add(self, render_pass):
+        self.passes[render_pass.name] = render_pass
+        self._compiled = None
+        return render_pass
+
+    def _resolve(self, name):
+        # Disabled passes hand their bypass input through
+        while name is not None:
+            render_pass = self.passes[name]
+            if render_pass.enabled:
+                return name
+            name = render_pass.inputs.get(render_pass.bypass)
+        return None
+
+    def compile(self, output):
+        """The passes `output` depends on, in declaration order, each with its inputs resolved"""
+        state = (output, tuple(p.enabled for p in self.passes.values()))
+        if self._compiled and self._compiled[0] == state:
+            return self._compiled[1]
+        final = self._resolve(output)
+        inputs = {}
+        stack = [final] if final else []
+        while stack:
+            name = stack.pop()
+            if name in inputs:
+                continue
+            resolved = {}
+            for sampler, source in self.passes[name].inputs.items():
+                if source.endswith(PREVIOUS):
+                    resolved[sampler] = source
+                    source = source[:-len(PREVIOUS)]
+                else:
+                    source = self._resolve(source)
+                    if source is None:
+                        continue
+                    resolved[sampler] = source
+                stack.append(source)
+            inputs[name] = resolved
+        schedule = [(p, inputs[p.name]) for p in self.passes.values() if p.name in inputs]
+        self._compiled = (state, (schedule, final))
+        return schedule, final
+
+    def _previous(self, render_pass, size):
+        target = self.history.get(render_pass.name)
+        if target is None or target.key != (size, render_pass.components, render_pass.dtype):
+            if target is not None:
+                self.pool.release(target)
+            # No history yet, or it is from before a resize: start from black
+            target = self.pool.acquire(size, render_pass.components, render_pass.dtype)
+            target.fbo.clear(0.0, 0.0, 0.0, 0.0)
+            self.history[render_pass.name] = target
+        return target
+
+    def execute(self, output, fbo, size):
+        """Run the passes for `output` into `fbo`, which is `size` pixels"""
+        schedule, final = self.compile(output)
+        self.schedule = [p.name for p, _ in schedule]
+        readers = Counter(source for _, inputs in schedule for source in inputs.values()
+                          if not source.endswith(PREVIOUS))
+        outputs = {}
+        direct = False
+        for render_pass, inputs in schedule:
+            pass_size = render_pass.size(size)
+            textures = {}
+            for sampler, source in inputs.items():
+                if source.endswith(PREVIOUS):
+                    source_pass = self.passes[source[:-len(PREVIOUS)]]
+                    textures[sampler] = self._previous(source_pass, source_pass.size(size)).texture
+                else:
+                    textures[sampler] = outputs[source].texture
+            if render_pass.name == final and not render_pass.feedback and pass_size == tuple(size):
+                fbo.use()
+                direct = True
+            else:
+                target = self.pool.acquire(pass_size, render_pass.components, render_pass.dtype)
+                target.fbo.use()
+                outputs[render_pass.name] = target
+            self.ctx.viewport = (0, 0, *pass_size)
+            render_pass.draw(textures, pass_size)
+            for source in inputs.values():
+                if source in readers:
+                    readers[source] -= 1
+                    if readers[source] == 0 and not self.passes[source].feedback:
+                        self.pool.release(outputs.pop(source))
+
+        fbo.use()
+        self.ctx.viewport = (0, 0, *size)
+        if final is None:
+            self.ctx.clear(0.0, 0.0, 0.0)
+        elif not direct:
+            self.copy({'u_frame': outputs[final].texture}, size)
+
+        # This frame's feedback outputs become next frame's history
+        for target in self.history.values():
+            self.pool.release(target)
+        self.history.clear()
+        for name, target in outputs.items():
+            if self.passes[name].feedback:
+                self.history[name] = target
+            else:
+                self.pool.release(target)
+        self.pool.end_frame()
+        self.targets = len(self.pool)
+
+    def describe(self):
+        return (f"{' > '.join(self.schedule) or 'nothing'}, "
+                f"{self.targets} targets ({self.pool.allocations} allocated)")
+
+    def release(self):
+        for target in self.history.values():
+            self.pool.release(target)
+        self.history.clear()
+        self.pool.clear()
+        self.copy.release()
+        for render_pass in self.passes.values():
+            if isinstance(render_pass.draw, PostShader):
+                render_pass.draw.release()
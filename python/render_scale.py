@@ -0,0 +1,188 @@
+import math
+
+import moderngl
+
+from program_pool import read_source
+
+UPSCALE_SHADER = 'upscale.frag'
+
+
+class ResolutionController:
+    """
+    Picks the internal render scale from measured frame cost. Cost grows with
+    the pixel count, so an over-budget frame is corrected in one jump of
+    sqrt(budget / cost); scaling back up goes one step at a time and only after
+    a sustained stretch well under budget. The gap between the two thresholds,
+    a settle period after each change and a growing delay whenever a step up
+    has to be taken back keep the scale from oscillating.
+
+    Going over budget is judged on the slower of GPU time and the frame
+    interval, going under on GPU time alone, since with vsync the interval
+    never drops below the refresh period.
+    """
+
+    def __init__(self, target_fps=60.0, min_scale=0.4, max_scale=1.0, step=0.05,
+                 high=1.05, low=0.7, settle=30, grow_after=120):
+        self.budget = 1000.0 / target_fps
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.step = step
+        self.high = high
+        self.low = low
+        self.settle = settle
+        self.grow_after = grow_after
+        self.scale = max_scale
+        self.gpu = None  # smoothed costs in ms since the last change
+        self.frame = None
+        self._frames = 0
+        self._under = 0
+        self._grew = False
+
+    def _quantize(self, scale):
+        scale = math.floor(scale / self.step + 1e-6) * self.step
+        return min(max(scale, self.min_scale), self.max_scale)
+
+    def _smooth(self, average, sample):
+        # Clamp so a single hitch (a shader compile) cannot dominate the average
+        sample = min(sample, self.budget * 4)
+        return sample if average is None else average * 0.9 + sample * 0.1
+
+    def update(self, gpu_ms, frame_ms):
+        """Feed one frame's measurements. Returns True if the scale changed."""
+        self.gpu = self._smooth(self.gpu, gpu_ms)
+        self.frame = self._smooth(self.frame, frame_ms)
+        self._frames += 1
+        if self._frames < self.settle:
+            return False
+
+        cost = max(self.gpu, self.frame)
+        if cost > self.budget * self.high:
+            self._under = 0
+            if self._grew:
+                # The last step up did not fit; wait longer before trying again
+                self.grow_after = min(self.grow_after * 2, 60 * 60)
+            scale = self._quantize(self.scale * math.sqrt(self.budget / cost))
+            if scale >= self.scale:
+                scale = max(self.scale - self.step, self.min_scale)
+            return self._set(scale, grew=False)
+
+        self._grew = False
+        if self.gpu < self.budget * self.low:
+            self._under += 1
+            if self._under >= self.grow_after:
+                return self._set(min(self.scale + self.step, self.max_scale), grew=True)
+        else:
+            self._under = 0
+        return False
+
+    def _set(self, scale, grew):
+        self._under = 0
+        if abs(scale - self.scale) < 1e-6:
+            return False
+        self.scale = scale
+        self._grew = grew
+        # Measurements from before the change are not comparable
+        self.gpu = None
+        self.frame = None
+        self._frames = 0
+        return True
+
+
+class GpuTimer:
+    """
+    GPU time of the scene draw from timer queries. Results are read a few
+    frames late from a small ring so reading them does not stall the pipeline.
+    """
+
+    def __init__(self, ctx, depth=3):
+        self.queries = [ctx.query(time=True) for _ in range(depth)]
+        self.index = 0
+        self.filled = 0
+
+    def __enter__(self):
+        self.queries[self.index].__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self.queries[self.index].__exit__(*exc)
+        self.index = (self.index + 1) % len(self.queries)
+        self.filled = min(self.filled + 1, len(self.queries))
+
+    def elapsed_ms(self):
+        """Time of the oldest finished frame in the ring, or None until it is full"""
+        if self.filled < len(self.queries):
+            return None
+        return self.queries[self.index].elapsed / 1e6
+
+
+class ScaledTarget:
+    """
+    Offscreen framebuffer at `scale` times the window's pixel size, stretched
+    over the window with bilinear filtering. At full scale scenes draw straight
+    into the window and no copy is made.
+    """
+
+    def __init__(self, ctx, programs):
+        self.ctx = ctx
+        self.fbo = None
+        self.texture = None
+        self.size = None
+        self.offscreen = False
+        self.target = None  # framebuffer the frame is drawn into
+        self.program = ctx.program(vertex_shader=programs.vertex.source,
+                                   fragment_shader=read_source(programs.shader_dir, UPSCALE_SHADER).source)
+        self.vao = ctx.vertex_array(self.program, [(programs.quad, '3f', 'in_position')])
+
+    def resolution(self, window_size, scale):
+        if scale >= 1.0:
+            return tuple(window_size)
+        return max(1, round(window_size[0] * scale)), max(1, round(window_size[1] * scale))
+
+    def begin(self, window_fbo, window_size, scale):
+        """Bind the target for a frame and return its size, which is what u_resolution must be"""
+        size = self.resolution(window_size, scale)
+        self.offscreen = size != tuple(window_size)
+        if not self.offscreen:
+            self.target = window_fbo
+        else:
+            if size != self.size:
+                self._allocate(size)
+            self.target = self.fbo
+        self.target.use()
+        return size
+
+    def end(self, window_fbo, window_size):
+        """Upscale into the window if the frame was drawn offscreen"""
+        if not self.offscreen:
+            return
+        window_fbo.use()
+        self.ctx.viewport = (0, 0, *window_size)
+        self.texture.use(location=0)
+        self.program['u_frame'] = 0
+        self.vao.render(moderngl.TRIANGLE_STRIP)
+
+    def _allocate(self, size):
+        self._release_target()
+        self.texture = self.ctx.texture(size, 3)
+        self.texture.filter = (moderngl.LINEAR, moderngl.LINEAR)
+        self.texture.repeat_x = False
+        self.texture.repeat_y = False
+        self.fbo = self.ctx.framebuffer(color_attachments=[self.texture])
+        self.size = size
+
+    def _release_target(self):
+        if self.fbo is not None:
+            self.fbo.release()
+            self.texture.release()
+        self.fbo = None
+        self.texture = None
+        self.size = None
+
+    def resize(self):
+        """Drop the offscreen target; it is reallocated at the new size on the next frame"""
+        self._release_target()
+
+    def release(self):
+        self._release_target()
+        self.vao.release()
+        self.program.release()
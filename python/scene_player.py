@@ -1,6 +1,19 @@
+import argparse
+import json
+import sys
+import time
+
 import moderngl_window as mglw
 from moderngl_window.timers.base import BaseTimer
-from audio_processing import AudioProcessor
+from audio_cache import CachedAnalysis, open_cached
+from audio_features import AudioTexture
+from audio_processing import AudioProcessor, open_source
+from parameters import BindingPlan, ParameterStore, ParamUniformBuffer
+from particles import PARTICLE_SCENE, ParticleRenderer, ParticleSystem
+from program_pool import DEFAULT_QUALITY, QUALITY_TIERS, ProgramPool, create_standalone_context
+from frame_share import FrameRing
+from tiled_still import DEFAULT_TILE, StillJob, render_still
+from video_output import FORMATS, AsyncReadback, EncoderThread, open_writer
 
 class ScenePlayer(mglw.WindowConfig):
     gl_version = (3, 3)
@@ -13,27 +26,294 @@ class ScenePlayer(mglw.WindowConfig):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.audio_processor = AudioProcessor()
-        self.prog = self.load_program(
-            vertex_shader='shaders/default.vert',
-            fragment_shader='shaders/living.glsl'
-        )
-        self.quad_fs = mglw.geometry.quad_fs()
+        self.audio_processor.start()
+        self.audio_texture = AudioTexture(self.ctx, self.audio_processor.features.n_bands)
+        self.params = ParameterStore()
+        self.programs = ProgramPool(self.ctx)
+        self.programs.load_sources(['living.glsl'])
+        self.scene = self.programs.get('living.glsl')
+        self.plan = BindingPlan(self.scene.program, self.params, ParamUniformBuffer(self.ctx, self.params))
 
     def render(self, time: float, frametime: float):
         self.ctx.clear(1.0, 1.0, 1.0)
 
-        fft_data = self.audio_processor.get_fft_data()
-        audio_level = sum(fft_data) / len(fft_data) / 10000
-
-        self.prog['u_time'] = time
-        self.prog['u_resolution'] = self.window_size
-        self.prog['u_audio'] = audio_level
-
-        self.quad_fs.render(self.prog)
+        snapshot = self.audio_processor.get_snapshot()
+        self.audio_texture.update(snapshot)
+        self.plan.bind_frame(time, self.window_size, snapshot, self.audio_texture)
+        self.scene.render()
 
     @classmethod
     def run(cls):
         mglw.run_window_config(cls, args=['--window', 'headless'])
 
+
+class ParamTrack:
+    """
+    Parameter values over time for offline renders, loaded from JSON: either a
+    flat {"name": value} object, or {"keyframes": [[seconds, {"name": value}], ...]}
+    which is interpolated linearly between keyframes.
+    """
+
+    def __init__(self, keyframes):
+        self.keyframes = sorted(keyframes, key=lambda k: k[0])
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        if 'keyframes' in data:
+            return cls([(float(t), values) for t, values in data['keyframes']])
+        return cls([(0.0, data)])
+
+    def apply(self, store, t):
+        previous = None
+        for when, values in self.keyframes:
+            if when > t:
+                if previous is None:
+                    store.update(values)
+                    return
+                start, start_values = previous
+                mix = (t - start) / (when - start)
+                store.update(start_values)
+                for name, value in values.items():
+                    if name in start_values and name in store:
+                        store.set(name, start_values[name] + (value - start_values[name]) * mix)
+                return
+            previous = (when, values)
+        if previous is not None:
+            store.update(previous[1])
+
+
+class OfflineRenderer:
+    """
+    Renders one scene into an offscreen framebuffer on a fixed-step clock:
+    frame i is always at time i / fps with audio analyzed up to exactly that
+    point, so the same settings always produce the same pixels. No window or
+    vsync is involved, so it runs as fast as the GPU allows.
+    """
+
+    def __init__(self, scene, size=(1280, 720), fps=60.0, params=None, audio=None, ctx=None, quality=None,
+                 audio_cache=True, tile_size=None):
+        self.ctx = ctx or create_standalone_context()
+        self.size = size
+        # Rendering in tiles (see tiled_still.py) draws `tile` of the image into a smaller framebuffer
+        self.tile_size = tile_size or size
+        self.tile = None
+        self.fps = fps
+        self.track = params
+        self.audio_spec = audio
+        self.audio = None
+        # Audio files are analyzed once into a table and looked up from then on
+        if audio_cache:
+            self.audio = open_cached(audio, build_missing=True)
+        self.reset_audio()
+        self.audio_texture = AudioTexture(self.ctx, self.audio.features.n_bands)
+
+        self.params = ParameterStore()
+        self.programs = ProgramPool(self.ctx, capacity=2)
+        self.programs.load_sources([scene])
+        if quality:
+            self.programs.set_quality(scene, quality)
+        self.scene = self.programs.get(scene)
+        self.param_ubo = ParamUniformBuffer(self.ctx, self.params)
+        self.plan = BindingPlan(self.scene.program, self.params, self.param_ubo)
+        self.particles = None
+        if scene == PARTICLE_SCENE:
+            self.particles = ParticleSystem()
+            self.particle_renderer = ParticleRenderer(self.ctx, self.programs, self.params, self.param_ubo)
+            self.particle_frame = 0
+        self.color = self.ctx.renderbuffer(self.tile_size)
+        self.fbo = self.ctx.framebuffer(color_attachments=[self.color])
+
+    def reset_audio(self):
+        """Start audio analysis over from the beginning of the track"""
+        self.audio_time = 0.0
+        if isinstance(self.audio, CachedAnalysis):
+            return  # looked up by time, so there is nothing to start over
+        self.audio = AudioProcessor(source=open_source(self.audio_spec, loop=False))
+        if not hasattr(self.audio.source, 'read_at'):
+            raise ValueError("Offline rendering needs a synthetic or file audio source")
+
+    def _catch_up_particles(self, index):
+        # Particles depend on every earlier frame: simulate those first, so a
+        # range that starts midway (a render farm shard) matches a full render
+        if index < self.particle_frame:
+            self.reset_audio()
+            self.particles.reset()
+            self.particle_frame = 0
+        for frame in range(self.particle_frame + 1, index):
+            t = frame / self.fps
+            if self.track:
+                self.track.apply(self.params, t)
+            self.particles.step(1.0 / self.fps, self.params, self.audio.advance_to(t))
+        self.particle_frame = max(self.particle_frame, index - 1)
+
+    def render_frame(self, index):
+        t = index / self.fps
+        if self.particles:
+            self._catch_up_particles(index)
+        if self.track:
+            self.track.apply(self.params, t)
+        snapshot = self.audio.advance_to(t)
+        self.audio_time = t
+        self.audio_texture.update(snapshot)
+        if self.particles and index > self.particle_frame:
+            self.particles.step(1.0 / self.fps, self.params, snapshot)
+            self.particle_frame = index
+
+        self.fbo.use()
+        self.fbo.clear(0.0, 0.0, 0.0, 1.0)
+        self.plan.bind_frame(t, self.size, snapshot, self.audio_texture, tile=self.tile)
+        self.scene.render()
+        if self.particles:
+            self.particle_renderer.draw(self.particles, t, self.size, snapshot, self.audio_texture, tile=self.tile)
+
+    def render(self, first, last, writer, progress=None):
+        """Render frames [first, last) into writer. Returns frames per second achieved."""
+        readback = AsyncReadback(self.ctx, self.size)
+        # A frame ring takes the readback straight into its shared memory slots
+        encoder = writer if isinstance(writer, FrameRing) else EncoderThread(writer, self.size)
+        start = time.perf_counter()
+        try:
+            for index in range(first, last):
+                self.render_frame(index)
+                out = encoder.acquire()
+                done = readback.read(self.fbo, index, out)
+                if done is None:
+                    encoder.release(out)
+                else:
+                    encoder.submit(done, out)
+                    if progress:
+                        progress(done)
+            out = encoder.acquire()
+            done = readback.flush(out)
+            if done is None:
+                encoder.release(out)
+            else:
+                encoder.submit(done, out)
+                if progress:
+                    progress(done)
+        finally:
+            encoder.close()
+            readback.release()
+        elapsed = time.perf_counter() - start
+        return (last - first) / elapsed if elapsed > 0 else 0.0
+
+    def release(self):
+        if self.particles:
+            self.particle_renderer.release()
+        self.fbo.release()
+        self.color.release()
+        self.param_ubo.release()
+        self.audio_texture.release()
+        self.programs.release()
+
+
+def parse_size(text):
+    w, h = text.lower().split('x')
+    return int(w), int(h)
+
+
+def render_main(argv):
+    parser = argparse.ArgumentParser(prog='scene_player.py render', description="Render a scene offline")
+    parser.add_argument('--scene', default='living.glsl')
+    parser.add_argument('--start', type=float, default=0.0, help="Start time in seconds")
+    parser.add_argument('--end', type=float, default=10.0, help="End time in seconds")
+    parser.add_argument('--fps', type=float, default=60.0)
+    parser.add_argument('--size', type=parse_size, default=(1920, 1080), help="WIDTHxHEIGHT")
+    parser.add_argument('--format', choices=FORMATS, default='png')
+    parser.add_argument('--output', required=True, help="Directory for png, file for y4m/raw, shared memory name for shm")
+    parser.add_argument('--params', help="JSON file with parameter values or keyframes")
+    parser.add_argument('--audio', default='synthetic', help="'synthetic' or a path to a WAV file")
+    parser.add_argument('--quality', choices=QUALITY_TIERS, default=DEFAULT_QUALITY,
+                        help="Tier for scenes with quality variants")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Render shards in this many processes (0 = one per CPU core)")
+    parser.add_argument('--chunk', type=int, help="Frames per shard when using workers (default 2 s)")
+    parser.add_argument('--no-audio-cache', action='store_true',
+                        help="Analyze the audio file while rendering instead of using its cached feature table")
+    args = parser.parse_args(argv)
+    first, last = int(round(args.start * args.fps)), int(round(args.end * args.fps))
+    if args.format == 'shm' and args.workers != 1:
+        parser.error("shm output is published by a single process; use --workers 1")
+
+    if args.workers != 1:
+        from render_farm import RenderJob, render_sharded
+        if not args.no_audio_cache:
+            open_cached(args.audio, build_missing=True)  # once, before the workers look for it
+        job = RenderJob(args.scene, args.size, args.fps, first, last, args.format, args.output,
+                        args.params, args.audio, args.quality, audio_cache=not args.no_audio_cache)
+        fps = render_sharded(job, args.workers or None, args.chunk)
+        print(f"Rendered {last - first} frames at {fps:.1f} fps ({fps / args.fps:.2f}x real time)")
+        return
+
+    track = ParamTrack.load(args.params) if args.params else None
+    renderer = OfflineRenderer(args.scene, args.size, args.fps, track, args.audio, quality=args.quality,
+                               audio_cache=not args.no_audio_cache)
+    writer = open_writer(args.format, args.output, args.size, args.fps)
+
+    def progress(index):
+        done = index - first + 1
+        if done % int(args.fps) == 0 or index == last - 1:
+            print(f"\r{done}/{last - first} frames", end='', flush=True)
+
+    fps = renderer.render(first, last, writer, progress)
+    print(f"\nRendered {last - first} frames at {fps:.1f} fps ({fps / args.fps:.2f}x real time)")
+
+
+def still_main(argv):
+    parser = argparse.ArgumentParser(prog='scene_player.py still',
+                                     description="Render a high-resolution still in tiles, streamed into a PNG file")
+    parser.add_argument('--scene', default='living.glsl')
+    parser.add_argument('--time', type=float, default=0.0, help="Scene time in seconds")
+    parser.add_argument('--fps', type=float, default=60.0, help="Step used to simulate particles up to --time")
+    parser.add_argument('--size', type=parse_size, default=(7200, 4800), help="WIDTHxHEIGHT")
+    parser.add_argument('--dpi', type=float, default=300.0, help="Resolution recorded in the PNG")
+    parser.add_argument('--output', required=True, help="PNG file")
+    parser.add_argument('--params', help="JSON file with parameter values or keyframes")
+    parser.add_argument('--audio', default='synthetic', help="'synthetic' or a path to a WAV file")
+    parser.add_argument('--quality', choices=QUALITY_TIERS, default=DEFAULT_QUALITY,
+                        help="Tier for scenes with quality variants")
+    parser.add_argument('--tile', type=int, default=DEFAULT_TILE, help="Tile size in pixels")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Render tile rows in this many processes (0 = one per CPU core)")
+    args = parser.parse_args(argv)
+
+    job = StillJob(args.scene, args.size, args.time, args.fps, args.params, args.audio, args.quality, args.tile)
+    columns, rows = job.grid
+
+    def progress(done, total):
+        print(f"\r{done}/{total} tile rows", end='', flush=True)
+
+    seconds = render_still(job, args.output, args.dpi, args.workers, progress)
+    w, h = args.size
+    print(f"\nRendered {w}x{h} ({w / args.dpi:.1f}x{h / args.dpi:.1f} in at {args.dpi:g} DPI) "
+          f"in {columns * rows} tiles in {seconds:.1f} s -> {args.output}")
+
+
+def replay_main(argv):
+    parser = argparse.ArgumentParser(prog='scene_player.py replay',
+                                     description="Replay a recorded session (main.py --record) headlessly")
+    parser.add_argument('log', help="Session log")
+    parser.add_argument('--max-speed', action='store_true', help="Render frames as fast as possible instead of at the recorded times")
+    parser.add_argument('--size', default='1280x720', help="WIDTHxHEIGHT")
+    parser.add_argument('--window', default='headless', help="Window backend; headless renders without a display")
+    parser.add_argument('--backend', help="GL context backend for the headless window, e.g. egl")
+    args = parser.parse_args(argv)
+    backend = ['--backend', args.backend] if args.backend else []
+
+    # The visualizer's own frame loop, so the replay goes through exactly what ran on stage
+    from main import Macroverse
+    mglw.run_window_config(Macroverse, args=['--window', args.window, '--size', args.size, '--replay', args.log,
+                                             '--replay-speed', 'max' if args.max_speed else 'realtime', *backend])
+
+
 if __name__ == '__main__':
-    ScenePlayer.run()
+    if len(sys.argv) > 1 and sys.argv[1] == 'render':
+        render_main(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'still':
+        still_main(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'replay':
+        replay_main(sys.argv[2:])
+    else:
+        ScenePlayer.run()
@@ -0,0 +1,222 @@
+import argparse
+import base64
+import json
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+from audio_features import AudioFeatures
+from audio_processing import AudioSnapshot
+
+MAGIC = b'MVSESSION1\n'
+SESSION_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sessions'))
+
+# Record types
+FRAME, KEY, COMMANDS, BUS, MIDI = 1, 2, 3, 4, 5
+KINDS = {FRAME: 'frame', KEY: 'key', COMMANDS: 'commands', BUS: 'bus', MIDI: 'midi'}
+
+# Every record: type, seconds since the session started (monotonic clock), payload length
+RECORD = struct.Struct('<BdI')
+# Frame payload: clock, frametime and audio level, then the audio features as float32
+FRAME_HEADER = struct.Struct('<ddd')
+# JSON records hold OSC blob arguments as {BLOB: base64}
+BLOB = '$bytes'
+
+
+def session_path(directory=SESSION_DIR):
+    return os.path.join(directory, time.strftime('session-%Y%m%d-%H%M%S.mvlog'))
+
+
+def to_json(value):
+    """For json.dumps: what OSC and numpy hand over that JSON has no type for"""
+    if isinstance(value, (bytes, bytearray)):
+        return {BLOB: base64.b64encode(value).decode('ascii')}
+    if isinstance(value, np.generic):
+        return value.item()
+    # Anything else is kept readable; it replays as a string
+    return repr(value)
+
+
+def from_json(obj):
+    """For json.loads: blobs back to bytes"""
+    if len(obj) == 1 and BLOB in obj:
+        return base64.b64decode(obj[BLOB])
+    return obj
+
+
+class SessionRecorder:
+    """
+    Appends every input the renderer applies to a binary log, frame by
+    frame: key actions, queued OSC/MIDI commands and parameters, shared bus
+    changes, raw MIDI messages and each frame's clock and audio analysis.
+    record() only packs bytes and queues them, from any thread; a writer
+    thread appends them to the file in batches.
+    """
+
+    def __init__(self, path, header):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.file = open(path, 'wb', buffering=1 << 16)
+        header = json.dumps(header).encode('utf-8')
+        self.file.write(MAGIC + struct.pack('<I', len(header)) + header)
+        self.start = time.perf_counter()
+        self.records = 0
+        self.bytes = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='session-writer', daemon=True)
+        self._thread.start()
+
+    def record(self, kind, payload=b''):
+        self._queue.put(RECORD.pack(kind, time.perf_counter() - self.start, len(payload)) + payload)
+
+    def record_json(self, kind, value):
+        try:
+            payload = json.dumps(value, separators=(',', ':'), default=to_json)
+        except (TypeError, ValueError) as e:
+            logging.error(f"Not recording {KINDS[kind]} {value!r}: {e}")
+            return
+        self.record(kind, payload.encode('utf-8'))
+
+    def record_frame(self, clock, frametime, snapshot):
+        self.record(FRAME, FRAME_HEADER.pack(clock, frametime, snapshot.level) + snapshot.features.tobytes())
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            # Take whatever else is waiting, so a busy frame becomes one write
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            data = b''.join(b for b in batch if b is not None)
+            try:
+                self.file.write(data)
+                self.records += len(batch) - stop
+                self.bytes += len(data)
+                if stop:
+                    return
+                self.file.flush()
+            except (OSError, ValueError) as e:
+                logging.error(f"Session recording stopped: {e}")
+                return
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5.0)
+        self.file.close()
+
+
+def read_session(path):
+    """The log's header and a generator of (kind, seconds, payload) records"""
+    f = open(path, 'rb')
+    if f.read(len(MAGIC)) != MAGIC:
+        f.close()
+        raise ValueError(f"{path} is not a session log")
+    size, = struct.unpack('<I', f.read(4))
+    header = json.loads(f.read(size))
+
+    def records():
+        with f:
+            while True:
+                head = f.read(RECORD.size)
+                if len(head) < RECORD.size:
+                    return  # end of the log, or a record cut off when the recorder was killed
+                kind, seconds, length = RECORD.unpack(head)
+                payload = f.read(length)
+                if len(payload) < length:
+                    return
+                yield kind, seconds, payload
+
+    return header, records()
+
+
+class SessionReplay:
+    """
+    Plays a session log back frame by frame: next_frame() returns one
+    recorded frame's inputs (as (kind, value) in the order they were
+    applied) with its clock, frametime and audio snapshot. With `realtime`
+    it first waits until the frame is due, otherwise it returns at once.
+    """
+
+    def __init__(self, path, realtime=True):
+        self.header, self._records = read_session(path)
+        self.path = path
+        self.realtime = realtime
+        self.frames = 0
+        audio = self.header.get('audio', {})
+        self.audio = ReplayAudio(audio.get('chunk_size', 1024), audio.get('rate', 44100))
+        self._start = None
+
+    def next_frame(self):
+        """(inputs, clock, frametime) of the next frame, or None at the end of the log"""
+        inputs = []
+        for kind, seconds, payload in self._records:
+            if kind == MIDI:
+                inputs.append((kind, payload))
+            elif kind != FRAME:
+                inputs.append((kind, json.loads(payload, object_hook=from_json)))
+            else:
+                clock, frametime, level = FRAME_HEADER.unpack_from(payload)
+                self.audio.set(level, np.frombuffer(payload, dtype=np.float32, offset=FRAME_HEADER.size))
+                if self.realtime:
+                    if self._start is None:
+                        self._start = time.perf_counter() - seconds
+                    delay = self._start + seconds - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                self.frames += 1
+                return inputs, clock, frametime
+        return None
+
+
+class ReplayAudio:
+    """Serves the recorded audio analysis in place of an AudioProcessor"""
+
+    def __init__(self, chunk_size, rate):
+        self.chunk_size = chunk_size
+        self.rate = rate
+        self.features = AudioFeatures(chunk_size, rate)
+        self._snapshot = AudioSnapshot(chunk_size, self.features.n_bands)
+
+    def set(self, level, features):
+        snapshot = self._snapshot
+        snapshot.level = level
+        if not np.array_equal(snapshot.features, features):
+            snapshot.features[:] = features
+            snapshot.seq += 1
+
+    def start(self):
+        pass
+
+    def get_snapshot(self):
+        return self._snapshot
+
+    def stop(self):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize a recorded session log")
+    parser.add_argument('path')
+    args = parser.parse_args(argv)
+
+    header, records = read_session(args.path)
+    counts = dict.fromkeys(KINDS.values(), 0)
+    seconds = 0.0
+    for kind, seconds, _ in records:
+        name = KINDS.get(kind, 'unknown')
+        counts[name] = counts.get(name, 0) + 1
+    print(f"{args.path}: {seconds:.1f} s, {os.path.getsize(args.path) / 1e6:.2f} MB, recorded {header.get('started', '?')}")
+    print('  ' + ', '.join(f"{count} {kind}" for kind, count in counts.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,56 @@
 import pygame
 import sys
 from typing import Dict, Any, Callable
+from parameters import PRESETS, ParameterStore
+
+BACKGROUND = (30, 30, 40)
+
+# Posted by other threads to make the idle panel redraw changed parameters
+PARAMS_CHANGED = pygame.USEREVENT + 1
+# The window was uncovered or restored and needs a full redraw
+EXPOSE_EVENTS = {pygame.VIDEOEXPOSE, getattr(pygame, 'WINDOWEXPOSED', pygame.VIDEOEXPOSE)}
+
+
+class TextCache:
+    """
+    Rendered text surfaces keyed by (font, text, color). Changing numbers are
+    drawn from cached per-character glyphs so dragging a slider does not
+    render a new string on every frame.
+    """
+
+    def __init__(self, limit=512):
+        self.limit = limit
+        self.labels = {}
+        self.glyphs = {}
+
+    def label(self, font, text, color):
+        key = (id(font), text, color)
+        surface = self.labels.get(key)
+        if surface is None:
+            if len(self.labels) >= self.limit:
+                self.labels.clear()
+            surface = self.labels[key] = font.render(text, True, color)
+        return surface
+
+    def blit_glyphs(self, screen, font, text, color, pos):
+        x, y = pos
+        for char in text:
+            key = (id(font), char, color)
+            glyph = self.glyphs.get(key)
+            if glyph is None:
+                glyph = self.glyphs[key] = font.render(char, True, color)
+            screen.blit(glyph, (x, y))
+            x += glyph.get_width()
+        return x
+
 
 class ShaderControlInterface:
     """
-    GUI interface for controlling shader parameters in real-time
+    GUI interface for controlling shader parameters in real-time.
+
+    Nothing is drawn unless something changed: the loop sleeps in
+    pygame.event.wait(), input marks the affected widgets dirty, and only
+    those screen areas are redrawn and pushed to the display.
     """
     
     def __init__(self, width=400, height=600):
@@ -16,29 +62,14 @@ class ShaderControlInterface:
         
         self.font = pygame.font.Font(None, 24)
         self.small_font = pygame.font.Font(None, 18)
+        self.text = TextCache()
+        self.dirty = []
         
-        # Shader parameters
-        self.params = {
-            'time_scale': 1.0,
-            'audio_sensitivity': 1.0,
-            'color_r': 0.1,
-            'color_g': 0.2, 
-            'color_b': 0.8,
-            'ripple_frequency': 20.0,
-            'ripple_speed': 2.0,
-            'particle_count': 100.0,
-            'particle_speed': 0.1,
-            'zoom': 1.0,
-            'brightness': 1.0
-        }
+        # Shader parameters, with ranges and defaults from the shared registry
+        self.params = ParameterStore()
         
         # Shader presets
-        self.presets = {
-            'Energy Field': {'ripple_frequency': 20.0, 'ripple_speed': 2.0, 'color_r': 0.1, 'color_g': 0.2, 'color_b': 0.8},
-            'Particles': {'particle_count': 100.0, 'particle_speed': 0.1, 'color_r': 1.0, 'color_g': 0.8, 'color_b': 0.2},
-            'Blue Giants': {'brightness': 1.5, 'color_r': 0.2, 'color_g': 0.4, 'color_b': 1.0, 'zoom': 0.8},
-            'Life Forms': {'time_scale': 0.5, 'color_r': 0.2, 'color_g': 1.0, 'color_b': 0.3, 'ripple_frequency': 15.0}
-        }
+        self.presets = PRESETS
         
         # Current shader
         self.current_shader = 'energy_field'
@@ -50,18 +81,39 @@ class ShaderControlInterface:
         # UI Elements
         self.sliders = self._create_sliders()
         self.buttons = self._create_buttons()
+        self.indicator_rect = pygame.Rect(10, 35, 250, 14)
         
         self.running = True
+
+    def notify_changed(self):
+        """Wake the panel to show parameter values changed from another thread"""
+        pygame.event.post(pygame.event.Event(PARAMS_CHANGED))
+
+    def _mark(self, rect):
+        self.dirty.append(rect)
+
+    def _slider_area(self, slider):
+        # The slider bar plus its label above it
+        rect = slider['rect']
+        return pygame.Rect(rect.x - 2, rect.y - 20, max(rect.width, 250) + 4, rect.height + 22)
+
+    def _sync_sliders(self):
+        """Mark sliders whose parameter changed without going through the panel"""
+        for param, slider in self.sliders.items():
+            value = self.params[param]
+            if value != slider['value']:
+                slider['value'] = value
+                self._mark(self._slider_area(slider))
         
     def _create_sliders(self):
         sliders = {}
         y_pos = 50
-        for param, value in self.params.items():
-            sliders[param] = {
+        for param in self.params.params:
+            sliders[param.name] = {
                 'rect': pygame.Rect(50, y_pos, 200, 20),
-                'value': value,
-                'min': 0.0,
-                'max': 2.0 if 'color' in param else 5.0,
+                'value': self.params[param.name],
+                'min': param.minimum,
+                'max': param.maximum,
                 'dragging': False
             }
             y_pos += 40
@@ -83,9 +135,12 @@ class ShaderControlInterface:
             
         return buttons
     
-    def handle_events(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
+    def handle_events(self, events=None):
+        for event in events if events is not None else pygame.event.get():
+            if event.type == PARAMS_CHANGED:
+                self._sync_sliders()
+
+            elif event.type == pygame.QUIT:
                 self.running = False
                 return False
                 
@@ -110,11 +165,15 @@ class ShaderControlInterface:
         for param, slider in self.sliders.items():
             if slider['rect'].collidepoint(pos):
                 slider['dragging'] = True
+                self._mark(self._slider_area(slider))
                 self._update_slider_value(param, pos[0])
                 
         # Check button clicks
         for shader, button_rect in self.buttons.items():
-            if button_rect.collidepoint(pos):
+            if button_rect.collidepoint(pos) and shader != self.current_shader:
+                self._mark(self.buttons[self.current_shader])
+                self._mark(button_rect)
+                self._mark(self.indicator_rect)
                 self.current_shader = shader
                 self.on_shader_change(shader)
     
@@ -125,7 +184,9 @@ class ShaderControlInterface:
     
     def _stop_dragging(self):
         for slider in self.sliders.values():
-            slider['dragging'] = False
+            if slider['dragging']:
+                slider['dragging'] = False
+                self._mark(self._slider_area(slider))
     
     def _update_slider_value(self, param, x):
         slider = self.sliders[param]
@@ -135,8 +196,10 @@ class ShaderControlInterface:
         progress = max(0, min(1, (x - rect.x) / rect.width))
         value = slider['min'] + progress * (slider['max'] - slider['min'])
         
-        slider['value'] = value
-        self.params[param] = value
+        value = self.params.set(param, value)
+        if value != slider['value']:
+            slider['value'] = value
+            self._mark(self._slider_area(slider))
         self.on_param_change(param, value)
     
     def _handle_keypress(self, key):
@@ -159,40 +222,51 @@ class ShaderControlInterface:
             preset = self.presets[preset_name]
             for param, value in preset.items():
                 if param in self.params:
-                    self.params[param] = value
-                    self.sliders[param]['value'] = value
+                    value = self.params.set(param, value)
                     self.on_param_change(param, value)
+            self._sync_sliders()
     
     def _reset_params(self):
-        defaults = {
-            'time_scale': 1.0, 'audio_sensitivity': 1.0, 'color_r': 0.1,
-            'color_g': 0.2, 'color_b': 0.8, 'ripple_frequency': 20.0,
-            'ripple_speed': 2.0, 'particle_count': 100.0, 'particle_speed': 0.1,
-            'zoom': 1.0, 'brightness': 1.0
-        }
-        
-        for param, value in defaults.items():
-            self.params[param] = value
-            self.sliders[param]['value'] = value
+        self.params.reset()
+        for param, value in self.params.as_dict().items():
             self.on_param_change(param, value)
+        self._sync_sliders()
     
-    def draw(self):
-        self.screen.fill((30, 30, 40))
-        
+    def draw(self, full=False):
+        """Redraw the dirty areas, or everything, and push only those to the display"""
+        if full:
+            self.dirty = [self.screen.get_rect()]
+        if not self.dirty:
+            return
+        # Dragging marks the same slider many times per batch of events
+        areas = list({tuple(rect): rect for rect in self.dirty}.values())
+        self.dirty = []
+        for area in areas:
+            self.screen.set_clip(area)
+            self.screen.fill(BACKGROUND, area)
+            self._draw_area(area)
+        self.screen.set_clip(None)
+        if full:
+            pygame.display.flip()
+        else:
+            pygame.display.update(areas)
+
+    def _draw_area(self, area):
         # Title
-        title = self.font.render("Macroverse Shader Controls", True, (255, 255, 255))
-        self.screen.blit(title, (10, 10))
+        self.screen.blit(self.text.label(self.font, "Macroverse Shader Controls", (255, 255, 255)), (10, 10))
         
         # Current shader indicator
-        shader_text = self.small_font.render(f"Current: {self.current_shader}", True, (100, 200, 255))
-        self.screen.blit(shader_text, (10, 35))
+        if area.colliderect(self.indicator_rect):
+            shader_text = self.text.label(self.small_font, f"Current: {self.current_shader}", (100, 200, 255))
+            self.screen.blit(shader_text, self.indicator_rect.topleft)
         
         # Draw sliders
         for param, slider in self.sliders.items():
-            self._draw_slider(param, slider)
+            if area.colliderect(self._slider_area(slider)):
+                self._draw_slider(param, slider)
         
         # Draw shader buttons
-        self._draw_shader_buttons()
+        self._draw_shader_buttons(area)
         
         # Instructions
         instructions = [
@@ -202,11 +276,8 @@ class ShaderControlInterface:
         
         y_pos = self.height - 50
         for instruction in instructions:
-            text = self.small_font.render(instruction, True, (150, 150, 150))
-            self.screen.blit(text, (10, y_pos))
+            self.screen.blit(self.text.label(self.small_font, instruction, (150, 150, 150)), (10, y_pos))
             y_pos += 20
-        
-        pygame.display.flip()
     
     def _draw_slider(self, param, slider):
         rect = slider['rect']
@@ -228,45 +299,64 @@ class ShaderControlInterface:
         # Border
         pygame.draw.rect(self.screen, (100, 100, 100), rect, 2)
         
-        # Label and value
-        label = self.small_font.render(f"{param}: {value:.2f}", True, (255, 255, 255))
+        # Label and value: the name is cached whole, the number is built from glyphs
+        label = self.text.label(self.small_font, f"{param}: ", (255, 255, 255))
         self.screen.blit(label, (rect.x, rect.y - 20))
+        self.text.blit_glyphs(self.screen, self.small_font, f"{value:.2f}", (255, 255, 255),
+                              (rect.x + label.get_width(), rect.y - 20))
     
-    def _draw_shader_buttons(self):
+    def _draw_shader_buttons(self, area):
         for shader, button_rect in self.buttons.items():
+            if not area.colliderect(button_rect):
+                continue
             color = (100, 200, 255) if shader == self.current_shader else (80, 80, 90)
             pygame.draw.rect(self.screen, color, button_rect)
             pygame.draw.rect(self.screen, (150, 150, 150), button_rect, 2)
             
-            text = self.small_font.render(shader.replace('_', ' ').title(), True, (255, 255, 255))
+            text = self.text.label(self.small_font, shader.replace('_', ' ').title(), (255, 255, 255))
             text_rect = text.get_rect(center=button_rect.center)
             self.screen.blit(text, text_rect)
     
     def run(self):
-        clock = pygame.time.Clock()
+        self.draw(full=True)
         
         while self.running:
-            if not self.handle_events():
+            # Sleep until there is input, then take everything that queued up
+            events = [pygame.event.wait()] + pygame.event.get()
+            if not self.handle_events(events):
                 break
-                
-            self.draw()
-            clock.tick(60)
+            if any(event.type in EXPOSE_EVENTS for event in events):
+                self.draw(full=True)
+            else:
+                self.draw()
         
         pygame.quit()
 
 # Example usage integration
 if __name__ == "__main__":
+    from param_bus import open_bus
+
     interface = ShaderControlInterface()
+    # Changes go straight into the renderer's shared parameter block
+    bus = open_bus()
     
     def on_parameter_change(param_name, value):
-        print(f"Parameter changed: {param_name} = {value}")
-        # Here you would send the parameter to your main application
+        if bus:
+            bus.set(param_name, value)
+        else:
+            print(f"Parameter changed: {param_name} = {value}")
         
     def on_shader_change(shader_name):
-        print(f"Shader changed to: {shader_name}")
-        # Here you would change the active shader in your main application
+        if bus:
+            bus.set_scene(shader_name)
+        else:
+            print(f"Shader changed to: {shader_name}")
         
     interface.on_param_change = on_parameter_change
     interface.on_shader_change = on_shader_change
     
-    interface.run()
+    try:
+        interface.run()
+    finally:
+        if bus:
+            bus.close()
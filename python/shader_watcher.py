@@ -0,0 +1,132 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+import moderngl
+
+from program_pool import SHADER_DIR, VERTEX_SHADER, create_standalone_context, read_source
+
+
+class ShaderWatcher:
+    """
+    Watches the shader folder for edited or new `*.glsl` files and the shared
+    vertex shader. Polling, debouncing, reading and a trial compile all happen
+    on a background thread; the render thread only collects finished sources
+    with poll() at a frame boundary.
+    """
+
+    def __init__(self, shader_dir=SHADER_DIR, vertex_shader=VERTEX_SHADER, interval=0.25, debounce=0.3,
+                 validate=True):
+        self.shader_dir = shader_dir
+        self.vertex_shader = vertex_shader
+        self.interval = interval
+        self.debounce = debounce
+        self.validate = validate
+        self._stats = {}
+        self._changed_at = {}
+        self._ready = queue.SimpleQueue()
+        self._running = False
+        self._thread = None
+        self._ctx = None
+        self._vertex_source = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stats = self._scan()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='shader-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def poll(self):
+        """Sources that finished changing since the last call. Never blocks."""
+        changes = []
+        while True:
+            try:
+                changes.append(self._ready.get_nowait())
+            except queue.Empty:
+                return changes
+
+    def _watched(self, name):
+        return name.endswith('.glsl') or name == self.vertex_shader
+
+    def _scan(self):
+        stats = {}
+        for name in os.listdir(self.shader_dir):
+            if not self._watched(name):
+                continue
+            try:
+                st = os.stat(os.path.join(self.shader_dir, name))
+            except OSError:
+                continue
+            stats[name] = (st.st_mtime_ns, st.st_size)
+        return stats
+
+    def _run(self):
+        if self.validate:
+            self._open_validation_context()
+        while self._running:
+            time.sleep(self.interval)
+            try:
+                self._check()
+            except Exception:
+                logging.exception("Shader watcher error")
+
+    def _check(self):
+        now = time.monotonic()
+        stats = self._scan()
+        for name, stat in stats.items():
+            if self._stats.get(name) != stat:
+                # Restart the debounce window on every write
+                self._changed_at[name] = now
+        self._stats = stats
+
+        for name, changed_at in list(self._changed_at.items()):
+            if now - changed_at < self.debounce:
+                continue
+            del self._changed_at[name]
+            if name not in stats:
+                continue
+            try:
+                source = read_source(self.shader_dir, name)
+            except (OSError, UnicodeDecodeError) as e:
+                logging.warning(f"Could not read {name}: {e}")
+                continue
+            source.error = self._trial_compile(source)
+            if source.error:
+                logging.error(f"Shader {name} failed to compile, keeping the last good version:\n{source.error}")
+            self._ready.put(source)
+
+    def _open_validation_context(self):
+        """A private headless context so broken edits are caught off the render thread"""
+        try:
+            self._ctx = create_standalone_context()
+        except Exception as e:
+            logging.info(f"No standalone GL context for shader validation: {e}")
+            return
+        try:
+            self._vertex_source = read_source(self.shader_dir, self.vertex_shader).source
+        except OSError:
+            self._vertex_source = None
+
+    def _trial_compile(self, source):
+        if self._ctx is None:
+            return None
+        if source.name == self.vertex_shader:
+            self._vertex_source = source.source
+            return None
+        if self._vertex_source is None:
+            return None
+        try:
+            self._ctx.program(vertex_shader=self._vertex_source, fragment_shader=source.source).release()
+        except moderngl.Error as e:
+            return str(e)
+        return None
@@ -0,0 +1,411 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: only the transport's own buffer is checked
+
+BROADCAST_PORT = 8765
+VERSION = 1
+KEYFRAME = 1  # packet flag: every parameter, not just the changed ones
+
+# Packet: magic 'MV', version, flags, frame number, clock, audio level, onset,
+# envelope, scene index, changed parameter count, band count, padding; then
+# (parameter index, value) pairs for the changed parameters and the bands as 0..255
+PACKET = struct.Struct('<2sBBIffffBBBx')
+CHANGE = np.dtype([('index', 'u1'), ('value', '<f4')])
+# Clients acknowledge each packet they have handled by sending its frame number back
+ACK = struct.Struct('<I')
+
+# Kernel send buffer asked for per client. Frames are only written to a client once everything
+# before them has left this buffer, so it bounds bursts, not how far behind a client can fall.
+CLIENT_BUFFER = 4 * 1024
+# Packets a client may have been sent and not yet acknowledged; later frames are dropped until it does,
+# so a client is never shown state more than this many of its own packet handling times old. With 2, a
+# client that keeps up still lost frames whenever its acknowledgement was a moment late (up to ~9% in
+# broadcast_bench with a few fast clients); 3 loses none, at the cost of one more handling time of lag
+# (50 ms more for the bench's slow clients)
+MAX_IN_FLIGHT = 3
+# Linux ioctl: bytes queued on a socket that the kernel has not sent yet (the peer's window is full)
+SIOCOUTQNSD = 0x894B
+# A client that has taken nothing for this long is disconnected
+STALL_TIMEOUT = 10.0
+MAX_CLIENTS = 64
+
+WS_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OP_CONTINUATION, OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0, 1, 2, 8, 9, 10
+
+
+def encode_frame(payload, opcode=OP_BINARY, mask=None):
+    """One unfragmented WebSocket frame; clients must `mask` (4 bytes) what they send, servers must not"""
+    n = len(payload)
+    mask_bit = 0x80 if mask else 0
+    if n < 126:
+        head = struct.pack('!BB', 0x80 | opcode, mask_bit | n)
+    elif n < 1 << 16:
+        head = struct.pack('!BBH', 0x80 | opcode, mask_bit | 126, n)
+    else:
+        head = struct.pack('!BBQ', 0x80 | opcode, mask_bit | 127, n)
+    if mask:
+        data = np.frombuffer(payload, dtype=np.uint8) ^ np.resize(np.frombuffer(mask, dtype=np.uint8), n)
+        return head + mask + data.tobytes()
+    return head + payload
+
+
+async def read_frame(reader, limit=1 << 20):
+    """(opcode, payload) of the next WebSocket frame, unmasked"""
+    first, second = await reader.readexactly(2)
+    n = second & 0x7F
+    if n == 126:
+        n, = struct.unpack('!H', await reader.readexactly(2))
+    elif n == 127:
+        n, = struct.unpack('!Q', await reader.readexactly(8))
+    if n > limit:
+        raise ValueError(f"{n} byte WebSocket frame is over the {limit} byte limit")
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(n)
+    if mask:
+        payload = (np.frombuffer(payload, dtype=np.uint8) ^ np.resize(np.frombuffer(mask, dtype=np.uint8), n)).tobytes()
+    return first & 0x0F, payload
+
+
+def accept_key(key):
+    return base64.b64encode(hashlib.sha1(key.encode('ascii') + WS_GUID).digest()).decode('ascii')
+
+
+class StateEncoder:
+    """
+    Packs the renderer's state into broadcast packets. Parameters are sent as
+    changes against the previous packet; a keyframe carries all of them, for
+    clients that are new or missed a packet.
+    """
+
+    def __init__(self, n_params, n_bands):
+        self.last = np.full(n_params, np.nan, dtype=np.float32)
+        self._changes = np.zeros(n_params, dtype=CHANGE)
+        self._changes['index'] = np.arange(n_params)
+        self._bands = np.zeros(n_bands, dtype=np.uint8)
+        self.frame = 0
+
+    def encode(self, clock, scene, values, snapshot, keyframe=False):
+        """The delta packet for this frame, and a keyframe packet if asked for (else None)"""
+        changed = np.flatnonzero(values != self.last)
+        self.last[:] = values
+        self._changes['value'] = values
+        np.clip(snapshot.bands * 255.0 + 0.5, 0.0, 255.0, out=self._bands, casting='unsafe')
+        bands = self._bands.tobytes()
+
+        def pack(flags, changes):
+            return PACKET.pack(b'MV', VERSION, flags, self.frame & 0xFFFFFFFF, clock, snapshot.level, snapshot.onset,
+                               snapshot.envelope, scene, len(changes), len(bands)) + changes.tobytes() + bands
+
+        delta = pack(0, self._changes[changed])
+        key = pack(KEYFRAME, self._changes) if keyframe else None
+        self.frame += 1
+        return delta, key
+
+
+def decode_packet(data):
+    """A packet as a dict; `changes` is an array of (index, value) and `bands` of 0..1 values"""
+    magic, version, flags, frame, clock, level, onset, envelope, scene, n_changes, n_bands = PACKET.unpack_from(data)
+    if magic != b'MV' or version != VERSION:
+        raise ValueError("not a state packet")
+    changes = np.frombuffer(data, dtype=CHANGE, count=n_changes, offset=PACKET.size)
+    bands = np.frombuffer(data, dtype=np.uint8, count=n_bands, offset=PACKET.size + changes.nbytes) / 255.0
+    return {'keyframe': bool(flags & KEYFRAME), 'frame': frame, 'clock': clock, 'level': level, 'onset': onset,
+            'envelope': envelope, 'scene': scene, 'changes': changes, 'bands': bands}
+
+
+async def connect(host='127.0.0.1', port=BROADCAST_PORT, sock=None, limit=1 << 16):
+    """
+    Open a WebSocket to a StateBroadcaster as a browser would, over `sock` if
+    given (already connected). Returns (reader, writer, hello).
+    """
+    if sock:
+        reader, writer = await asyncio.open_connection(sock=sock, limit=limit)
+    else:
+        reader, writer = await asyncio.open_connection(host, port, limit=limit)
+    key = base64.b64encode(os.urandom(16)).decode('ascii')
+    writer.write(f"GET / HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                 f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n".encode('ascii'))
+    response = await reader.readuntil(b'\r\n\r\n')
+    if not response.startswith(b'HTTP/1.1 101') or accept_key(key).encode('ascii') not in response:
+        writer.close()
+        raise ConnectionError(f"WebSocket upgrade refused: {response.splitlines()[0].decode('latin-1')}")
+    opcode, payload = await read_frame(reader)
+    return reader, writer, json.loads(payload)
+
+
+class Client:
+    def __init__(self, writer):
+        self.writer = writer
+        self.transport = writer.transport
+        self.address = writer.get_extra_info('peername')
+        self.need_keyframe = True
+        self.sent = 0
+        self.dropped = 0
+        self.stalled_since = None
+        self.in_flight = deque()  # frame numbers of the packets written and not yet acknowledged
+        sock = writer.get_extra_info('socket')
+        self.fileno = sock.fileno() if sock is not None else -1
+
+    def unsent(self):
+        """Bytes written to this client that have not gone out on the wire yet"""
+        queued = self.transport.get_write_buffer_size()
+        if fcntl is not None and self.fileno >= 0:
+            try:
+                queued += struct.unpack('i', fcntl.ioctl(self.fileno, SIOCOUTQNSD, b'\0\0\0\0'))[0]
+            except OSError:
+                pass
+        return queued
+
+    def acknowledge(self, frame):
+        while self.in_flight and self.in_flight[0] <= frame:
+            self.in_flight.popleft()
+
+
+class StateBroadcaster:
+    """
+    Serves the renderer's parameters, scene and audio bands to browsers over
+    a WebSocket on localhost. publish() is called once per frame on the render
+    thread: it only packs a small binary packet and hands it to the server's
+    event loop thread, which writes the same bytes to every client. A frame is
+    only written to a client once its previous one has gone out and it has
+    acknowledged all but MAX_IN_FLIGHT of the packets it was sent; otherwise
+    the frame is dropped instead of queued, and the client gets a keyframe of
+    the latest state once it has caught up. Slow browsers so never fall more
+    than a few packets behind, nor hold up the renderer or each other.
+
+    Only the event loop thread touches the clients. What the render thread
+    and stats() need of them, client_count, want_keyframe and buffered, is
+    kept as single values written by the loop thread, so a reader gets the
+    latest or the one before it, never a half-updated set. Either is fine: a
+    stale count costs a new client its first frame or a departed one an
+    encode, and a stale want_keyframe delays a keyframe by a frame.
+    """
+
+    def __init__(self, store, scenes, n_bands, host='127.0.0.1', port=BROADCAST_PORT,
+                 client_buffer=CLIENT_BUFFER, max_clients=MAX_CLIENTS):
+        self.store = store
+        self.scenes = scenes
+        self.host = host
+        self.port = port
+        self.client_buffer = client_buffer
+        self.max_clients = max_clients
+        self.n_bands = n_bands
+        self.encoder = StateEncoder(len(store.values), n_bands)
+        self.clients = set()
+        self.client_count = 0
+        self.want_keyframe = False
+        self.buffered = 0  # largest unsent backlog of any client when last written to
+        self.loop = None
+        self.server = None
+        self.sent = 0
+        self.dropped = 0
+        self._thread = None
+        self._ready = threading.Event()
+
+    def hello(self):
+        """What a client needs to decode packets, sent as JSON when it connects"""
+        return json.dumps({'version': VERSION, 'ack': True, 'params': [p.name for p in self.store.params],
+                           'minimum': self.store.minimum.tolist(), 'maximum': self.store.maximum.tolist(),
+                           'scenes': [name.replace('.glsl', '') for name in self.scenes],
+                           'bands': self.n_bands})
+
+    def start(self):
+        """Start the server thread; returns once the port is open, or failed to"""
+        self._thread = threading.Thread(target=self._run, name='broadcast', daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout=5.0)
+        return self.server is not None
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(asyncio.start_server(self._serve, self.host, self.port))
+            self.port = self.server.sockets[0].getsockname()[1]
+            print(f"Broadcasting state on ws://{self.host}:{self.port}")
+        except OSError as e:
+            logging.warning(f"Could not open state broadcast port {self.host}:{self.port}: {e}")
+        finally:
+            self._ready.set()
+        if self.server is None:
+            self.loop.close()
+            return
+        try:
+            self.loop.run_forever()
+        finally:
+            self.server.close()
+            for client in list(self.clients):
+                client.transport.abort()
+            self.loop.run_until_complete(asyncio.sleep(0))
+            self.loop.close()
+
+    async def _serve(self, reader, writer):
+        try:
+            key = await asyncio.wait_for(self._handshake(reader), timeout=5.0)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError,
+                ValueError) as e:
+            writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            writer.close()
+            logging.warning(f"Refused state broadcast client {writer.get_extra_info('peername')}: {e}")
+            return
+        if len(self.clients) >= self.max_clients:
+            writer.write(b'HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            writer.close()
+            return
+        writer.write(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                     b'Sec-WebSocket-Accept: ' + accept_key(key).encode('ascii') + b'\r\n\r\n')
+        writer.write(encode_frame(self.hello().encode('utf-8'), OP_TEXT))
+        sock = writer.get_extra_info('socket')
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            # Keep the kernel's share of a slow client's backlog small too, so dropping starts early
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.client_buffer)
+        except OSError:
+            pass
+        client = Client(writer)
+        self.clients.add(client)
+        self.client_count = len(self.clients)
+        self.want_keyframe = True
+        try:
+            while True:
+                opcode, payload = await read_frame(reader)
+                if opcode == OP_CLOSE:
+                    writer.write(encode_frame(payload[:2], OP_CLOSE))
+                    break
+                if opcode == OP_PING:
+                    writer.write(encode_frame(payload, OP_PONG))
+                elif opcode == OP_BINARY and len(payload) == ACK.size:
+                    client.acknowledge(*ACK.unpack(payload))
+                # Anything else from a browser is ignored
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self.clients.discard(client)
+            self.client_count = len(self.clients)
+            writer.close()
+
+    async def _handshake(self, reader):
+        request = await reader.readuntil(b'\r\n\r\n')
+        lines = request.decode('latin-1').split('\r\n')
+        if not lines[0].startswith('GET '):
+            raise ValueError(f"not a WebSocket request: {lines[0]!r}")
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('upgrade', '').lower() != 'websocket' or 'sec-websocket-key' not in headers:
+            raise ValueError("not a WebSocket upgrade")
+        return headers['sec-websocket-key']
+
+    def publish(self, clock, scene, snapshot):
+        """Send this frame's state; called on the render thread"""
+        if not self.client_count:
+            self.encoder.frame += 1  # frame numbers count every rendered frame
+            return
+        frame = self.encoder.frame & 0xFFFFFFFF
+        delta, key = self.encoder.encode(clock, scene, self.store.values, snapshot, self.want_keyframe)
+        self.loop.call_soon_threadsafe(self._send, frame, delta, key)
+
+    def _send(self, frame, delta, key):
+        delta = encode_frame(delta)
+        key = encode_frame(key) if key else None
+        now = time.perf_counter()
+        buffered = 0
+        for client in list(self.clients):
+            if client.transport.is_closing():
+                continue
+            unsent = client.unsent()
+            buffered = max(buffered, unsent)
+            if unsent or len(client.in_flight) >= MAX_IN_FLIGHT:
+                # Still sending or handling earlier frames: skip this one, and start again from a keyframe
+                client.dropped += 1
+                self.dropped += 1
+                client.need_keyframe = True
+                if client.stalled_since is None:
+                    client.stalled_since = now
+                elif now - client.stalled_since > STALL_TIMEOUT:
+                    logging.warning(f"Disconnecting state broadcast client {client.address}: stalled")
+                    client.transport.abort()
+                    self.clients.discard(client)
+                    self.client_count = len(self.clients)
+                continue
+            client.stalled_since = None
+            if client.need_keyframe:
+                if key is None:
+                    continue  # one is asked for; it comes with the next frame
+                client.transport.write(key)
+                client.need_keyframe = False
+            else:
+                client.transport.write(delta)
+            client.in_flight.append(frame)
+            client.sent += 1
+            self.sent += 1
+        self.buffered = buffered
+        self.want_keyframe = any(client.need_keyframe for client in self.clients)
+
+    def stats(self):
+        clients = self.client_count
+        return {'clients': clients, 'sent': self.sent, 'dropped': self.dropped,
+                'buffered': self.buffered if clients else 0}
+
+    def stop(self):
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+
+async def _consume(host, port):
+    reader, writer, hello = await connect(host, port)
+    print(f"Connected to ws://{host}:{port}: {len(hello['params'])} parameters, scenes {', '.join(hello['scenes'])}")
+    values = np.zeros(len(hello['params']), dtype=np.float32)
+    received = 0
+    report = time.perf_counter()
+    while True:
+        opcode, payload = await read_frame(reader)
+        if opcode == OP_CLOSE:
+            return
+        if opcode != OP_BINARY:
+            continue
+        packet = decode_packet(payload)
+        values[packet['changes']['index']] = packet['changes']['value']
+        writer.write(encode_frame(ACK.pack(packet['frame']), mask=os.urandom(4)))
+        received += 1
+        now = time.perf_counter()
+        if now - report >= 1.0:
+            params = ' '.join(f"{name}={value:.2f}" for name, value in zip(hello['params'], values))
+            print(f"{received / (now - report):.0f} packets/s, scene {hello['scenes'][packet['scene']]}, "
+                  f"level {packet['level']:.2f} | {params}")
+            report, received = now, 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reference client: print the state main.py --broadcast sends to browsers")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=BROADCAST_PORT)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_consume(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
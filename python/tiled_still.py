@@ -0,0 +1,152 @@
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from video_output import AsyncReadback, PngStreamWriter, flip_rows
+
+DEFAULT_TILE = 1024  # every GL 3.3 implementation supports framebuffers this size
+
+# Per-process state, set up once by _init_worker
+_worker = {}
+
+
+class StillJob:
+    """Everything a worker needs to render any tile row of a still"""
+
+    def __init__(self, scene, size, time=0.0, fps=60.0, params=None, audio='synthetic', quality=None,
+                 tile=DEFAULT_TILE):
+        self.scene = scene
+        self.size = tuple(size)
+        self.time = time
+        self.fps = fps
+        self.params = params
+        self.audio = audio
+        self.quality = quality
+        self.tile = tile
+
+    @property
+    def grid(self):
+        """(columns, rows) of tiles"""
+        return -(-self.size[0] // self.tile), -(-self.size[1] // self.tile)
+
+    def tile_rect(self, column, row):
+        """Top-down pixel (x, y, width, height) of a tile, cut short at the image's edges"""
+        x, y = column * self.tile, row * self.tile
+        return x, y, min(self.tile, self.size[0] - x), min(self.tile, self.size[1] - y)
+
+
+class TileRenderer:
+    """
+    Renders a still one tile at a time into a tile-sized framebuffer, so the
+    image can be far larger than the GPU's framebuffer limit. Each tile points
+    u_tile at its part of the image while u_resolution stays the full size,
+    so scenes compute the same coordinates they would for one huge frame.
+    Tiles are read back a tile late (AsyncReadback) and gathered into one
+    row-high band at a time.
+    """
+
+    def __init__(self, job, ctx=None):
+        from scene_player import OfflineRenderer, ParamTrack
+        self.job = job
+        self.readback = None
+        tile = job.tile
+        track = ParamTrack.load(job.params) if job.params else None
+        self.renderer = OfflineRenderer(job.scene, job.size, job.fps, track, job.audio, ctx=ctx,
+                                        quality=job.quality, tile_size=(tile, tile))
+        info = self.renderer.ctx.info
+        limit = min(info['GL_MAX_RENDERBUFFER_SIZE'], *info['GL_MAX_VIEWPORT_DIMS'])
+        if tile > limit:
+            self.release()
+            raise ValueError(f"{tile} pixel tiles are larger than this GPU's {limit} pixel framebuffer limit")
+        self.index = int(round(job.time * job.fps))
+        self.readback = AsyncReadback(self.renderer.ctx, (tile, tile))
+        self.pixels = np.empty(tile * tile * 3, dtype=np.uint8)
+        self.band = np.empty((tile, job.size[0], 3), dtype=np.uint8)
+
+    def render_rows(self, rows):
+        """Yield (row, band) for each tile row in `rows`; a band is a top-down view valid until the next one"""
+        width, height = self.job.size
+        tile = self.job.tile
+        for row in rows:
+            for column in range(self.job.grid[0]):
+                x, y, _, _ = self.job.tile_rect(column, row)
+                # Tiles are top aligned; in GL's bottom-up coordinates this one starts a tile below y
+                self.renderer.tile = (x / width, (height - y - tile) / height, tile / width, tile / height)
+                self.renderer.render_frame(self.index)
+                done = self.readback.read(self.renderer.fbo, (column, row), self.pixels)
+                if done is not None and self._place(*done):
+                    yield done[1], self.band[:self.job.tile_rect(*done)[3]]
+        done = self.readback.flush(self.pixels)
+        if done is not None and self._place(*done):
+            yield done[1], self.band[:self.job.tile_rect(*done)[3]]
+
+    def _place(self, column, row):
+        """Copy a read back tile into the band; True when it completes the band"""
+        x, _, w, h = self.job.tile_rect(column, row)
+        self.band[:h, x:x + w] = flip_rows(self.pixels, (self.job.tile, self.job.tile))[:h, :w]
+        return column == self.job.grid[0] - 1
+
+    def release(self):
+        if self.readback is not None:
+            self.readback.release()
+        self.renderer.release()
+
+
+def _init_worker(job, threads):
+    # Split the software rasterizer's threads between the workers
+    if threads:
+        os.environ.setdefault('LP_NUM_THREADS', str(threads))
+    _worker['tiles'] = TileRenderer(job)
+
+
+def _render_row(row):
+    for _, band in _worker['tiles'].render_rows([row]):
+        return row, band.copy()
+
+
+def render_still(job, output, dpi=None, workers=1, progress=None):
+    """
+    Render a still into a PNG file tile row by tile row, encoding each row as
+    soon as it is complete. With more than one worker, rows render in
+    separate processes, each with its own headless GL context; at most two
+    rows per worker are in flight, so memory is bounded by the image's width,
+    not its height. Returns the seconds taken.
+    """
+    workers = workers or os.cpu_count() or 1
+    rows = job.grid[1]
+    writer = PngStreamWriter(output, job.size, dpi=dpi)
+    start = time.perf_counter()
+    try:
+        if workers == 1:
+            tiles = TileRenderer(job)
+            try:
+                for row, band in tiles.render_rows(range(rows)):
+                    writer.write_rows(band)
+                    if progress:
+                        progress(row + 1, rows)
+            finally:
+                tiles.release()
+        else:
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            ctx = multiprocessing.get_context('spawn')  # GL contexts do not survive fork
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                                     initargs=(job, threads)) as pool:
+                pending = deque()
+                submitted = 0
+                while submitted < rows or pending:
+                    while submitted < rows and len(pending) < workers * 2:
+                        pending.append(pool.submit(_render_row, submitted))
+                        submitted += 1
+                    row, band = pending.popleft().result()
+                    writer.write_rows(band)
+                    if progress:
+                        progress(row + 1, rows)
+    except BaseException:
+        writer.discard()
+        raise
+    writer.close()
+    return time.perf_counter() - start
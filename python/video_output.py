@@ -0,0 +1,254 @@
+import os
+import queue
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+
+class AsyncReadback:
+    """
+    Double-buffered pixel-pack readback. Each frame is copied into one GPU
+    buffer while the previous frame, which has had a whole frame to finish
+    transferring, is pulled from the other, so rendering and CPU work overlap.
+    """
+
+    def __init__(self, ctx, size, components=3):
+        self.size = size
+        self.components = components
+        self.frame_bytes = size[0] * size[1] * components
+        self.buffers = [ctx.buffer(reserve=self.frame_bytes) for _ in range(2)]
+        self.tags = [None, None]
+        self.index = 0
+
+    def read(self, fbo, tag, out):
+        """
+        Start reading fbo into the GPU, then copy the previous frame into `out`.
+        Returns the previous frame's tag, or None if there was none.
+        """
+        fbo.read_into(self.buffers[self.index], components=self.components, alignment=1)
+        self.tags[self.index] = tag
+        self.index ^= 1
+        return self._collect(out)
+
+    def flush(self, out):
+        """Copy out the last pending frame. Returns its tag, or None."""
+        self.index ^= 1
+        tag = self._collect(out)
+        self.index ^= 1
+        return tag
+
+    def _collect(self, out):
+        tag = self.tags[self.index]
+        if tag is None:
+            return None
+        self.buffers[self.index].read_into(out)
+        self.tags[self.index] = None
+        return tag
+
+    def release(self):
+        for buffer in self.buffers:
+            buffer.release()
+
+
+def flip_rows(data, size, components=3):
+    """View of a bottom-up GL readback as a top-down (height, width, components) image"""
+    return data.reshape(size[1], size[0], components)[::-1]
+
+
+class PngSequenceWriter:
+    def __init__(self, directory, pattern='frame_{:06d}.png', compress_level=6):
+        from PIL import Image
+        self._image = Image
+        self.directory = directory
+        self.pattern = pattern
+        self.compress_level = compress_level
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, index):
+        return os.path.join(self.directory, self.pattern.format(index))
+
+    def write(self, index, image):
+        self._image.fromarray(np.ascontiguousarray(image)).save(self.path(index), compress_level=self.compress_level)
+
+    def close(self):
+        pass
+
+
+class PngStreamWriter:
+    """
+    One PNG image written a band of rows at a time, so an image of any size
+    is encoded without ever holding all of it. Rows go through zlib as they
+    arrive; the file is moved into place when the last row is written.
+    """
+
+    def __init__(self, path, size, dpi=None, compress_level=6, components=3):
+        self.path = path
+        self.size = size
+        self.components = components
+        self.rows = 0
+        self._tmp = path + '.part'
+        self.file = open(self._tmp, 'wb')
+        self._zlib = zlib.compressobj(compress_level)
+        color_type = {1: 0, 3: 2, 4: 6}[components]
+        self.file.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', size[0], size[1], 8, color_type, 0, 0, 0))
+        if dpi:
+            per_metre = int(round(dpi / 0.0254))
+            self._chunk(b'pHYs', struct.pack('>IIB', per_metre, per_metre, 1))
+
+    def _chunk(self, kind, data):
+        self.file.write(struct.pack('>I', len(data)) + kind + data)
+        self.file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
+
+    def write_rows(self, rows):
+        """Append a top-down (height, width, components) uint8 band of rows"""
+        if self.rows + len(rows) > self.size[1]:
+            raise ValueError(f"{self.rows + len(rows)} rows written to a {self.size[1]} row image")
+        # Every scanline starts with its filter type; 0 = none
+        lines = np.zeros((len(rows), self.size[0] * self.components + 1), dtype=np.uint8)
+        lines[:, 1:] = rows.reshape(len(rows), -1)
+        data = self._zlib.compress(lines.data)
+        if data:
+            self._chunk(b'IDAT', data)
+        self.rows += len(rows)
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.rows != self.size[1]:
+            self.discard()
+            raise ValueError(f"PNG closed after {self.rows} of {self.size[1]} rows; nothing written")
+        self._chunk(b'IDAT', self._zlib.flush())
+        self._chunk(b'IEND', b'')
+        self.file.close()
+        os.replace(self._tmp, self.path)
+
+    def discard(self):
+        """Abandon the image, removing what was written of it"""
+        if not self.file.closed:
+            self.file.close()
+            os.remove(self._tmp)
+
+
+class RawVideoWriter:
+    """Headerless rgb24 frames, e.g. for `ffmpeg -f rawvideo -pix_fmt rgb24 -s WxH -r FPS -i out.rgb`"""
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+
+    def write(self, index, image):
+        self.file.write(np.ascontiguousarray(image).data)
+
+    def close(self):
+        self.file.close()
+
+
+def y4m_header(size, fps):
+    return f"YUV4MPEG2 W{size[0]} H{size[1]} F{int(round(fps * 1000))}:1000 Ip A1:1 C444\n".encode('ascii')
+
+
+class Y4mWriter:
+    """YUV4MPEG2 stream with full-resolution chroma (C444), BT.601 full range"""
+
+    def __init__(self, path, size, fps, header=True):
+        self.file = open(path, 'wb')
+        self.size = size
+        w, h = size
+        self._planes = np.zeros((3, h, w), dtype=np.uint8)
+        self._work = np.zeros((h, w), dtype=np.int32)
+        self._rgb = np.zeros((3, h, w), dtype=np.int32)
+        if header:
+            self.file.write(y4m_header(size, fps))
+
+    # Fixed point (x256) BT.601 coefficients; integer math keeps output bit-identical
+    _MATRIX = ((77, 150, 29, 0), (-43, -85, 128, 128), (128, -107, -21, 128))
+
+    def write(self, index, image):
+        rgb = self._rgb
+        for c in range(3):
+            rgb[c] = image[:, :, c]
+        work = self._work
+        for plane, (kr, kg, kb, offset) in zip(self._planes, self._MATRIX):
+            np.multiply(rgb[0], kr, out=work)
+            work += rgb[1] * kg
+            work += rgb[2] * kb
+            work += 128 + (offset << 8)
+            work >>= 8
+            np.clip(work, 0, 255, out=work)
+            plane[:] = work
+        self.file.write(b'FRAME\n')
+        self.file.write(self._planes.data)
+
+    def close(self):
+        self.file.close()
+
+
+FORMATS = ('png', 'y4m', 'raw', 'shm')
+
+
+def open_writer(fmt, output, size, fps):
+    if fmt == 'shm':
+        # Published for other processes instead of written; see frame_share.py
+        from frame_share import FrameRing
+        return FrameRing.create(output, size, fps=fps)
+    if fmt == 'png':
+        return PngSequenceWriter(output)
+    if fmt == 'y4m':
+        return Y4mWriter(output, size, fps)
+    if fmt == 'raw':
+        return RawVideoWriter(output)
+    raise ValueError(f"Unknown output format {fmt!r}, expected one of {FORMATS}")
+
+
+class EncoderThread:
+    """
+    Encodes frames on a background thread. Host frame buffers come from a
+    small fixed pool, so a slow encoder applies back-pressure instead of
+    letting memory grow.
+    """
+
+    def __init__(self, writer, size, components=3, depth=3):
+        self.writer = writer
+        self.size = size
+        self.components = components
+        self._free = queue.Queue()
+        for _ in range(depth + 1):
+            self._free.put(np.zeros(size[0] * size[1] * components, dtype=np.uint8))
+        self._queue = queue.Queue(maxsize=depth)
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name='frame-encoder', daemon=True)
+        self._thread.start()
+
+    def acquire(self):
+        return self._free.get()
+
+    def submit(self, index, data):
+        if self.error:
+            raise self.error
+        self._queue.put((index, data))
+
+    def release(self, data):
+        self._free.put(data)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            index, data = item
+            try:
+                if self.error is None:
+                    self.writer.write(index, flip_rows(data, self.size, self.components))
+            except Exception as e:
+                self.error = e
+            finally:
+                self._free.put(data)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self.writer.close()
+        if self.error:
+            raise self.error
@@ -6,6 +6,28 @@ uniform vec2 u_resolution;
 uniform float u_time;
 uniform float u_audio;
 
+// Audio features: u_spectrum holds 16 log-spaced bands (x = 0 low .. 1 high)
+uniform sampler2D u_spectrum;
+uniform float u_rms;
+uniform float u_flux;
+uniform float u_onset;
+uniform float u_envelope;
+
+// Quality tier, injected by the shader loader: 0 low, 1 medium, 2 high
+#ifndef QUALITY
+#define QUALITY 2
+#endif
+#if QUALITY == 0
+#define MARCH_STEPS 32
+#define FBM_OCTAVES 3
+#elif QUALITY == 1
+#define MARCH_STEPS 48
+#define FBM_OCTAVES 4
+#else
+#define MARCH_STEPS 64
+#define FBM_OCTAVES 6
+#endif
+
 float sphere(vec3 p, float r) {
     return length(p) - r;
 }
@@ -23,7 +45,7 @@ float noise(vec3 p) {
 float fbm(vec3 p) {
     float value = 0.0;
     float amplitude = 0.5;
-    for (int i = 0; i < 6; i++) {
+    for (int i = 0; i < FBM_OCTAVES; i++) {
         value += amplitude * noise(p);
         p *= 2.0;
         amplitude *= 0.5;
@@ -35,13 +57,15 @@ void main() {
     vec2 st = v_coord * 2.0 - 1.0;
     st.x *= u_resolution.x / u_resolution.y;
 
+    float bass = texture(u_spectrum, vec2(0.1, 0.5)).r;
+
     vec3 ro = vec3(0.0, 0.0, -5.0);
     vec3 rd = normalize(vec3(st, 1.0));
 
     float d = 0.0;
     vec3 color = vec3(0.0);
     
-    for (int i = 0; i < 64; i++) {
+    for (int i = 0; i < MARCH_STEPS; i++) {
         vec3 p = ro + rd * d;
         float ds = 1000.0;
         
@@ -57,7 +81,7 @@ void main() {
             
             // Core with pulsing fusion
             float corePulse = 1.0 + sin(u_time * 8.0 + j_float * 2.0) * 0.3;
-            float coreSize = 1.2 + u_audio * 0.8;
+            float coreSize = 1.2 + u_audio * 0.8 + bass * 0.4;
             ds = smin(ds, sphere(q, coreSize * corePulse), 0.8);
             
             // Gaseous atmosphere around each core
@@ -98,7 +122,7 @@ void main() {
     
     // Add background gas clouds
     float bgGas = fbm(vec3(st * 2.0, u_time * 0.1)) * 0.2;
-    color += vec3(0.05, 0.1, 0.3) * bgGas;
+    color += vec3(0.05, 0.1, 0.3) * bgGas * (1.0 + u_onset);
 
     FragColor = vec4(color, 1.0);
 }
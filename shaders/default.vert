@@ -3,7 +3,10 @@
 in vec3 in_position;
 out vec2 v_coord;
 
+// Part of the image this draw covers (offset, scale); all of it unless rendering tiles
+uniform vec4 u_tile = vec4(0.0, 0.0, 1.0, 1.0);
+
 void main() {
     gl_Position = vec4(in_position, 1.0);
-    v_coord = in_position.xy * 0.5 + 0.5;
+    v_coord = u_tile.xy + (in_position.xy * 0.5 + 0.5) * u_tile.zw;
 }
@@ -6,14 +6,27 @@ uniform vec2 u_resolution;
 uniform float u_time;
 uniform float u_audio;
 
-// Enhanced controls
-uniform float u_zoom = 1.0;
-uniform float u_brightness = 1.0;
-uniform float u_color_r = 0.1;
-uniform float u_color_g = 0.2;
-uniform float u_color_b = 0.8;
-uniform float u_ripple_frequency = 20.0;
-uniform float u_ripple_speed = 2.0;
+// Audio features: u_spectrum holds 16 log-spaced bands (x = 0 low .. 1 high)
+uniform sampler2D u_spectrum;
+uniform float u_rms;
+uniform float u_flux;
+uniform float u_onset;
+uniform float u_envelope;
+
+// Enhanced controls, packed in the same order as PARAMS in python/parameters.py
+layout(std140) uniform MacroverseParams {
+    float u_time_scale;
+    float u_audio_sensitivity;
+    float u_color_r;
+    float u_color_g;
+    float u_color_b;
+    float u_ripple_frequency;
+    float u_ripple_speed;
+    float u_particle_count;
+    float u_particle_speed;
+    float u_zoom;
+    float u_brightness;
+};
 
 void main() {
     vec2 st = v_coord;
@@ -35,7 +48,9 @@ void main() {
         d = sin(d * u_ripple_frequency * layer - u_time * u_ripple_speed + u_audio * 10.0) / (20.0 * layer);
         d = abs(d);
         
-        color += vec3(d) * (1.0 / layer);
+        // Each layer follows its own slice of the spectrum
+        float band = texture(u_spectrum, vec2((layer - 0.5) / 3.0, 0.5)).r;
+        color += vec3(d) * (1.0 / layer) * (1.0 + band);
     }
 
     // Apply color mapping and brightness
@@ -44,7 +59,7 @@ void main() {
     color.b *= u_color_b * u_brightness;
     
     // Audio reactive glow
-    float glow = 1.0 + u_audio * 2.0;
+    float glow = 1.0 + u_audio * 2.0 + u_onset * 0.5;
     color *= glow;
 
     FragColor = vec4(color, 1.0);
@@ -6,6 +6,25 @@ uniform vec2 u_resolution;
 uniform float u_time;
 uniform float u_audio;
 
+// Audio features: u_spectrum holds 16 log-spaced bands (x = 0 low .. 1 high)
+uniform sampler2D u_spectrum;
+uniform float u_rms;
+uniform float u_flux;
+uniform float u_onset;
+uniform float u_envelope;
+
+// Quality tier, injected by the shader loader: 0 low, 1 medium, 2 high
+#ifndef QUALITY
+#define QUALITY 2
+#endif
+#if QUALITY == 0
+#define FBM_OCTAVES 3
+#elif QUALITY == 1
+#define FBM_OCTAVES 4
+#else
+#define FBM_OCTAVES 6
+#endif
+
 // Noise functions for terrain generation
 float hash(vec2 p) {
     return fract(sin(dot(p, vec2(12.9898, 78.233))) * 43758.5453);
@@ -23,7 +42,7 @@ float noise(vec2 p) {
 float fbm(vec2 p) {
     float value = 0.0;
     float amplitude = 0.5;
-    for (int i = 0; i < 6; i++) {
+    for (int i = 0; i < FBM_OCTAVES; i++) {
         value += amplitude * noise(p);
         p *= 2.0;
         amplitude *= 0.5;
@@ -60,7 +79,7 @@ void main() {
     if (heightNormalized < 0.2) {
         terrainColor = waterColor;
         // Add water movement
-        terrainColor += vec3(0.0, 0.1, 0.2) * sin(u_time * 3.0 + terrainCoord.x);
+        terrainColor += vec3(0.0, 0.1, 0.2) * sin(u_time * 3.0 + terrainCoord.x) * (1.0 + u_envelope);
     } else if (heightNormalized < 0.3) {
         terrainColor = mix(waterColor, sandColor, (heightNormalized - 0.2) * 10.0);
     } else if (heightNormalized < 0.6) {
@@ -108,7 +127,7 @@ void main() {
     }
     
     // Audio reactive elements
-    terrainColor *= (1.0 + u_audio * 0.3);
+    terrainColor *= (1.0 + u_audio * 0.3 + u_onset * 0.2);
     
     // Add subtle fractal overlay for complexity
     float fractal = fbm(st * 16.0) * 0.1;
@@ -6,6 +6,31 @@ uniform vec2 u_resolution;
 uniform float u_time;
 uniform float u_audio;
 
+// Audio features: u_spectrum holds 16 log-spaced bands (x = 0 low .. 1 high)
+uniform sampler2D u_spectrum;
+uniform float u_rms;
+uniform float u_flux;
+uniform float u_onset;
+uniform float u_envelope;
+
+// Quality tier, injected by the shader loader: 0 low, 1 medium, 2 high
+#ifndef QUALITY
+#define QUALITY 2
+#endif
+#if QUALITY == 0
+#define STARS 60
+#define FBM_OCTAVES 2
+#define CITIES 8
+#elif QUALITY == 1
+#define STARS 120
+#define FBM_OCTAVES 3
+#define CITIES 12
+#else
+#define STARS 200
+#define FBM_OCTAVES 4
+#define CITIES 20
+#endif
+
 float rand(vec2 n) {
     return fract(sin(dot(n, vec2(12.9898, 4.1414))) * 43758.5453);
 }
@@ -22,7 +47,7 @@ float noise(vec2 p) {
 float fbm(vec2 p) {
     float value = 0.0;
     float amplitude = 0.5;
-    for (int i = 0; i < 4; i++) {
+    for (int i = 0; i < FBM_OCTAVES; i++) {
         value += amplitude * noise(p);
         p *= 2.0;
         amplitude *= 0.5;
@@ -37,7 +62,7 @@ void main() {
     vec3 color = vec3(0.0);
 
     // Enhanced starfield with different star types
-    for (int i = 0; i < 200; i++) {
+    for (int i = 0; i < STARS; i++) {
         float i_float = float(i);
         vec2 star_pos = vec2(rand(vec2(i_float)), rand(vec2(i_float * 2.0)));
         float d = distance(st, star_pos);
@@ -82,7 +107,7 @@ void main() {
         float dayNight = dot(normalize(surfaceCoord), vec2(cos(u_time * 0.5), sin(u_time * 0.5)));
         if (dayNight < 0.0) {
             float cityLights = 0.0;
-            for (int c = 0; c < 20; c++) {
+            for (int c = 0; c < CITIES; c++) {
                 vec2 cityPos = vec2(rand(vec2(float(c) * 7.0)), rand(vec2(float(c) * 11.0))) * 2.0 - 1.0;
                 float cityDist = distance(surfaceCoord, cityPos);
                 cityLights += 0.01 / (cityDist + 0.01);
@@ -116,7 +141,8 @@ void main() {
         // Orbital rings/traffic lanes
         float ringDist = abs(distance(st, planetCenter) - orbitRadius);
         if (ringDist < 0.002) {
-            color += vec3(0.2, 0.4, 0.8) * 0.1 * (1.0 + sin(u_time * 2.0 + float(orbit)) * 0.5);
+            float band = texture(u_spectrum, vec2(float(orbit) / 6.0, 0.5)).r;
+            color += vec3(0.2, 0.4, 0.8) * 0.1 * (1.0 + sin(u_time * 2.0 + float(orbit)) * 0.5 + band);
         }
     }
     
@@ -150,7 +176,7 @@ void main() {
     color = mix(nebulaColor, color, 0.8);
     
     // Audio reactive pulsing
-    float pulse = 1.0 + u_audio * 0.5;
+    float pulse = 1.0 + u_audio * 0.5 + u_envelope * 0.3;
     color *= pulse;
     
     // Add some lens flares from the central star
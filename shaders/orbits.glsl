@@ -6,6 +6,13 @@ uniform vec2 u_resolution;
 uniform float u_time;
 uniform float u_audio;
 
+// Audio features: u_spectrum holds 16 log-spaced bands (x = 0 low .. 1 high)
+uniform sampler2D u_spectrum;
+uniform float u_rms;
+uniform float u_flux;
+uniform float u_onset;
+uniform float u_envelope;
+
 void main() {
     vec2 st = v_coord * 2.0 - 1.0;
     st.x *= u_resolution.x / u_resolution.y;
@@ -14,7 +21,8 @@ void main() {
 
     // Sun
     float d = distance(st, vec2(0.0));
-    color += vec3(0.9, 0.6, 0.1) * (0.01 / d);
+    float bass = texture(u_spectrum, vec2(0.1, 0.5)).r;
+    color += vec3(0.9, 0.6, 0.1) * ((0.01 + bass * 0.01) / d);
 
     // Planet
     vec2 planet_pos = vec2(sin(u_time * 0.5) * 0.6, cos(u_time * 0.5) * 0.6);
@@ -27,7 +35,7 @@ void main() {
     color += vec3(0.7) * (0.002 / d);
 
     // Audio reactivity
-    color *= (1.0 + u_audio * 0.5);
+    color *= (1.0 + u_audio * 0.5 + u_onset * 0.3);
 
     FragColor = vec4(color, 1.0);
 }
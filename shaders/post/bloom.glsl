@@ -0,0 +1,14 @@
+#version 330 core
+
+// Adds the blurred highlights from bloom_extract back onto the frame
+uniform sampler2D u_frame;
+uniform sampler2D u_bright;
+uniform float u_strength;
+
+in vec2 v_coord;
+out vec4 fragColor;
+
+void main() {
+    vec3 glow = texture(u_bright, v_coord).rgb * u_strength;
+    fragColor = vec4(texture(u_frame, v_coord).rgb + glow, 1.0);
+}
@@ -0,0 +1,23 @@
+#version 330 core
+
+// The parts of the frame brighter than u_threshold, blurred; runs at reduced resolution
+uniform sampler2D u_frame;
+uniform float u_threshold;
+
+in vec2 v_coord;
+out vec4 fragColor;
+
+void main() {
+    vec2 texel = 1.0 / vec2(textureSize(u_frame, 0));
+    vec3 sum = vec3(0.0);
+    float total = 0.0;
+    for (int x = -2; x <= 2; x++) {
+        for (int y = -2; y <= 2; y++) {
+            float weight = exp(-float(x * x + y * y) / 4.0);
+            vec3 color = texture(u_frame, v_coord + vec2(x, y) * texel * 2.0).rgb;
+            sum += max(color - u_threshold, 0.0) * weight;
+            total += weight;
+        }
+    }
+    fragColor = vec4(sum / total, 1.0);
+}
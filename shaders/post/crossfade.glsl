@@ -0,0 +1,14 @@
+#version 330 core
+
+// Blends the outgoing scene into the incoming one while the scene changes
+uniform sampler2D u_from;
+uniform sampler2D u_to;
+uniform float u_mix;
+
+in vec2 v_coord;
+out vec4 fragColor;
+
+void main() {
+    float t = smoothstep(0.0, 1.0, u_mix);
+    fragColor = vec4(mix(texture(u_from, v_coord).rgb, texture(u_to, v_coord).rgb, t), 1.0);
+}
@@ -0,0 +1,15 @@
+#version 330 core
+
+// Motion trails: the previous output fades by u_decay and the new frame is laid over it
+uniform sampler2D u_frame;
+uniform sampler2D u_previous;
+uniform float u_decay;
+
+in vec2 v_coord;
+out vec4 fragColor;
+
+void main() {
+    vec3 current = texture(u_frame, v_coord).rgb;
+    vec3 previous = texture(u_previous, v_coord).rgb * u_decay;
+    fragColor = vec4(max(current, previous), 1.0);
+}
@@ -0,0 +1,15 @@
+#version 330 core
+
+// Round soft sprite, brightest in the middle; blended additively
+in vec2 v_offset;
+in vec3 v_color;
+out vec4 fragColor;
+
+void main() {
+    float d = length(v_offset);
+    if (d >= 1.0) {
+        discard;
+    }
+    float falloff = 1.0 - d;
+    fragColor = vec4(v_color * falloff * falloff, 1.0);
+}
@@ -0,0 +1,42 @@
+#version 330 core
+
+// One quad per particle instance, placed in the same zoomed space the particles scene uses
+in vec2 in_corner;
+in vec2 in_center;
+in float in_age;
+in float in_life;
+in float in_size;
+in float in_seed;
+
+uniform vec2 u_resolution;
+uniform float u_time;
+uniform float u_envelope;
+uniform float u_zoom = 1.0;
+uniform float u_brightness = 1.0;
+uniform float u_color_r = 1.0;
+uniform float u_color_g = 0.8;
+uniform float u_color_b = 0.2;
+uniform vec4 u_tile = vec4(0.0, 0.0, 1.0, 1.0);
+
+out vec2 v_offset;
+out vec3 v_color;
+
+void main() {
+    float aspect = u_resolution.x / u_resolution.y;
+    float size = in_size * (1.0 + u_envelope);
+    vec2 st = vec2(in_center.x * aspect, in_center.y) + in_corner * size;
+
+    // Inverse of the scene's st = (coord * aspect - 0.5) * zoom + 0.5
+    vec2 coord = (st - 0.5) / u_zoom + 0.5;
+    coord.x /= aspect;
+    coord = (coord - u_tile.xy) / u_tile.zw;
+    gl_Position = vec4(coord * 2.0 - 1.0, 0.0, 1.0);
+    v_offset = in_corner;
+
+    // Fade in and out over the particle's life, colour varied per particle
+    float t = in_age / in_life;
+    float fade = smoothstep(0.0, 0.1, t) * (1.0 - smoothstep(0.7, 1.0, t));
+    vec3 color = vec3(u_color_r, u_color_g, u_color_b);
+    color += vec3(sin(in_seed), cos(in_seed * 1.5), sin(in_seed * 2.0 + u_time)) * 0.3;
+    v_color = max(color, 0.0) * fade * u_brightness;
+}
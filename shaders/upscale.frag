@@ -0,0 +1,11 @@
+#version 330 core
+
+// Stretches the scene, rendered at a reduced internal resolution, over the window
+uniform sampler2D u_frame;
+
+in vec2 v_coord;
+out vec4 fragColor;
+
+void main() {
+    fragColor = vec4(texture(u_frame, v_coord).rgb, 1.0);
+}
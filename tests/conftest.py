@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python'))
+
+
+@pytest.fixture
+def ctx():
+    """A standalone GL 3.3 context, or a skip on machines without any GL driver"""
+    from program_pool import create_standalone_context
+    try:
+        context = create_standalone_context()
+    except Exception as e:
+        pytest.skip(f"No standalone GL context: {e}")
+    yield context
+    context.release()
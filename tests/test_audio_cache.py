@@ -0,0 +1,51 @@
+import os
+import wave
+
+import numpy as np
+
+from audio_cache import build, file_hash, known_hash, open_cached
+
+RATE = 8000
+
+
+def write_wav(path, seconds=1.0, seed=0):
+    samples = np.random.default_rng(seed).integers(-20000, 20000, int(RATE * seconds), dtype=np.int16)
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        f.writeframes(samples.tobytes())
+    return str(path)
+
+
+def test_the_hash_is_remembered_until_the_file_changes(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    path = write_wav(tmp_path / 'a.wav')
+    assert known_hash(path, cache_dir) is None
+    digest = file_hash(path, cache_dir)
+    assert known_hash(path, cache_dir) == digest
+    write_wav(path, seed=1)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert known_hash(path, cache_dir) is None
+
+
+def test_without_read_file_only_a_known_hash_finds_the_table(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    path = write_wav(tmp_path / 'a.wav')
+    build(path, cache_dir=cache_dir)
+    os.remove(os.path.join(cache_dir, 'hashes.json'))
+    assert open_cached(path, cache_dir=cache_dir, read_file=False) is None
+    cached = open_cached(path, cache_dir=cache_dir)
+    assert cached is not None
+    again = open_cached(path, cache_dir=cache_dir, read_file=False)
+    assert again is not None and again.path == cached.path
+
+
+def test_start_picks_up_partway_through_the_track(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    path = write_wav(tmp_path / 'a.wav')
+    cached = open_cached(path, build_missing=True, cache_dir=cache_dir)
+    expected = cached.advance_to(0.5).seq
+    cached.start(0.5)
+    assert abs(cached.get_snapshot().seq - expected) <= 1
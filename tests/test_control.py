@@ -0,0 +1,258 @@
+import json
+import socket
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from control import CommandQueue, Control, MidiMapper
+from parameters import ParameterStore
+
+
+def test_param_writes_coalesce_to_the_last_value():
+    queue = CommandQueue()
+    queue.set_param('color_r', 0.1)
+    queue.set_param('color_r', 0.2)
+    queue.set_param('color_g', 0.3)
+    commands, params = queue.drain()
+    assert commands == []
+    assert params == {'color_r': 0.2, 'color_g': 0.3}
+    assert queue.stats() == {'received': 3, 'coalesced': 1, 'dropped': 0}
+
+
+def test_commands_keep_their_order_next_to_params():
+    queue = CommandQueue()
+    queue.push('scene', 2)
+    queue.set_param('color_r', 0.5)
+    queue.push('scene', 4)
+    commands, params = queue.drain()
+    assert commands == [('scene', 2), ('scene', 4)]
+    assert params == {'color_r': 0.5}
+
+
+def test_drain_empties_the_queue():
+    queue = CommandQueue()
+    queue.push('scene', 1)
+    queue.drain()
+    commands, params = queue.drain()
+    assert not commands and not params
+
+
+def test_commands_are_bounded_but_params_are_not():
+    queue = CommandQueue(capacity=2)
+    for i in range(3):
+        queue.push('scene', i)
+    queue.set_param('color_r', 1.0)
+    commands, params = queue.drain()
+    assert commands == [('scene', 0), ('scene', 1)]
+    assert params == {'color_r': 1.0}
+    assert queue.stats()['dropped'] == 1
+    # Draining makes room again
+    queue.push('scene', 5)
+    assert queue.drain()[0] == [('scene', 5)]
+
+
+def test_a_batch_that_does_not_fit_is_dropped_whole():
+    queue = CommandQueue(capacity=3)
+    queue.push('scene', 0)
+    queue.push('scene', 1)
+    with queue.batch():
+        queue.push('scene', 2)
+        queue.push('scene', 3)
+        queue.set_param('color_r', 1.0)
+    commands, params = queue.drain()
+    assert commands == [('scene', 0), ('scene', 1)]
+    assert params == {}
+    assert queue.stats()['dropped'] == 3
+
+
+def test_a_batch_lands_in_one_drain():
+    queue = CommandQueue()
+    seen = []
+    with queue.batch():
+        queue.set_param('color_r', 0.1)
+        with queue.batch():
+            queue.push('scene', 1)
+        # Another thread draining mid-batch sees none of it
+        drainer = threading.Thread(target=lambda: seen.append(queue.drain()))
+        drainer.start()
+        drainer.join()
+        queue.set_param('color_g', 0.2)
+    assert seen == [((), {})]
+    assert queue.drain() == ([('scene', 1)], {'color_r': 0.1, 'color_g': 0.2})
+
+
+def test_concurrent_writers_lose_nothing_below_capacity():
+    queue = CommandQueue(capacity=10000)
+
+    def write(n):
+        for i in range(1000):
+            queue.push('tick', n, i)
+
+    writers = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    commands, _ = queue.drain()
+    assert len(commands) == 4000
+    for n in range(4):
+        assert [c[2] for c in commands if c[1] == n] == list(range(1000))
+
+
+def cc(control, value, channel=0):
+    return SimpleNamespace(type='control_change', channel=channel, control=control, value=value)
+
+
+def note(number, velocity, channel=0, on=True):
+    return SimpleNamespace(type='note_on' if on else 'note_off', channel=channel, note=number, velocity=velocity)
+
+
+def mapper(path=None):
+    return MidiMapper(ParameterStore(), CommandQueue(), path)
+
+
+def params_of(midi):
+    return midi.commands.drain()[1]
+
+
+def test_cc_scales_into_the_parameter_range():
+    midi = mapper()
+    midi.add(0, 'cc', 7, 'time_scale')  # 0..5
+    assert midi.handle(cc(7, 127))
+    assert params_of(midi) == {'time_scale': 5.0}
+    midi.handle(cc(7, 0))
+    assert params_of(midi) == {'time_scale': 0.0}
+
+
+def test_unmapped_messages_and_other_channels_are_ignored():
+    midi = mapper()
+    midi.add(0, 'cc', 7, 'color_r')
+    assert not midi.handle(cc(8, 64))
+    assert not midi.handle(cc(7, 64, channel=1))
+    assert not midi.handle(SimpleNamespace(type='pitchwheel', channel=0, pitch=0))
+    assert params_of(midi) == {}
+
+
+def test_notes_map_velocity_and_note_off_to_zero():
+    midi = mapper()
+    midi.add(2, 'note', 60, 'color_g')
+    midi.handle(note(60, 127, channel=2))
+    assert params_of(midi) == {'color_g': 1.0}
+    midi.handle(note(60, 90, channel=2, on=False))
+    assert params_of(midi) == {'color_g': 0.0}
+
+
+def test_fourteen_bit_pairs_msb_with_lsb():
+    midi = mapper()
+    midi.add(0, 'cc', 1, 'color_r', fourteen_bit=True)
+    # The MSB alone gives the coarse value, with the fine part at zero
+    midi.handle(cc(1, 64))
+    assert params_of(midi) == pytest.approx({'color_r': (64 << 7) / 16383.0})
+    midi.handle(cc(33, 127))
+    assert params_of(midi) == pytest.approx({'color_r': ((64 << 7) | 127) / 16383.0})
+    midi.handle(cc(1, 127))
+    midi.handle(cc(33, 127))
+    assert params_of(midi) == {'color_r': 1.0}
+
+
+def test_fourteen_bit_mappings_replace_what_used_their_lsb():
+    midi = mapper()
+    midi.add(0, 'cc', 33, 'color_g')
+    midi.add(0, 'cc', 1, 'color_r', fourteen_bit=True)
+    assert [m['param'] for m in midi.mappings] == ['color_r']
+    # and a plain mapping on the LSB takes it back from the pair
+    midi.add(0, 'cc', 33, 'color_b')
+    assert [m['param'] for m in midi.mappings] == ['color_b']
+    midi.handle(cc(1, 127))
+    assert params_of(midi) == {}
+
+
+def test_invalid_mappings_are_refused():
+    midi = mapper()
+    for args in ((0, 'cc', 40, 'color_r', True), (0, 'note', 1, 'color_r', True), (16, 'cc', 1, 'color_r'),
+                 (0, 'cc', 128, 'color_r'), (0, 'cc', 1, 'no_such_param')):
+        with pytest.raises(ValueError):
+            midi.add(*args)
+    assert midi.mappings == []
+
+
+def test_learn_maps_the_next_control_and_applies_it(tmp_path):
+    path = str(tmp_path / 'midi.json')
+    midi = mapper(path)
+    midi.learn('color_b', fourteen_bit=True)
+    midi.handle(cc(5, 127, channel=3))
+    assert midi.learning is None
+    assert midi.mappings == [{'channel': 3, 'type': 'cc', 'number': 5, 'param': 'color_b', '14bit': True}]
+    assert params_of(midi) == pytest.approx({'color_b': (127 << 7) / 16383.0})
+    # Learning saved the profile, which a new mapper loads
+    assert mapper(path).mappings == midi.mappings
+
+
+def test_learn_falls_back_to_seven_bit_where_there_is_no_lsb():
+    midi = mapper()
+    midi.learn('color_b', fourteen_bit=True)
+    midi.handle(cc(40, 127))
+    assert midi.mappings[0]['14bit'] is False
+    assert params_of(midi) == {'color_b': 1.0}
+
+
+def test_load_skips_bad_mappings(tmp_path):
+    path = tmp_path / 'midi.json'
+    path.write_text(json.dumps({'mappings': [
+        {'channel': 0, 'type': 'cc', 'number': 7, 'param': 'color_r'},
+        {'channel': 0, 'type': 'cc', 'number': 8, 'param': 'no_such_param'},
+        {'channel': 0, 'type': 'cc'},
+    ]}))
+    midi = mapper(str(path))
+    assert [m['param'] for m in midi.mappings] == ['color_r']
+
+
+@pytest.fixture
+def busy_port():
+    """A UDP port something else is bound to"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        yield sock.getsockname()[1]
+
+
+class FakePort:
+    def __init__(self, callback):
+        self.callback = callback
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_midi_is_served_when_the_osc_port_is_taken(busy_port, monkeypatch):
+    mido = pytest.importorskip('mido')
+    opened = []
+    monkeypatch.setattr(mido, 'open_input', lambda callback: opened.append(FakePort(callback)) or opened[-1])
+    received = threading.Event()
+    control = Control(port=busy_port)
+    control.map_midi(lambda msg: received.set())
+    control.start()
+    try:
+        assert control.transport is None
+        for _ in range(100):
+            if opened:
+                break
+            threading.Event().wait(0.02)
+        opened[0].callback(cc(1, 64))
+        assert received.wait(timeout=2.0)
+    finally:
+        control.stop()
+    assert opened[0].closed
+
+
+def test_the_loop_ends_when_neither_input_opens(busy_port, monkeypatch):
+    mido = pytest.importorskip('mido')
+
+    def no_ports(callback):
+        raise OSError("no MIDI ports")
+    monkeypatch.setattr(mido, 'open_input', no_ports)
+    control = Control(port=busy_port)
+    control.start()
+    control._thread.join(timeout=2.0)
+    assert not control._thread.is_alive()
@@ -0,0 +1,139 @@
+import os
+import subprocess
+import sys
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from frame_share import FrameRing
+from param_bus import untrack
+
+SIZE = (8, 4)
+
+
+@pytest.fixture
+def name():
+    name = f'macroverse_test_frames_{os.getpid()}_{threading.get_ident()}'
+    yield name
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    untrack(shm)
+    shm.close()
+    shm.unlink()
+
+
+@pytest.fixture
+def rings(name):
+    """(writer, reader) ends of one ring"""
+    writer = FrameRing.create(name, SIZE, slots=4)
+    reader = FrameRing.attach(name)
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+
+def publish(ring, index, size=SIZE):
+    """A frame whose every byte is its index, except the bottom row (first in GL order), which is 255"""
+    out = ring.acquire(size)
+    out[:] = index
+    out[:size[0] * ring.components] = 255
+    ring.submit(index, timestamp=100.0 + index)
+
+
+def test_latest_is_the_newest_frame_top_down(rings):
+    writer, reader = rings
+    assert reader.latest() is None
+    for i in range(3):
+        publish(writer, i)
+    frame = reader.latest()
+    assert (frame.number, frame.index, frame.timestamp) == (2, 2, 102.0)
+    assert frame.image.shape == (SIZE[1], SIZE[0], 3)
+    assert (frame.image[:-1] == 2).all() and (frame.image[-1] == 255).all()
+    assert reader.intact(frame)
+
+
+def test_frames_smaller_than_the_ring_keep_their_size(rings):
+    writer, reader = rings
+    publish(writer, 0, (4, 2))
+    assert reader.latest().image.shape == (2, 4, 3)
+    with pytest.raises(ValueError):
+        writer.acquire((SIZE[0] + 1, SIZE[1]))
+
+
+def test_next_walks_frames_in_order(rings):
+    writer, reader = rings
+    for i in range(3):
+        publish(writer, i)
+    numbers = []
+    frame = reader.next(timeout=0)
+    while frame is not None:
+        numbers.append(frame.number)
+        frame = reader.next(frame.number, timeout=0)
+    assert numbers == [0, 1, 2]
+
+
+def test_a_slow_reader_skips_to_frames_still_in_the_ring(rings):
+    writer, reader = rings
+    for i in range(10):
+        publish(writer, i)
+    # Frame 6 shares its slot with the frame written next, so the oldest readable one is 7
+    frame = reader.next(after=0, timeout=0)
+    assert frame.number == 7 and frame.index == 7
+
+
+def test_a_slot_being_written_is_not_read(rings):
+    writer, reader = rings
+    for i in range(4):
+        publish(writer, i)
+    writer.acquire()  # frame 4 goes in frame 0's slot
+    assert reader._read(0) is None
+    writer.release()
+    # Released without publishing: nothing new, and frame 0's pixels may have changed
+    assert reader.published == 4
+    assert reader._read(0) is not None
+
+
+def test_intact_turns_false_once_the_writer_reuses_the_slot(rings):
+    writer, reader = rings
+    publish(writer, 0)
+    frame = reader.latest()
+    for i in range(1, writer.slots):
+        publish(writer, i)
+    assert reader.intact(frame)
+    writer.acquire()
+    assert not reader.intact(frame)
+    writer.release()
+    assert not reader.intact(frame)
+
+
+def test_a_ring_left_by_a_dead_writer_is_replaced(name):
+    stale = FrameRing.create(name, SIZE)
+    dead = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True)
+    stale.header['writer_pid'] = int(dead.stdout)
+    stale.owner = False
+    stale.close()
+    ring = FrameRing.create(name, (16, 8))
+    assert ring.max_size == (16, 8)
+    ring.close()
+
+
+def test_a_ring_with_a_live_writer_is_not_replaced(name):
+    ring = FrameRing.create(name, SIZE)
+    ring.header['writer_pid'] = os.getppid()
+    try:
+        with pytest.raises(FileExistsError):
+            FrameRing.create(name, SIZE)
+    finally:
+        ring.close()
+
+
+def test_other_shared_memory_is_refused(name):
+    shm = shared_memory.SharedMemory(name=name, create=True, size=4096)
+    untrack(shm)
+    shm.close()
+    with pytest.raises(ValueError):
+        FrameRing.attach(name)
@@ -0,0 +1,110 @@
+import os
+import threading
+from multiprocessing import shared_memory
+
+import pytest
+
+from param_bus import SCENE_NAME_BYTES, ParamBus, untrack
+from parameters import PARAMS
+
+
+@pytest.fixture
+def name():
+    name = f'macroverse_test_{os.getpid()}_{threading.get_ident()}'
+    yield name
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    untrack(shm)
+    shm.close()
+    shm.unlink()
+
+
+@pytest.fixture
+def buses(name):
+    """(renderer, control) ends of one bus"""
+    renderer = ParamBus.open(name, owner=True)
+    control = ParamBus.open(name)
+    yield renderer, control
+    control.close()
+    renderer.close()
+
+
+def test_poll_returns_only_what_was_written_since_the_last_poll(buses):
+    renderer, control = buses
+    assert renderer.poll() == ({}, None)
+    control.update({'color_r': 0.25, 'color_g': 0.5, 'no_such_param': 1.0})
+    assert renderer.poll() == ({'color_r': 0.25, 'color_g': 0.5}, None)
+    assert renderer.poll() == ({}, None)
+    # Writing the same value again still counts as a change
+    control.set('color_r', 0.25)
+    assert renderer.poll() == ({'color_r': 0.25}, None)
+
+
+def test_new_buses_start_at_the_defaults(buses):
+    renderer, _ = buses
+    assert list(renderer.values) == pytest.approx([p.default for p in PARAMS])
+
+
+def test_scene_requests_are_seen_once(buses):
+    renderer, control = buses
+    control.set_scene('orbits.glsl')
+    assert renderer.poll() == ({}, 'orbits.glsl')
+    assert renderer.poll() == ({}, None)
+    control.set_scene('x' * (SCENE_NAME_BYTES + 10))
+    assert renderer.poll() == ({}, 'x' * SCENE_NAME_BYTES)
+    control.set_scene('life.glsl')
+    assert renderer.poll() == ({}, 'life.glsl')
+
+
+def test_a_write_in_progress_is_not_read(buses):
+    renderer, control = buses
+    control.set('color_r', 0.75)
+    renderer.seq[0] += 1  # as if a writer were between its two increments
+    assert renderer.poll(retries=3) == ({}, None)
+    renderer.seq[0] += 1
+    # Nothing was consumed by the refused read
+    assert renderer.poll() == ({'color_r': 0.75}, None)
+
+
+class WriteDuringRead:
+    """Stands in for the reader's view of the change counters and runs a write the first time it is read"""
+
+    def __init__(self, counters, write):
+        self.counters = counters
+        self.write = write
+
+    def __array__(self, dtype=None, copy=None):
+        if self.write:
+            self.write, write = None, self.write
+            write()
+        return self.counters
+
+
+def test_a_read_overlapping_a_write_is_retried(buses):
+    renderer, control = buses
+    control.update({'color_r': 0.1, 'color_g': 0.1})
+    renderer.counters = WriteDuringRead(renderer.counters, lambda: control.update({'color_r': 0.9, 'color_g': 0.9}))
+    # The values were copied before the write and the counters after it; the seqlock catches that
+    assert renderer.poll() == ({'color_r': pytest.approx(0.9), 'color_g': pytest.approx(0.9)}, None)
+    renderer.counters = renderer.counters.counters
+
+
+def test_mismatched_layouts_refuse_to_attach(name):
+    renderer = ParamBus.create(name)
+    try:
+        with pytest.raises(ValueError):
+            ParamBus.attach(name, PARAMS[:-1])
+    finally:
+        renderer.close()
+
+
+def test_only_the_owner_removes_the_bus(name):
+    renderer = ParamBus.open(name, owner=True)
+    ParamBus.open(name).close()
+    control = ParamBus.attach(name)
+    control.close()
+    renderer.close()
+    with pytest.raises(FileNotFoundError):
+        ParamBus.attach(name)
@@ -0,0 +1,50 @@
+import pytest
+
+from program_pool import QUALITY_TIERS, ProgramPool, list_scenes
+from quality import QualitySelector
+
+SIZE = (32, 18)
+
+
+@pytest.fixture
+def pool(ctx):
+    programs = ProgramPool(ctx, capacity=4)
+    programs.load_sources(sorted(list_scenes()))
+    yield programs
+    programs.release()
+
+
+def fill(pool, skip):
+    """Compile every other scene at every tier, far more than the pool holds"""
+    for name in sorted(pool.sources):
+        if name == skip:
+            continue
+        for tier in QUALITY_TIERS if pool.sources[name].has_tiers else (None,):
+            pool.get(name, tier)
+
+
+def test_eviction_keeps_pinned_programs(pool):
+    active = pool.get('orbits.glsl')
+    pool.pin([active.key])
+    fill(pool, 'orbits.glsl')
+    assert active.key in pool.programs
+    assert len(pool.programs) == pool.capacity
+    active.render()
+
+
+def test_measuring_the_active_scene_in_a_full_pool(ctx, pool):
+    pool.set_quality('life.glsl', 'low')
+    active = pool.get('life.glsl')
+    pool.pin([active.key])
+    fill(pool, 'life.glsl')
+    held = list(pool.programs)
+
+    selector = QualitySelector(ctx, pool, budget_ms=1000.0, frames=2)
+    try:
+        tier, timings = selector.select('life.glsl', SIZE, lambda scene, size: None)
+    finally:
+        selector.release()
+    assert tier in QUALITY_TIERS and set(timings) <= set(QUALITY_TIERS)
+    # Measuring compiled the other tiers outside the pool and left it as it was
+    assert list(pool.programs) == held
+    active.render()
@@ -0,0 +1,28 @@
+import sys
+
+import pytest
+
+mglw = pytest.importorskip('moderngl_window')
+
+
+@pytest.fixture
+def window():
+    """A headless window, or a skip on machines without any GL 3.3 driver"""
+    cls = mglw.get_local_window_cls('headless')
+    try:
+        wnd = cls(size=(64, 36), gl_version=(3, 3), backend='egl' if sys.platform.startswith('linux') else None)
+    except Exception as e:
+        pytest.skip(f"No headless GL context: {e}")
+    mglw.activate_context(window=wnd)
+    yield wnd
+    wnd.destroy()
+
+
+def test_scene_player_renders_a_frame(window):
+    from scene_player import ScenePlayer
+    player = ScenePlayer(ctx=window.ctx, wnd=window)
+    try:
+        player.render(0.0, 1 / 60)
+        assert player.scene.program is not None
+    finally:
+        player.audio_processor.stop()
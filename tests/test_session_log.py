@@ -0,0 +1,45 @@
+import numpy as np
+
+from audio_features import AudioFeatures
+from audio_processing import AudioSnapshot
+from session_log import COMMANDS, KEY, SessionRecorder, SessionReplay
+
+AUDIO = {'chunk_size': 1024, 'rate': 44100}
+
+
+def record(path, *inputs):
+    """A one-frame session of (kind, value) inputs"""
+    recorder = SessionRecorder(str(path), {'audio': AUDIO})
+    for kind, value in inputs:
+        recorder.record_json(kind, value)
+    snapshot = AudioSnapshot(AUDIO['chunk_size'], AudioFeatures(AUDIO['chunk_size'], AUDIO['rate']).n_bands)
+    snapshot.level = 0.5
+    recorder.record_frame(1.25, 0.016, snapshot)
+    recorder.close()
+    return SessionReplay(str(path), realtime=False)
+
+
+def test_commands_replay_as_recorded(tmp_path):
+    batch = {'commands': [['scene', 2], ['lfo', 'color_r', 0.5, 2.0, 'sine']], 'params': {'color_g': 0.25}}
+    replay = record(tmp_path / 'a.mvlog', (KEY, ['scene', 1]), (COMMANDS, batch))
+    inputs, clock, frametime = replay.next_frame()
+    assert inputs == [(KEY, ['scene', 1]), (COMMANDS, batch)]
+    assert (clock, frametime) == (1.25, 0.016)
+    assert replay.audio.get_snapshot().level == 0.5
+    assert replay.next_frame() is None
+
+
+def test_osc_arguments_without_a_json_type_are_recorded(tmp_path):
+    batch = {'commands': [('blob', b'\x00\xff', bytearray(b'mv'), np.float32(0.5), np.int64(3), (1, 144, 60, 127),
+                           object)],
+             'params': {}}
+    replay = record(tmp_path / 'a.mvlog', (COMMANDS, batch))
+    (kind, value), = replay.next_frame()[0]
+    assert value['commands'] == [['blob', b'\x00\xff', b'mv', 0.5, 3, [1, 144, 60, 127], repr(object)]]
+
+
+def test_what_cannot_be_recorded_is_skipped(tmp_path):
+    loop = []
+    loop.append(loop)
+    replay = record(tmp_path / 'a.mvlog', (KEY, loop), (KEY, ['scene', 1]))
+    assert replay.next_frame()[0] == [(KEY, ['scene', 1])]
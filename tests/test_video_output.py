@@ -0,0 +1,136 @@
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from video_output import PngStreamWriter, Y4mWriter, flip_rows, y4m_header
+
+
+def read_chunks(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    chunks, at = [], 8
+    while at < len(data):
+        length, = struct.unpack_from('>I', data, at)
+        kind = data[at + 4:at + 8]
+        body = data[at + 8:at + 8 + length]
+        crc, = struct.unpack_from('>I', data, at + 8 + length)
+        assert crc == zlib.crc32(kind + body), kind
+        chunks.append((kind, body))
+        at += 12 + length
+    return chunks
+
+
+def random_image(size, components=3, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (size[1], size[0], components), dtype=np.uint8)
+
+
+@pytest.mark.parametrize('components', [1, 3, 4])
+def test_png_written_in_bands_decodes_to_the_rows(tmp_path, components):
+    size = (37, 23)
+    image = random_image(size, components)
+    path = str(tmp_path / 'out.png')
+    writer = PngStreamWriter(path, size, dpi=300, compress_level=1, components=components)
+    for top in range(0, size[1], 5):
+        writer.write_rows(image[top:top + 5])
+    writer.close()
+    chunks = read_chunks(path)
+    kinds = [kind for kind, _ in chunks]
+    assert kinds[:2] == [b'IHDR', b'pHYs'] and kinds[-1] == b'IEND'
+    assert set(kinds[2:-1]) == {b'IDAT'}
+    color_type = {1: 0, 3: 2, 4: 6}[components]
+    assert chunks[0][1] == struct.pack('>IIBBBBB', size[0], size[1], 8, color_type, 0, 0, 0)
+    assert chunks[1][1] == struct.pack('>IIB', 11811, 11811, 1)
+    raw = zlib.decompress(b''.join(body for kind, body in chunks if kind == b'IDAT'))
+    lines = np.frombuffer(raw, dtype=np.uint8).reshape(size[1], size[0] * components + 1)
+    assert (lines[:, 0] == 0).all()
+    assert (lines[:, 1:] == image.reshape(size[1], -1)).all()
+
+
+def test_png_matches_pillow(tmp_path):
+    Image = pytest.importorskip('PIL.Image')
+    size = (16, 9)
+    image = random_image(size)
+    path = str(tmp_path / 'out.png')
+    writer = PngStreamWriter(path, size)
+    writer.write_rows(image)
+    writer.close()
+    with Image.open(path) as decoded:
+        assert (np.asarray(decoded) == image).all()
+
+
+def test_png_only_appears_once_complete(tmp_path):
+    size = (4, 4)
+    path = tmp_path / 'out.png'
+    writer = PngStreamWriter(str(path), size)
+    writer.write_rows(random_image((4, 2)))
+    assert not path.exists() and (tmp_path / 'out.png.part').exists()
+    with pytest.raises(ValueError):
+        writer.write_rows(random_image((4, 3)))
+    with pytest.raises(ValueError):
+        writer.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_png_discard_removes_the_partial_file(tmp_path):
+    writer = PngStreamWriter(str(tmp_path / 'out.png'), (4, 4))
+    writer.write_rows(random_image((4, 4)))
+    writer.discard()
+    writer.discard()
+    writer.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_flip_rows_turns_a_gl_readback_top_down():
+    size = (3, 2)
+    data = np.arange(size[0] * size[1] * 3, dtype=np.uint8)
+    image = flip_rows(data, size)
+    assert image.shape == (2, 3, 3)
+    assert (image[0].ravel() == data[9:]).all() and (image[1].ravel() == data[:9]).all()
+
+
+def read_y4m(path, size):
+    w, h = size
+    with open(path, 'rb') as f:
+        header = f.readline()
+        frames = []
+        while f.readline() == b'FRAME\n':
+            frames.append(np.frombuffer(f.read(3 * w * h), dtype=np.uint8).reshape(3, h, w))
+        assert f.read() == b''
+    return header, frames
+
+
+def test_y4m_stream_layout(tmp_path):
+    size = (6, 4)
+    path = str(tmp_path / 'out.y4m')
+    writer = Y4mWriter(path, size, 29.97)
+    for i in range(3):
+        writer.write(i, random_image(size, seed=i))
+    writer.close()
+    header, frames = read_y4m(path, size)
+    assert header == y4m_header(size, 29.97) == b'YUV4MPEG2 W6 H4 F29970:1000 Ip A1:1 C444\n'
+    assert len(frames) == 3
+
+
+def test_y4m_colours_follow_bt601_full_range(tmp_path):
+    size = (32, 16)
+    image = random_image(size)
+    image[0, :4] = [(0, 0, 0), (255, 255, 255), (255, 0, 0), (0, 0, 255)]
+    path = str(tmp_path / 'out.y4m')
+    writer = Y4mWriter(path, size, 30)
+    writer.write(0, image)
+    writer.close()
+    _, (planes,) = read_y4m(path, size)
+    r, g, b = (image[:, :, c].astype(np.float64) for c in range(3))
+    expected = np.stack([
+        0.299 * r + 0.587 * g + 0.114 * b,
+        128 - 0.168736 * r - 0.331264 * g + 0.5 * b,
+        128 + 0.5 * r - 0.418688 * g - 0.081312 * b,
+    ])
+    assert np.abs(planes - np.clip(expected, 0, 255)).max() <= 1
+    assert planes[:, 0, 0].tolist() == [0, 128, 128]
+    assert planes[:, 0, 1].tolist() == [255, 128, 128]
+    # Pure red and blue reach the edge of the chroma range
+    assert planes[2, 0, 2] == 255 and planes[1, 0, 3] == 255